@@ -0,0 +1,77 @@
+"""
+Асинхронный HTTP-транспорт AutoGRAPH API (httpx)
+
+Используется ASGI-представлениями: один httpx.AsyncClient с пулом
+соединений на event loop воркера.
+"""
+import asyncio
+import logging
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from django.conf import settings
+
+from .transport import endpoint_timeouts
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAutoGraphTransport:
+    """Асинхронный HTTP-транспорт с пулом соединений к AutoGRAPH"""
+
+    def __init__(self):
+        base_url = getattr(settings, 'AUTOGRAPH_API_BASE_URL', 'https://web.tk-ekat.ru').rstrip('/')
+        self.service_url = f"{base_url}/ServiceJSON"
+
+        self.connect_timeout = getattr(settings, 'AUTOGRAPH_API_CONNECT_TIMEOUT', 5)
+        self.default_timeout = getattr(settings, 'AUTOGRAPH_API_TIMEOUT', 30)
+        self.timeouts = endpoint_timeouts()
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'AUTOGRAPH_ASYNC_MAX_CONNECTIONS', 100),
+                max_keepalive_connections=getattr(settings, 'AUTOGRAPH_POOL_MAXSIZE', 20)
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=getattr(settings, 'AUTOGRAPH_API_RETRIES', 2)),
+            headers={
+                'Accept': 'application/json',
+                'User-Agent': 'MonitoringApp/2.0'
+            },
+            verify=getattr(settings, 'AUTOGRAPH_API_VERIFY_SSL', False)
+        )
+
+    def url(self, endpoint: str) -> str:
+        """Полный URL метода ServiceJSON"""
+        return f"{self.service_url}/{endpoint}"
+
+    def timeout(self, endpoint: str) -> httpx.Timeout:
+        """Таймаут для метода"""
+        return httpx.Timeout(self.timeouts.get(endpoint, self.default_timeout), connect=self.connect_timeout)
+
+    async def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None, timeout=None) -> httpx.Response:
+        """GET-запрос к методу ServiceJSON"""
+        return await self.client.get(self.url(endpoint), params=params, timeout=timeout or self.timeout(endpoint))
+
+    def stream(self, endpoint: str, params: Optional[Dict[str, Any]] = None, timeout=None):
+        """Потоковый GET-запрос (async with): тело читается по мере получения"""
+        return self.client.stream('GET', self.url(endpoint), params=params, timeout=timeout or self.timeout(endpoint))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_transports = weakref.WeakKeyDictionary()
+
+
+def get_async_transport() -> AsyncAutoGraphTransport:
+    """Транспорт текущего event loop (httpx-клиент нельзя делить между циклами)"""
+    loop = asyncio.get_running_loop()
+    transport = _transports.get(loop)
+
+    if transport is None:
+        transport = AsyncAutoGraphTransport()
+        _transports[loop] = transport
+        logger.info("🔌 Async AutoGRAPH transport initialized")
+
+    return transport
@@ -0,0 +1,116 @@
+"""
+Быстрая сериализация JSON (orjson)
+
+FastJsonResponse - замена JsonResponse для API vehicles, dashboard и reports
+(FastJSONRenderer - то же для представлений DRF):
+orjson сериализует datetime/date, UUID, массивы и скаляры NumPy без
+промежуточных преобразований и на порядок быстрее json. parse_response
+разбирает тела ответов AutoGRAPH тем же парсером.
+
+Если orjson не установлен или FAST_JSON_ENABLED=False, используется json
+с DjangoJSONEncoder. Значения, которые orjson не поддерживает (Decimal,
+Promise и т.п.), отдаются DjangoJSONEncoder через default.
+"""
+import json
+import logging
+import math
+from typing import Any
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson - необязательная зависимость
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_encoder = DjangoJSONEncoder()
+
+
+def is_enabled() -> bool:
+    return orjson is not None and getattr(settings, 'FAST_JSON_ENABLED', True)
+
+
+def _default(value):
+    if hasattr(value, 'tolist'):  # скаляры и массивы NumPy нестандартных типов
+        return value.tolist()
+    return _encoder.default(value)
+
+
+def dumps(data: Any) -> bytes:
+    """JSON в байтах UTF-8; NaN и Infinity сериализуются как null"""
+    if is_enabled():
+        try:
+            return orjson.dumps(
+                data, default=_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError as e:
+            # Целые больше 64 бит и т.п. - сериализация без orjson
+            logger.debug(f"orjson: {e}, используется json")
+
+    try:
+        text = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, allow_nan=False)
+    except ValueError:
+        # NaN/Infinity: json выдал бы недопустимые токены NaN - заменяем на null, как orjson
+        text = json.dumps(_finite(data), cls=DjangoJSONEncoder, ensure_ascii=False)
+    return text.encode('utf-8')
+
+
+def _finite(value: Any) -> Any:
+    """Копия данных, в которой NaN и Infinity заменены на None"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def loads(data) -> Any:
+    """Разбор JSON из bytes/str; ValueError - некорректный JSON"""
+    if is_enabled():
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_response(response) -> Any:
+    """Тело ответа AutoGRAPH (requests или httpx) вместо response.json()"""
+    return loads(response.content)
+
+
+class FastJsonResponse(JsonResponse):
+    """JsonResponse с сериализацией через dumps (orjson)"""
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+
+        kwargs.setdefault('content_type', 'application/json')
+
+        if json_dumps_params or encoder is not DjangoJSONEncoder:
+            # Явные параметры json.dumps - стандартная сериализация
+            content = json.dumps(data, cls=encoder, **(json_dumps_params or {}))
+        else:
+            content = dumps(data)
+
+        HttpResponse.__init__(self, content=content, **kwargs)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer DRF с сериализацией через dumps; форматированный вывод (indent) - стандартный"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
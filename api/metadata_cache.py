@@ -0,0 +1,107 @@
+"""
+Кэш справочников AutoGRAPH (EnumSchemas / EnumDevices / EnumParameters)
+
+Ответы хранятся в настроенном Django-кэше и разделяются между всеми
+пользователями одной схемы. Инвалидация - через версию области (схемы
+или пользователя): после invalidate_* старые ключи больше не читаются
+и истекают по TTL.
+"""
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# TTL по умолчанию для справочных методов (секунды)
+DEFAULT_METADATA_TTLS = {
+    'EnumSchemas': 600,
+    'EnumDevices': 300,
+    'EnumParameters': 1800,
+}
+
+KEY_PREFIX = 'autograph:meta'
+
+
+def metadata_ttl(endpoint: str) -> int:
+    ttls = dict(DEFAULT_METADATA_TTLS)
+    ttls.update(getattr(settings, 'AUTOGRAPH_METADATA_CACHE_TTLS', {}))
+    return ttls.get(endpoint, 300)
+
+
+def schema_scope(schema_id) -> str:
+    """Область кэша схемы (общая для всех пользователей схемы)"""
+    return f"schema:{schema_id}"
+
+
+def token_scope(token: str) -> str:
+    """Область кэша пользователя (по хэшу токена, сам токен в ключ не попадает)"""
+    return f"user:{hashlib.sha1(token.encode()).hexdigest()[:16]}"
+
+
+def _version_key(scope: str) -> str:
+    return f"{KEY_PREFIX}:version:{scope}"
+
+
+def scope_version(scope: str) -> int:
+    """Текущая версия области (растет при каждой инвалидации)"""
+    return cache.get(_version_key(scope), 0)
+
+
+def _data_key(endpoint: str, scope: str, version: int, extra: str) -> str:
+    return f"{KEY_PREFIX}:{endpoint}:{scope}:v{version}:{extra}"
+
+
+def get_or_fetch(endpoint: str, scope: str, fetch: Callable[[], Any], extra: str = '') -> Optional[Any]:
+    """Ответ метода из кэша или результат fetch() (пустые ответы не кэшируются)"""
+    version = cache.get(_version_key(scope), 0)
+    key = _data_key(endpoint, scope, version, extra)
+
+    data = cache.get(key)
+    if data is not None:
+        logger.debug(f"📦 Cache hit: {endpoint} ({scope})")
+        return data
+
+    data = fetch()
+    if data:
+        cache.set(key, data, metadata_ttl(endpoint))
+
+    return data
+
+
+async def aget_or_fetch(endpoint: str, scope: str, fetch: Callable[[], Awaitable[Any]],
+                        extra: str = '') -> Optional[Any]:
+    """Асинхронная версия get_or_fetch"""
+    version = await cache.aget(_version_key(scope), 0)
+    key = _data_key(endpoint, scope, version, extra)
+
+    data = await cache.aget(key)
+    if data is not None:
+        logger.debug(f"📦 Cache hit: {endpoint} ({scope})")
+        return data
+
+    data = await fetch()
+    if data:
+        await cache.aset(key, data, metadata_ttl(endpoint))
+
+    return data
+
+
+def invalidate_scope(scope: str):
+    """Сбросить все закэшированные справочники области"""
+    key = _version_key(scope)
+    version = cache.get(key, 0) + 1
+    cache.set(key, version, None)
+    logger.info(f"🧹 Metadata cache invalidated: {scope} (v{version})")
+
+
+def invalidate_schema(schema_id):
+    """Сбросить кэш устройств и параметров схемы"""
+    invalidate_scope(schema_scope(schema_id))
+
+
+def invalidate_user(token: str):
+    """Сбросить кэш списка схем пользователя"""
+    invalidate_scope(token_scope(token))
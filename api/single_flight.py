@@ -0,0 +1,164 @@
+"""
+Объединение одинаковых одновременных запросов к AutoGRAPH (single-flight)
+
+Внутри воркера одновременные вызовы с одним ключом ждут один запрос.
+Между воркерами результат разделяется через общий Django-кэш: первый
+воркер берет блокировку (cache.add), остальные ждут его результат.
+Ответ остается в кэше на короткое окно AUTOGRAPH_COALESCE_WINDOW.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'autograph:flight'
+POLL_INTERVAL = 0.05
+
+
+def make_key(endpoint: str, schema_id, device_ids: Iterable[str], params: str = '') -> str:
+    """Ключ запроса: схема, набор устройств (без учета порядка) и параметры"""
+    ids_hash = hashlib.sha1(','.join(sorted(device_ids)).encode()).hexdigest()[:16]
+    return f"{endpoint}:{schema_id}:{ids_hash}:{params}"
+
+
+def _window() -> float:
+    return getattr(settings, 'AUTOGRAPH_COALESCE_WINDOW', 3)
+
+
+def _wait_timeout() -> float:
+    return getattr(settings, 'AUTOGRAPH_COALESCE_WAIT_TIMEOUT', 30)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов с одинаковым ключом в пределах процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._async_calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._async_calls[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._async_calls.get(key) is future:
+                del self._async_calls[key]
+
+
+_local_flight = SingleFlight()
+
+
+def coalesce(key: str, fetch: Callable[[], Any]) -> Any:
+    """Выполнить fetch() один раз на ключ для всех одновременных вызовов (потоки и воркеры)"""
+    return _local_flight.do(key, lambda: _shared_fetch(key, fetch))
+
+
+async def acoalesce(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Асинхронная версия coalesce"""
+    return await _local_flight.ado(key, lambda: _ashared_fetch(key, fetch))
+
+
+def _shared_fetch(key: str, fetch: Callable[[], Any]) -> Any:
+    result_key = f"{KEY_PREFIX}:result:{key}"
+    lock_key = f"{KEY_PREFIX}:lock:{key}"
+
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+
+    have_lock = cache.add(lock_key, 1, int(_wait_timeout()))
+    if not have_lock:
+        # Запрос уже выполняет другой воркер - ждем его результат
+        deadline = time.monotonic() + _wait_timeout()
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            result = cache.get(result_key)
+            if result is not None:
+                logger.debug(f"🔗 Coalesced upstream call: {key}")
+                return result
+            if cache.get(lock_key) is None:
+                break
+
+    try:
+        result = fetch()
+        if result:
+            cache.set(result_key, result, _window())
+        return result
+    finally:
+        if have_lock:
+            cache.delete(lock_key)
+
+
+async def _ashared_fetch(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    result_key = f"{KEY_PREFIX}:result:{key}"
+    lock_key = f"{KEY_PREFIX}:lock:{key}"
+
+    result = await cache.aget(result_key)
+    if result is not None:
+        return result
+
+    have_lock = await cache.aadd(lock_key, 1, int(_wait_timeout()))
+    if not have_lock:
+        deadline = time.monotonic() + _wait_timeout()
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            result = await cache.aget(result_key)
+            if result is not None:
+                logger.debug(f"🔗 Coalesced upstream call: {key}")
+                return result
+            if await cache.aget(lock_key) is None:
+                break
+
+    try:
+        result = await fetch()
+        if result:
+            await cache.aset(result_key, result, _window())
+        return result
+    finally:
+        if have_lock:
+            await cache.adelete(lock_key)
@@ -1,3 +1,138 @@
-from django.test import TestCase
+import email.message
+import json
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api import fastjson, metadata_cache, single_flight
+from api.transport import AutoGraphTransport
+
+
+class MetadataCacheTests(TestCase):
+    """Тесты кэша справочников AutoGRAPH"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def fetch(self):
+        self.calls += 1
+        return {'Items': [{'ID': 'dev-1'}]}
+
+    def test_second_request_served_from_cache(self):
+        """Повторный запрос справочника не обращается к AutoGRAPH"""
+        scope = metadata_cache.schema_scope('schema-1')
+        first = metadata_cache.get_or_fetch('EnumDevices', scope, self.fetch)
+        second = metadata_cache.get_or_fetch('EnumDevices', scope, self.fetch)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidate_schema_forces_refetch(self):
+        """После инвалидации схемы справочник запрашивается заново"""
+        scope = metadata_cache.schema_scope('schema-1')
+        metadata_cache.get_or_fetch('EnumDevices', scope, self.fetch)
+        metadata_cache.invalidate_schema('schema-1')
+        metadata_cache.get_or_fetch('EnumDevices', scope, self.fetch)
+
+        self.assertEqual(self.calls, 2)
+
+    def test_empty_response_not_cached(self):
+        """Пустые ответы (ошибки) не кэшируются"""
+        scope = metadata_cache.schema_scope('schema-1')
+        metadata_cache.get_or_fetch('EnumDevices', scope, lambda: None)
+        metadata_cache.get_or_fetch('EnumDevices', scope, self.fetch)
+
+        self.assertEqual(self.calls, 1)
+
+
+class SingleFlightTests(TestCase):
+    """Тесты объединения одновременных запросов"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_calls_share_one_fetch(self):
+        """Одновременные вызовы с одним ключом выполняют один запрос"""
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'Items': []}
+
+        key = single_flight.make_key('GetOnlineInfo', 'schema-1', ['b', 'a'], '*')
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight.coalesce(key, fetch)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 5)
+
+    def test_key_ignores_device_order(self):
+        """Порядок устройств не влияет на ключ"""
+        self.assertEqual(
+            single_flight.make_key('GetOnlineInfo', 's', ['a', 'b']),
+            single_flight.make_key('GetOnlineInfo', 's', ['b', 'a'])
+        )
+
+
+class FastJsonTests(TestCase):
+    """Тесты сериализации через orjson"""
+
+    data = {
+        'time': datetime(2024, 1, 1, 10, 30),
+        'series': np.array([1.5, 2.0]),
+        'count': np.int64(3),
+        'missing': float('nan'),
+        'name': 'ТС-1'
+    }
+
+    def test_response_serializes_datetime_and_numpy(self):
+        """datetime и NumPy сериализуются без преобразований, NaN - как null"""
+        response = fastjson.FastJsonResponse(self.data)
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), {
+            'time': '2024-01-01T10:30:00', 'series': [1.5, 2.0], 'count': 3, 'missing': None, 'name': 'ТС-1'
+        })
+
+        with self.assertRaises(TypeError):
+            fastjson.FastJsonResponse([1, 2])
+
+    @override_settings(FAST_JSON_ENABLED=False)
+    def test_disabled_falls_back_to_json(self):
+        """Без orjson - стандартный json с DjangoJSONEncoder"""
+        response = fastjson.FastJsonResponse({'time': datetime(2024, 1, 1, 10, 30), 'name': 'ТС-1'})
+        self.assertEqual(fastjson.loads(response.content), {'time': '2024-01-01T10:30:00', 'name': 'ТС-1'})
+
+        # NaN и Infinity - null, как у orjson, а не недопустимый токен NaN
+        content = fastjson.dumps({'speed': float('nan'), 'values': [1.5, float('inf')]})
+        self.assertEqual(json.loads(content, parse_constant=self.fail), {'speed': None, 'values': [1.5, None]})
+
+
+class TransportTests(TestCase):
+    """Тесты общего HTTP-транспорта"""
+
+    def test_no_read_retries_and_no_shared_cookies(self):
+        """Таймаут чтения не повторяется, cookies ответов не сохраняются в общей сессии"""
+        transport = AutoGraphTransport(base_url='https://example.test')
+        self.assertEqual(transport.session.get_adapter('https://example.test').max_retries.read, 0)
+
+        headers = email.message.Message()
+        headers['Set-Cookie'] = 'session=user-1; Path=/'
+        response = mock.Mock(info=mock.Mock(return_value=headers))
+        transport.session.cookies.extract_cookies(response, urllib.request.Request(transport.url('Login')))
+        self.assertEqual(len(transport.session.cookies), 0)
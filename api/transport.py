@@ -0,0 +1,132 @@
+"""
+Общий HTTP-транспорт AutoGRAPH API
+
+Один пул keep-alive соединений на процесс (воркер gunicorn), который
+используют все клиенты и сервисы вместо собственных requests.Session().
+Сессия общая для всех пользователей и потоков, поэтому cookies не
+сохраняются (авторизация передается параметром session). Повторяются
+только ошибки подключения и ответы 502/503/504: повтор по таймауту
+чтения умножал бы ожидание медленного метода (GetTripItems).
+"""
+import logging
+import os
+import threading
+import warnings
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+logger = logging.getLogger(__name__)
+
+# Таймауты чтения по умолчанию для методов AutoGRAPH (секунды)
+DEFAULT_ENDPOINT_TIMEOUTS = {
+    'Login': 30,
+    'EnumSchemas': 30,
+    'EnumDevices': 30,
+    'EnumParameters': 30,
+    'GetOnlineInfo': 30,
+    'GetTripsTotal': 30,
+    'GetTrack': 60,
+    'GetTripTables': 60,
+    'GetTripItems': 90,
+}
+
+
+def endpoint_timeouts() -> Dict[str, float]:
+    """Таймауты чтения по методам с учетом AUTOGRAPH_ENDPOINT_TIMEOUTS"""
+    timeouts = dict(DEFAULT_ENDPOINT_TIMEOUTS)
+    timeouts.update(getattr(settings, 'AUTOGRAPH_ENDPOINT_TIMEOUTS', {}))
+    return timeouts
+
+
+class AutoGraphTransport:
+    """HTTP-транспорт с пулом соединений к AutoGRAPH"""
+
+    def __init__(self, base_url: str = None, pool_connections: int = None, pool_maxsize: int = None,
+                 max_retries: int = None, connect_timeout: float = None, timeouts: Dict[str, float] = None,
+                 verify: bool = None):
+        self.base_url = (base_url or getattr(settings, 'AUTOGRAPH_API_BASE_URL', 'https://web.tk-ekat.ru')).rstrip('/')
+        self.service_url = f"{self.base_url}/ServiceJSON"
+
+        self.connect_timeout = connect_timeout or getattr(settings, 'AUTOGRAPH_API_CONNECT_TIMEOUT', 5)
+        self.default_timeout = getattr(settings, 'AUTOGRAPH_API_TIMEOUT', 30)
+        self.timeouts = endpoint_timeouts()
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        retry = Retry(
+            total=max_retries if max_retries is not None else getattr(settings, 'AUTOGRAPH_API_RETRIES', 2),
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=['GET'],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or getattr(settings, 'AUTOGRAPH_POOL_CONNECTIONS', 4),
+            pool_maxsize=pool_maxsize or getattr(settings, 'AUTOGRAPH_POOL_MAXSIZE', 20),
+            max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'User-Agent': 'MonitoringApp/2.0'
+        })
+        self.session.verify = verify if verify is not None else getattr(settings, 'AUTOGRAPH_API_VERIFY_SSL', False)
+
+    def url(self, endpoint: str) -> str:
+        """Полный URL метода ServiceJSON"""
+        return f"{self.service_url}/{endpoint}"
+
+    def timeout(self, endpoint: str) -> tuple:
+        """Таймаут (подключение, чтение) для метода"""
+        return self.connect_timeout, self.timeouts.get(endpoint, self.default_timeout)
+
+    def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None, timeout=None,
+            **kwargs) -> requests.Response:
+        """GET-запрос к методу ServiceJSON через общий пул соединений"""
+        return self.session.get(
+            self.url(endpoint),
+            params=params,
+            timeout=timeout or self.timeout(endpoint),
+            **kwargs
+        )
+
+    def close(self):
+        self.session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> AutoGraphTransport:
+    """Общий транспорт процесса (создается при первом обращении)"""
+    global _transport
+
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = AutoGraphTransport()
+                logger.info(f"🔌 AutoGRAPH transport initialized (pid={os.getpid()})")
+
+    return _transport
+
+
+def reset_transport():
+    """Сброс транспорта (после fork сокеты родителя не переиспользуются)"""
+    global _transport
+    _transport = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_transport)
@@ -1,8 +1,9 @@
-import requests
 import logging
 from django.conf import settings
 import json
 
+from api.transport import get_transport
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,25 +13,24 @@ class AutoGraphAPIClient:
     def __init__(self):
         # ИСПРАВЛЕНО: используем тот же URL что и в AutoGraphService
         self.base_url = settings.AUTOGRAPH_API_BASE_URL  # "https://web.tk-ekat.ru"
-        self.session = requests.Session()
+        self.transport = get_transport()
         self.token = None
 
     def login(self, username, password):
         """Аутентификация в AutoGRAPH"""
         try:
-            url = f"{self.base_url}/ServiceJSON/Login"
             params = {
                 'UserName': username,
                 'Password': password,
                 'UTCOffset': 180  # Moscow UTC+3
             }
 
-            print(f"🌐 API CALL URL: {url}")
+            print(f"🌐 API CALL URL: {self.transport.url('Login')}")
             print(f"🔑 CREDENTIALS: UserName={username}, Password={'*' * len(password)}")
             print(f"⚙️ PARAMS: {params}")
 
             logger.info(f"🔄 AutoGRAPH login: {username}")
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get('Login', params=params, verify=True)
 
             print(f"📡 RESPONSE STATUS: {response.status_code}")
             print(f"📡 RESPONSE TEXT: {response.text}")
@@ -70,10 +70,9 @@ class AutoGraphAPIClient:
             return []
 
         try:
-            url = f"{self.base_url}/ServiceJSON/EnumSchemas"
             params = {'session': self.token}
 
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get('EnumSchemas', params=params)
             return response.json() if response.status_code == 200 else []
 
         except Exception as e:
@@ -86,13 +85,12 @@ class AutoGraphAPIClient:
             return {}
 
         try:
-            url = f"{self.base_url}/ServiceJSON/EnumDevices"
             params = {
                 'session': self.token,
                 'schemaID': schema_id
             }
 
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get('EnumDevices', params=params)
             return response.json() if response.status_code == 200 else {}
 
         except Exception as e:
@@ -105,7 +103,6 @@ class AutoGraphAPIClient:
             return None
 
         try:
-            url = f"{self.base_url}/ServiceJSON/GetTripTables"
             params = {
                 'session': self.token,
                 'schemaID': schema_id,
@@ -117,7 +114,7 @@ class AutoGraphAPIClient:
             }
 
             logger.info(f"🔄 Getting trip tables for {vehicle_id}")
-            response = self.session.get(url, params=params, timeout=60)
+            response = self.transport.get('GetTripTables', params=params)
 
             if response.status_code == 200:
                 data = response.json()
@@ -135,14 +132,13 @@ class AutoGraphAPIClient:
             return {}
 
         try:
-            url = f"{self.base_url}/ServiceJSON/GetOnlineInfo"
             params = {
                 'session': self.token,
                 'schemaID': schema_id,
                 'IDs': ','.join(vehicle_ids)
             }
 
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get('GetOnlineInfo', params=params)
             return response.json() if response.status_code == 200 else {}
 
         except Exception as e:
@@ -155,14 +151,13 @@ class AutoGraphAPIClient:
             return {}
 
         try:
-            url = f"{self.base_url}/ServiceJSON/EnumParameters"
             params = {
                 'session': self.token,
                 'schemaID': schema_id,
                 'IDs': vehicle_id
             }
 
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get('EnumParameters', params=params)
             return response.json() if response.status_code == 200 else {}
 
         except Exception as e:
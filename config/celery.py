@@ -1,10 +1,13 @@
 from __future__ import absolute_import, unicode_literals
+import logging
 import os
 from celery import Celery
 from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+logger = logging.getLogger(__name__)
+
 app = Celery('config')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
@@ -12,14 +15,20 @@ app.autodiscover_tasks()
 
 # Расписание для автоматического обновления данных
 app.conf.beat_schedule = {
-    'refresh-vehicles-data-every-5-minutes': {
-        'task': 'vehicles.tasks.refresh_vehicles_data_for_all_users',
-        'schedule': 300.0,  # 5 минут
-    },
     'clean-old-cache-every-hour': {
         'task': 'vehicles.tasks.clean_old_cache',
         'schedule': 3600.0,  # 1 час
     },
 }
 
+# Опрос снимков парка - только с общим кэшем (снимки из LocMem процесса Celery воркерам не видны)
+if settings.AUTOGRAPH_FLEET_POLLER_ENABLED:
+    app.conf.beat_schedule['refresh-vehicles-data'] = {
+        'task': 'vehicles.tasks.refresh_vehicles_data_for_all_users',
+        'schedule': settings.AUTOGRAPH_FLEET_POLL_INTERVAL,
+        'options': {'expires': settings.AUTOGRAPH_FLEET_POLL_INTERVAL},
+    }
+else:
+    logger.warning("⚠️ Опросчик снимков парка отключен: нужен общий кэш (REDIS_CACHE_ENABLED=True)")
+
 app.conf.timezone = 'Europe/Moscow'
\ No newline at end of file
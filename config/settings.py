@@ -178,6 +178,82 @@ os.makedirs(BASE_DIR / 'static' / 'vehicles' / 'js', exist_ok=True)
 AUTOGRAPH_API_BASE_URL = os.getenv('AUTOGRAPH_API_BASE_URL', "https://web.tk-ekat.ru")
 AUTOGRAPH_API_TIMEOUT = int(os.getenv('AUTOGRAPH_API_TIMEOUT', 30))
 
+# Общий пул соединений к AutoGRAPH (на процесс) и таймауты по методам
+AUTOGRAPH_API_CONNECT_TIMEOUT = float(os.getenv('AUTOGRAPH_API_CONNECT_TIMEOUT', 5))
+AUTOGRAPH_API_RETRIES = int(os.getenv('AUTOGRAPH_API_RETRIES', 2))
+AUTOGRAPH_API_VERIFY_SSL = os.getenv('AUTOGRAPH_API_VERIFY_SSL', 'False') == 'True'
+AUTOGRAPH_POOL_CONNECTIONS = int(os.getenv('AUTOGRAPH_POOL_CONNECTIONS', 4))
+AUTOGRAPH_POOL_MAXSIZE = int(os.getenv('AUTOGRAPH_POOL_MAXSIZE', 20))
+AUTOGRAPH_ENDPOINT_TIMEOUTS = {
+    'GetTripItems': int(os.getenv('AUTOGRAPH_TRIP_ITEMS_TIMEOUT', 90)),
+}
+
+# ASGI-режим: асинхронные версии тяжелых эндпоинтов и httpx-клиент
+# (запуск: gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker)
+AUTOGRAPH_ASYNC_VIEWS = os.getenv('AUTOGRAPH_ASYNC_VIEWS', 'False') == 'True'
+AUTOGRAPH_ASYNC_MAX_CONNECTIONS = int(os.getenv('AUTOGRAPH_ASYNC_MAX_CONNECTIONS', 100))
+
+# TTL кэша справочников AutoGRAPH (секунды), кэш общий для пользователей одной схемы
+AUTOGRAPH_METADATA_CACHE_TTLS = {
+    'EnumSchemas': int(os.getenv('AUTOGRAPH_SCHEMAS_CACHE_TTL', 600)),
+    'EnumDevices': int(os.getenv('AUTOGRAPH_DEVICES_CACHE_TTL', 300)),
+    'EnumParameters': int(os.getenv('AUTOGRAPH_PARAMETERS_CACHE_TTL', 1800)),
+}
+
+# Объединение одинаковых одновременных запросов GetOnlineInfo (single-flight):
+# окно разделения результата и максимальное ожидание чужого запроса (секунды)
+AUTOGRAPH_COALESCE_WINDOW = float(os.getenv('AUTOGRAPH_COALESCE_WINDOW', 3))
+AUTOGRAPH_COALESCE_WAIT_TIMEOUT = float(os.getenv('AUTOGRAPH_COALESCE_WAIT_TIMEOUT', 30))
+
+# Фоновый опросчик состояния парка: период опроса GetOnlineInfo, время жизни
+# снимка схемы и окно активности сессий, для схем которых ведется опрос (секунды).
+# Опросчик требует общего кэша (REDIS_CACHE_ENABLED) - см. AUTOGRAPH_FLEET_POLLER_ENABLED
+AUTOGRAPH_FLEET_POLL_INTERVAL = float(os.getenv('AUTOGRAPH_FLEET_POLL_INTERVAL', 30))
+AUTOGRAPH_FLEET_SNAPSHOT_TTL = int(os.getenv('AUTOGRAPH_FLEET_SNAPSHOT_TTL', 60))
+AUTOGRAPH_FLEET_ACTIVE_WINDOW = int(os.getenv('AUTOGRAPH_FLEET_ACTIVE_WINDOW', 900))
+
+# Push-канал состояния парка (SSE, только с AUTOGRAPH_ASYNC_VIEWS): пинг при
+# отсутствии изменений, предел подписчиков воркера, максимальная длительность соединения (секунды)
+AUTOGRAPH_LIVE_UPDATES_ENABLED = os.getenv('AUTOGRAPH_LIVE_UPDATES_ENABLED', 'False') == 'True'
+AUTOGRAPH_LIVE_HEARTBEAT = float(os.getenv('AUTOGRAPH_LIVE_HEARTBEAT', 15))
+AUTOGRAPH_LIVE_MAX_SUBSCRIBERS = int(os.getenv('AUTOGRAPH_LIVE_MAX_SUBSCRIBERS', 1000))
+AUTOGRAPH_LIVE_MAX_CONNECTION_AGE = int(os.getenv('AUTOGRAPH_LIVE_MAX_CONNECTION_AGE', 3600))
+
+# Параллельные запросы к AutoGRAPH: ширина пула и ограничение частоты (token bucket,
+# общий для процесса на адрес API и схему)
+AUTOGRAPH_TRIP_ITEMS_MAX_WORKERS = int(os.getenv('AUTOGRAPH_TRIP_ITEMS_MAX_WORKERS', 4))
+AUTOGRAPH_REQUESTS_PER_SECOND = float(os.getenv('AUTOGRAPH_REQUESTS_PER_SECOND', 2.0))
+AUTOGRAPH_REQUESTS_BURST = int(os.getenv('AUTOGRAPH_REQUESTS_BURST', 2))
+
+# Отчеты: число ТС, данные которых собираются одновременно, и предел ожидания одного ТС (секунды)
+REPORT_MAX_WORKERS = int(os.getenv('REPORT_MAX_WORKERS', 8))
+REPORT_VEHICLE_TIMEOUT = float(os.getenv('REPORT_VEHICLE_TIMEOUT', 60))
+
+# Длинные периоды GetTripItems запрашиваются отрезками по N дней (0 - без разбиения);
+# неудачный отрезок повторяется отдельно
+AUTOGRAPH_HISTORY_CHUNK_DAYS = int(os.getenv('AUTOGRAPH_HISTORY_CHUNK_DAYS', 7))
+AUTOGRAPH_HISTORY_CHUNK_RETRIES = int(os.getenv('AUTOGRAPH_HISTORY_CHUNK_RETRIES', 2))
+AUTOGRAPH_HISTORY_CHUNK_RETRY_BACKOFF = float(os.getenv('AUTOGRAPH_HISTORY_CHUNK_RETRY_BACKOFF', 1.0))
+
+# Потоковый разбор ответов GetTripItems (ijson) крупнее AUTOGRAPH_TRIP_ITEMS_STREAM_MIN_BYTES байт
+AUTOGRAPH_TRIP_ITEMS_STREAMING = os.getenv('AUTOGRAPH_TRIP_ITEMS_STREAMING', 'True') == 'True'
+AUTOGRAPH_TRIP_ITEMS_STREAM_MIN_BYTES = int(os.getenv('AUTOGRAPH_TRIP_ITEMS_STREAM_MIN_BYTES', 8 * 1024 * 1024))
+
+# Локальная история GetTripItems (RawTrackData): повторные запросы периода отдаются из базы
+AUTOGRAPH_HISTORY_STORE_ENABLED = os.getenv('AUTOGRAPH_HISTORY_STORE_ENABLED', 'True') == 'True'
+AUTOGRAPH_HISTORY_INGEST_BATCH = int(os.getenv('AUTOGRAPH_HISTORY_INGEST_BATCH', 1000))
+
+# Кэш отформатированных временных рядов в базе (DataCache, сжатие zlib):
+# TTL прошедших периодов и периодов с сегодняшним днем (секунды), лимиты размера (байты)
+AUTOGRAPH_RESULT_CACHE_ENABLED = os.getenv('AUTOGRAPH_RESULT_CACHE_ENABLED', 'True') == 'True'
+AUTOGRAPH_RESULT_CACHE_TTL = int(os.getenv('AUTOGRAPH_RESULT_CACHE_TTL', 86400))
+AUTOGRAPH_RESULT_CACHE_TTL_RECENT = int(os.getenv('AUTOGRAPH_RESULT_CACHE_TTL_RECENT', 300))
+AUTOGRAPH_RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv('AUTOGRAPH_RESULT_CACHE_MAX_ENTRY_BYTES', 50 * 1024 * 1024))
+AUTOGRAPH_RESULT_CACHE_MAX_BYTES = int(os.getenv('AUTOGRAPH_RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Сериализация ответов API и разбор ответов AutoGRAPH через orjson (api.fastjson)
+FAST_JSON_ENABLED = os.getenv('FAST_JSON_ENABLED', 'True') == 'True'
+
 # Настройки аутентификации
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
@@ -193,15 +269,39 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'api.fastjson.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
 # Настройки кэша
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# REDIS_CACHE_ENABLED=True - кэш в Redis, общий для всех воркеров
+# (кэш справочников и single-flight работают между процессами, а не только внутри воркера)
+if os.getenv('REDIS_CACHE_ENABLED', 'False') == 'True':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
     }
-}
\ No newline at end of file
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+
+# Фоновый опросчик снимков парка (Celery beat) работает только с общим кэшем:
+# с LocMem снимки остаются в памяти процесса Celery, воркеры веб-сервера их
+# не видят и запрашивают AutoGRAPH сами - опрос был бы лишней нагрузкой
+AUTOGRAPH_FLEET_POLLER_ENABLED = (
+    os.getenv('AUTOGRAPH_FLEET_POLLER_ENABLED', 'True') == 'True'
+    and CACHES['default']['BACKEND'] not in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    )
+)
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Классификатор параметров топлива в Final (GetOnlineInfo)
+
+Имя параметра Final сопоставляется роли топлива (бак 1/2/3, общий уровень,
+уровень в процентах) один раз: роль запоминается в словаре классификатора
+схемы, и разбор Final каждого ТС при опросе сводится к поиску в словаре.
+Классификатор схемы привязан к версии кэша справочников схемы
+(metadata_cache): после invalidate_schema (смена EnumParameters) он
+строится заново.
+
+По FinalParams из EnumParameters классификатор отбирает параметры топлива
+(fuel_params) - только их дашборд запрашивает в GetOnlineInfo вместо '*'.
+"""
+import hashlib
+import logging
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from api import metadata_cache
+
+logger = logging.getLogger(__name__)
+
+TANK1 = 'tank1'
+TANK2 = 'tank2'
+TANK3 = 'tank3'
+MAIN = 'main'  # общий уровень (объем, л)
+PERCENT = 'percent'  # уровень топлива в %
+
+TANK_ROLES = (TANK1, TANK2, TANK3)
+
+# Роли по подстрокам имени в нижнем регистре, проверяются по порядку
+_PATTERNS = (
+    (TANK1, re.compile('fl1|дут1|tank1|бак1')),
+    (TANK2, re.compile('fl2|дут2|tank2|бак2')),
+    (TANK3, re.compile('fl3|дут3|tank3|бак3')),
+    (MAIN, re.compile('tankmain|общий|уровень|total')),
+)
+_FUEL = re.compile('fuel|топл')
+
+# Предел запоминаемых имен на схему (имена Final конечны, предел - от мусорных ключей)
+MAX_KEYS = 10000
+
+
+def classify(key: str) -> Optional[str]:
+    """Роль параметра по имени или None"""
+    key_lower = key.lower()
+
+    for role, pattern in _PATTERNS:
+        if pattern.search(key_lower):
+            return role
+
+    if 'level' in key_lower and _FUEL.search(key_lower):
+        return PERCENT
+
+    return None
+
+
+class FuelKeyClassifier:
+    """Роли параметров Final одной схемы"""
+
+    def __init__(self):
+        self._roles = {}
+        self._projections = {}  # ключ набора ТС -> finalParams
+
+    def role(self, key: str) -> Optional[str]:
+        try:
+            return self._roles[key]
+        except KeyError:
+            role = classify(key)
+            if len(self._roles) < MAX_KEYS:
+                self._roles[key] = role
+            return role
+
+    def fuel_params(self, parameters_data: Dict, device_ids: Iterable[str]) -> Optional[List[str]]:
+        """
+        Имена параметров топлива из ответа EnumParameters {device_id: {'FinalParams': [...]}};
+        None - нет описания параметров хотя бы одного ТС
+        """
+        names = set()
+        for device_id in device_ids:
+            device_params = (parameters_data or {}).get(device_id)
+            if not isinstance(device_params, dict) or 'FinalParams' not in device_params:
+                return None
+
+            for param in device_params.get('FinalParams') or []:
+                name = param.get('Name', '') if isinstance(param, dict) else ''
+                if name and self.role(name) is not None:
+                    names.add(name)
+
+        return sorted(names)
+
+    def projection(self, device_ids: List[str]) -> Optional[str]:
+        return self._projections.get(_devices_key(device_ids))
+
+    def remember_projection(self, device_ids: List[str], final_params: str):
+        if len(self._projections) < MAX_KEYS:
+            self._projections[_devices_key(device_ids)] = final_params
+
+    def __len__(self):
+        return len(self._roles)
+
+
+def _devices_key(device_ids: List[str]) -> str:
+    return hashlib.sha1(','.join(sorted(device_ids)).encode()).hexdigest()
+
+
+_default = FuelKeyClassifier()
+_classifiers = {}  # schema_id -> (версия справочников схемы, классификатор)
+_lock = threading.Lock()
+
+
+def for_schema(schema_id) -> FuelKeyClassifier:
+    """Классификатор схемы (без схемы - общий)"""
+    if not schema_id:
+        return _default
+
+    version = metadata_cache.scope_version(metadata_cache.schema_scope(schema_id))
+    entry = _classifiers.get(schema_id)
+
+    if entry is None or entry[0] != version:
+        with _lock:
+            entry = _classifiers.get(schema_id)
+            if entry is None or entry[0] != version:
+                entry = (version, FuelKeyClassifier())
+                _classifiers[schema_id] = entry
+                logger.debug(f"⛽ Классификатор топлива схемы {schema_id} (v{version})")
+
+    return entry[1]
@@ -0,0 +1,183 @@
+"""
+Push-канал состояния парка (Server-Sent Events, ASGI)
+
+На схему в воркере один производитель: раз в AUTOGRAPH_FLEET_POLL_INTERVAL
+секунд он читает снимок схемы из кэша (его обновляет фоновый опросчик;
+без снимка - запрашивает AutoGRAPH сам, один раз на схему) и при смене
+версии будит подписчиков. Нагрузка на AutoGRAPH и сериализация не зависят
+от числа открытых дашбордов: сообщение для версии клиента кодируется один
+раз и отдается всем подписчикам с той же версией.
+
+Обратное давление: подписчик, не успевающий забирать сообщения, не копит
+очередь - промежуточные версии пропускаются, и он получает одну дельту
+от последней отправленной ему версии (или снимок целиком, если его версия
+устарела). Без изменений раз в AUTOGRAPH_LIVE_HEARTBEAT секунд уходит
+комментарий-пинг; соединение закрывается через AUTOGRAPH_LIVE_MAX_CONNECTION_AGE
+секунд, EventSource переподключается с Last-Event-ID.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from typing import AsyncIterator, Dict, Optional
+
+from django.conf import settings
+
+from api import fastjson
+from . import snapshots
+from .services import AutoGraphService
+
+logger = logging.getLogger(__name__)
+
+# Пауза переподключения EventSource (мс)
+RETRY_MS = 5000
+
+# Сообщений текущей версии в памяти канала (по версиям клиентов)
+MAX_MESSAGES = 16
+
+
+class SubscriberLimitExceeded(Exception):
+    """Превышено число подписчиков воркера (AUTOGRAPH_LIVE_MAX_SUBSCRIBERS)"""
+
+
+def format_event(event: str, event_id: str, data: bytes) -> bytes:
+    """Сообщение SSE (data - JSON без переводов строк)"""
+    return f"id: {event_id}\nevent: {event}\ndata: ".encode() + data + b"\n\n"
+
+
+class SchemaChannel:
+    """Подписчики и производитель снимков одной схемы"""
+
+    def __init__(self, schema_id):
+        self.schema_id = schema_id
+        self.token = None
+        self.snapshot = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self._messages = {}
+        self._producer = None
+
+    @property
+    def version(self) -> Optional[str]:
+        return (self.snapshot or {}).get('version')
+
+    def subscribe(self, token: str):
+        self.subscribers += 1
+        self.token = token
+        if self._producer is None or self._producer.done():
+            self._producer = asyncio.ensure_future(self._produce())
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+
+    def publish(self, snapshot: Dict):
+        """Новый снимок: сообщения прежней версии сбрасываются, ожидающие подписчики просыпаются"""
+        self.snapshot = snapshot
+        self._messages = {}
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def message(self, since: Optional[str]) -> bytes:
+        """Сообщение текущего снимка для клиента с версией since (кодируется один раз)"""
+        message = self._messages.get(since)
+        if message is None:
+            payload = snapshots.snapshot_payload(self.snapshot, since)
+            event = 'delta' if payload['delta'] else 'snapshot'
+            message = format_event(event, self.version, fastjson.dumps(payload))
+            if len(self._messages) < MAX_MESSAGES:
+                self._messages[since] = message
+        return message
+
+    async def _produce(self):
+        interval = getattr(settings, 'AUTOGRAPH_FLEET_POLL_INTERVAL', 30)
+        logger.info(f"📡 Push-канал схемы {self.schema_id} запущен")
+
+        while self.subscribers > 0:
+            try:
+                # Схема с открытым push-каналом остается в опросе снимков
+                await snapshots.aregister_session(self.schema_id, self.token)
+                snapshot = await snapshots.aget_snapshot(self.schema_id)
+                if snapshot is None:
+                    # Фоновый опросчик не работает - запрос один на схему, а не на подписчика
+                    snapshot = await snapshots.acollect_snapshot(AutoGraphService(token=self.token), self.schema_id)
+
+                if snapshot and snapshot.get('version') and snapshot.get('version') != self.version:
+                    self.publish(snapshot)
+            except Exception as e:
+                logger.error(f"❌ Ошибка push-канала схемы {self.schema_id}: {e}")
+
+            await asyncio.sleep(interval)
+
+        # Снимок без производителя устаревает: новый подписчик дождется свежего
+        self.snapshot = None
+        self._messages = {}
+        logger.info(f"📡 Push-канал схемы {self.schema_id} остановлен")
+
+
+_channels = weakref.WeakKeyDictionary()  # event loop -> {schema_id: SchemaChannel}
+
+
+def get_channel(schema_id) -> SchemaChannel:
+    """Канал схемы в текущем event loop"""
+    channels = _channels.setdefault(asyncio.get_running_loop(), {})
+    channel = channels.get(schema_id)
+    if channel is None:
+        channel = channels[schema_id] = SchemaChannel(schema_id)
+    return channel
+
+
+def subscriber_count() -> int:
+    return sum(channel.subscribers for channel in _channels.get(asyncio.get_running_loop(), {}).values())
+
+
+def at_capacity() -> bool:
+    """Воркер обслуживает максимум подписчиков (AUTOGRAPH_LIVE_MAX_SUBSCRIBERS)"""
+    return subscriber_count() >= getattr(settings, 'AUTOGRAPH_LIVE_MAX_SUBSCRIBERS', 1000)
+
+
+def subscribe(schema_id, token: str) -> SchemaChannel:
+    """Подписка на канал схемы; SubscriberLimitExceeded - воркер обслуживает максимум подписчиков"""
+    if at_capacity():
+        raise SubscriberLimitExceeded()
+
+    channel = get_channel(schema_id)
+    channel.subscribe(token)
+    return channel
+
+
+async def event_stream(schema_id, token: str, last_version: str = None) -> AsyncIterator[bytes]:
+    """
+    Поток SSE подписчика. Подписка - только на время работы потока: клиент,
+    отключившийся до первого сообщения, не занимает место подписчика
+    """
+    heartbeat = getattr(settings, 'AUTOGRAPH_LIVE_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'AUTOGRAPH_LIVE_MAX_CONNECTION_AGE', 3600)
+    sent = last_version
+    channel = None
+
+    try:
+        try:
+            channel = subscribe(schema_id, token)
+        except SubscriberLimitExceeded:
+            # Предел достигнут после проверки в представлении - клиент переподключится позже
+            logger.warning(f"⚠️ Push-канал: превышен предел подписчиков, схема {schema_id}")
+            return
+
+        yield f"retry: {RETRY_MS}\n\n".encode()
+
+        while time.monotonic() < deadline:
+            changed = channel.changed
+            if channel.version and channel.version != sent:
+                # Отправляется только текущая версия: промежуточные медленный клиент пропускает
+                version = channel.version
+                yield channel.message(sent)
+                sent = version
+                continue
+
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+    finally:
+        if channel is not None:
+            channel.unsubscribe()
@@ -1,44 +1,42 @@
 # dashboard/services.py
-import requests
 import logging
-import warnings
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 
-warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+from api import fastjson, metadata_cache, single_flight
+from api.transport import get_transport
+from . import fuel_keys
+
 logger = logging.getLogger(__name__)
 
+# Число ТС в одном запросе EnumParameters
+PARAMETERS_BATCH = 50
+
 
 class AutoGraphService:
     """Сервис для работы с AutoGRAPH API"""
 
-    BASE_URL = "https://web.tk-ekat.ru/ServiceJSON"
-
     def __init__(self, token=None):
         self.token = token
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Accept': 'application/json',
-            'User-Agent': 'MonitoringApp/1.0'
-        })
-        self.session.verify = False
+        self.transport = get_transport()
 
-    def get_schemas(self):
+    def get_schemas(self, use_cache=True):
         """Получить доступные схемы"""
         if not self.token:
             return []
 
         try:
-            url = f"{self.BASE_URL}/EnumSchemas"
             params = {'session': self.token}
 
-            response = self.session.get(url, params=params, timeout=30)
+            def fetch():
+                return self._request_json('EnumSchemas', params)
 
-            if response.status_code != 200:
-                logger.error(f"Ошибка получения схем: HTTP {response.status_code}")
-                return []
-
-            schemas_data = response.json()
+            if use_cache:
+                schemas_data = metadata_cache.get_or_fetch(
+                    'EnumSchemas', metadata_cache.token_scope(self.token), fetch
+                )
+            else:
+                schemas_data = fetch()
 
             if not isinstance(schemas_data, list):
                 logger.warning(f"Unexpected schemas format: {type(schemas_data)}")
@@ -65,85 +63,264 @@ class AutoGraphService:
             return []
 
     def get_devices(self, schema_id):
-        """Получить все устройства схемы"""
+        """Получить все устройства схемы (EnumDevices кэшируется на схему)"""
         if not self.token or not schema_id:
             return []
 
         try:
-            url = f"{self.BASE_URL}/EnumDevices"
             params = {
                 'session': self.token,
                 'schemaID': schema_id
             }
 
-            response = self.session.get(url, params=params, timeout=30)
+            devices_data = metadata_cache.get_or_fetch(
+                'EnumDevices', metadata_cache.schema_scope(schema_id),
+                lambda: self._request_json('EnumDevices', params)
+            )
 
-            if response.status_code != 200:
-                logger.error(f"Ошибка получения устройств: HTTP {response.status_code}")
-                return []
+            return self._parse_devices(devices_data)
 
-            devices_data = response.json()
+        except Exception as e:
+            logger.error(f"Ошибка получения устройств: {e}")
+            return []
 
-            if not devices_data or 'Items' not in devices_data:
-                return []
+    def _parse_devices(self, devices_data):
+        """Разбор ответа EnumDevices"""
+        if not devices_data or 'Items' not in devices_data:
+            return []
 
-            devices = []
-            for item in devices_data['Items']:
-                try:
-                    device_id = item.get('ID', '')
-                    name = item.get('Name', f'ТС {device_id[:8]}')
-
-                    # Ищем госномер
-                    reg_num = "—"
-                    properties = item.get('Properties', [])
-                    for prop in properties:
-                        if prop.get('Name') == 'VehicleRegNumber' and prop.get('Value'):
-                            reg_num = prop['Value']
-                            break
-
-                    devices.append({
-                        'id': device_id,
-                        'name': name,
-                        'reg_num': reg_num,
-                        'serial': item.get('Serial', ''),
-                    })
+        devices = []
+        for item in devices_data['Items']:
+            try:
+                device_id = item.get('ID', '')
+                name = item.get('Name', f'ТС {device_id[:8]}')
+
+                # Ищем госномер
+                reg_num = "—"
+                properties = item.get('Properties', [])
+                for prop in properties:
+                    if prop.get('Name') == 'VehicleRegNumber' and prop.get('Value'):
+                        reg_num = prop['Value']
+                        break
+
+                devices.append({
+                    'id': device_id,
+                    'name': name,
+                    'reg_num': reg_num,
+                    'serial': item.get('Serial', ''),
+                })
+
+            except Exception as e:
+                logger.error(f"Ошибка обработки устройства: {e}")
+                continue
+
+        return devices
+
+    def get_online_data(self, schema_id, device_ids, final_params='*'):
+        """Получить онлайн данные для устройств (final_params - состав Final, '*' - все параметры)"""
+        if not self.token or not schema_id or not device_ids:
+            return {}
 
-                except Exception as e:
-                    logger.error(f"Ошибка обработки устройства: {e}")
-                    continue
+        try:
+            params = self._online_request_params(schema_id, device_ids, final_params)
+
+            def fetch():
+                response = self.transport.get('GetOnlineInfo', params=params)
+
+                if response.status_code != 200:
+                    logger.error(f"Ошибка онлайн данных: HTTP {response.status_code}")
+                    return {}
+
+                result = fastjson.parse_response(response)
+                return result if isinstance(result, dict) else {}
+
+            # Одинаковые одновременные запросы схемы разделяют один вызов AutoGRAPH
+            return single_flight.coalesce(self._online_flight_key(schema_id, params), fetch)
+
+        except Exception as e:
+            logger.error(f"Ошибка получения онлайн данных: {e}")
+            return {}
+
+    def _online_request_params(self, schema_id, device_ids, final_params='*'):
+        """Параметры запроса GetOnlineInfo"""
+        if isinstance(device_ids, list):
+            device_ids = ','.join(device_ids)
+
+        return {
+            'session': self.token,
+            'schemaID': schema_id,
+            'IDs': device_ids,
+            'finalParams': final_params or '*',
+            'mchp': '0'
+        }
+
+    def dashboard_final_params(self, schema_id, device_ids):
+        """
+        finalParams для дашборда: только параметры топлива ТС по EnumParameters
+        (остальное дашборд берет из основных полей GetOnlineInfo). '*' - если описание
+        параметров получить не удалось; без параметров топлива - один параметр Final.
+        """
+        classifier = fuel_keys.for_schema(schema_id)
+        final_params = classifier.projection(device_ids)
+        if final_params is not None:
+            return final_params
+
+        parameters_data = {}
+        for batch in self._parameter_batches(device_ids):
+            parameters_data.update(self._schema_parameters(schema_id, batch))
+
+        return self._remember_final_params(classifier, device_ids, parameters_data)
+
+    def _parameter_batches(self, device_ids):
+        """ТС для EnumParameters пачками (ограничение длины URL)"""
+        return [device_ids[i:i + PARAMETERS_BATCH] for i in range(0, len(device_ids), PARAMETERS_BATCH)]
+
+    def _schema_parameters(self, schema_id, device_ids):
+        """EnumParameters пачки ТС (кэшируется на схему)"""
+        params = {'session': self.token, 'schemaID': schema_id, 'IDs': ','.join(device_ids)}
+
+        try:
+            result = metadata_cache.get_or_fetch(
+                'EnumParameters', metadata_cache.schema_scope(schema_id),
+                lambda: self._request_json('EnumParameters', params),
+                extra=single_flight.make_key('EnumParameters', schema_id, device_ids)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка получения параметров: {e}")
+            return {}
+
+        return result if isinstance(result, dict) else {}
+
+    def _remember_final_params(self, classifier, device_ids, parameters_data):
+        names = classifier.fuel_params(parameters_data, device_ids)
+        if names is None:
+            logger.info(f"⛽ finalParams: нет описания параметров - запрашиваются все ('*')")
+            return '*'
+
+        if names:
+            final_params = ','.join(names)
+            logger.info(f"⛽ finalParams дашборда: {len(names)} параметров топлива для {len(device_ids)} ТС")
+        else:
+            # Параметров топлива нет, Final дашборду не нужен: вместо всех параметров - один
+            final_params = self._single_final_param(parameters_data, device_ids)
+            logger.info(f"⛽ finalParams дашборда: нет параметров топлива у {len(device_ids)} ТС - {final_params}")
+
+        classifier.remember_projection(device_ids, final_params)
+        return final_params
+
+    def _single_final_param(self, parameters_data, device_ids):
+        """Один описанный параметр Final ('*' - у ТС нет параметров Final, ответ и так пуст)"""
+        names = {
+            param.get('Name') for device_id in device_ids
+            for param in parameters_data[device_id].get('FinalParams') or []
+            if isinstance(param, dict) and param.get('Name')
+        }
+        return min(names) if names else '*'
+
+    def _online_flight_key(self, schema_id, params):
+        """Ключ single-flight для GetOnlineInfo (без токена - общий для пользователей схемы)"""
+        return single_flight.make_key(
+            'GetOnlineInfo', schema_id, params['IDs'].split(','), params['finalParams']
+        )
+
+    def _request_json(self, endpoint, params):
+        """Запрос к AutoGRAPH; None при ошибке HTTP"""
+        response = self.transport.get(endpoint, params=params)
+
+        if response.status_code != 200:
+            logger.error(f"Ошибка запроса {endpoint}: HTTP {response.status_code}")
+            return None
+
+        return fastjson.parse_response(response)
+
+    # ==================== АСИНХРОННЫЙ РЕЖИМ (ASGI) ====================
+
+    @property
+    def async_transport(self):
+        """Асинхронный транспорт (httpx импортируется только в ASGI-режиме)"""
+        from api.async_transport import get_async_transport
+        return get_async_transport()
+
+    async def aget_devices(self, schema_id):
+        """Асинхронная версия get_devices"""
+        if not self.token or not schema_id:
+            return []
+
+        try:
+            params = {
+                'session': self.token,
+                'schemaID': schema_id
+            }
 
-            return devices
+            devices_data = await metadata_cache.aget_or_fetch(
+                'EnumDevices', metadata_cache.schema_scope(schema_id),
+                lambda: self._arequest_json('EnumDevices', params)
+            )
+
+            return self._parse_devices(devices_data)
 
         except Exception as e:
             logger.error(f"Ошибка получения устройств: {e}")
             return []
 
-    def get_online_data(self, schema_id, device_ids):
-        """Получить онлайн данные для устройств"""
+    async def _arequest_json(self, endpoint, params):
+        """Асинхронный запрос к AutoGRAPH; None при ошибке HTTP"""
+        response = await self.async_transport.get(endpoint, params=params)
+
+        if response.status_code != 200:
+            logger.error(f"Ошибка запроса {endpoint}: HTTP {response.status_code}")
+            return None
+
+        return fastjson.parse_response(response)
+
+    async def adashboard_final_params(self, schema_id, device_ids):
+        """Асинхронная версия dashboard_final_params"""
+        classifier = fuel_keys.for_schema(schema_id)
+        final_params = classifier.projection(device_ids)
+        if final_params is not None:
+            return final_params
+
+        parameters_data = {}
+        for batch in self._parameter_batches(device_ids):
+            parameters_data.update(await self._aschema_parameters(schema_id, batch))
+
+        return self._remember_final_params(classifier, device_ids, parameters_data)
+
+    async def _aschema_parameters(self, schema_id, device_ids):
+        """Асинхронная версия _schema_parameters"""
+        params = {'session': self.token, 'schemaID': schema_id, 'IDs': ','.join(device_ids)}
+
+        try:
+            result = await metadata_cache.aget_or_fetch(
+                'EnumParameters', metadata_cache.schema_scope(schema_id),
+                lambda: self._arequest_json('EnumParameters', params),
+                extra=single_flight.make_key('EnumParameters', schema_id, device_ids)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка получения параметров: {e}")
+            return {}
+
+        return result if isinstance(result, dict) else {}
+
+    async def aget_online_data(self, schema_id, device_ids, final_params='*'):
+        """Асинхронная версия get_online_data"""
         if not self.token or not schema_id or not device_ids:
             return {}
 
         try:
-            if isinstance(device_ids, list):
-                device_ids = ','.join(device_ids)
+            params = self._online_request_params(schema_id, device_ids, final_params)
 
-            url = f"{self.BASE_URL}/GetOnlineInfo"
-            params = {
-                'session': self.token,
-                'schemaID': schema_id,
-                'IDs': device_ids,
-                'finalParams': '*',  # Запрашиваем ВСЕ финальные параметры для получения топлива
-                'mchp': '0'
-            }
+            async def fetch():
+                response = await self.async_transport.get('GetOnlineInfo', params=params)
 
-            response = self.session.get(url, params=params, timeout=30)
+                if response.status_code != 200:
+                    logger.error(f"Ошибка онлайн данных: HTTP {response.status_code}")
+                    return {}
 
-            if response.status_code != 200:
-                logger.error(f"Ошибка онлайн данных: HTTP {response.status_code}")
-                return {}
+                result = fastjson.parse_response(response)
+                return result if isinstance(result, dict) else {}
 
-            result = response.json()
-            return result if isinstance(result, dict) else {}
+            return await single_flight.acoalesce(self._online_flight_key(schema_id, params), fetch)
 
         except Exception as e:
             logger.error(f"Ошибка получения онлайн данных: {e}")
@@ -152,37 +329,37 @@ class AutoGraphService:
     # ==================== МЕТОДЫ ДЛЯ РАБОТЫ С ТОПЛИВОМ ====================
 
     def get_device_parameters(self, schema_id, device_id):
-        """Получить параметры устройства"""
+        """Получить параметры устройства (EnumParameters кэшируется на схему)"""
         if not self.token or not schema_id or not device_id:
             return {}
 
         try:
-            url = f"{self.BASE_URL}/EnumParameters"
             params = {
                 'session': self.token,
                 'schemaID': schema_id,
                 'IDs': device_id
             }
 
-            response = self.session.get(url, params=params, timeout=30)
-
-            if response.status_code != 200:
-                logger.error(f"Ошибка получения параметров: HTTP {response.status_code}")
-                return {}
-
-            result = response.json()
+            result = metadata_cache.get_or_fetch(
+                'EnumParameters', metadata_cache.schema_scope(schema_id),
+                lambda: self._request_json('EnumParameters', params),
+                extra=device_id
+            )
             return result if isinstance(result, dict) else {}
 
         except Exception as e:
             logger.error(f"Ошибка получения параметров: {e}")
             return {}
 
-    def extract_fuel_data(self, online_data: Dict) -> Dict:
-        """Извлечение данных о топливе из онлайн данных"""
+    def extract_fuel_data(self, online_data: Dict, classifier: fuel_keys.FuelKeyClassifier = None) -> Dict:
+        """Извлечение данных о топливе из онлайн данных (роли параметров Final - из классификатора схемы)"""
 
         if not online_data:
             return {}
 
+        if classifier is None:
+            classifier = fuel_keys.for_schema(None)
+
         fuel_data = {
             'total_volume': 0,  # Суммарный объем топлива в литрах
             'tank1_volume': 0,  # Объем в баке 1 (л)
@@ -202,38 +379,21 @@ class AutoGraphService:
 
             # Собираем все значения, связанные с топливом
             for key, value in final_data.items():
-                key_lower = key.lower()
+                role = classifier.role(key)
 
-                # Ищем параметры объема топлива (в литрах)
-                if any(word in key_lower for word in ['fl1', 'дут1', 'tank1', 'бак1']):
+                # Объем топлива в баке (в литрах)
+                if role in fuel_keys.TANK_ROLES:
                     try:
-                        fuel_data['tank1_volume'] = float(value)
-                        fuel_data['total_volume'] += fuel_data['tank1_volume']
-                        fuel_data['tanks_count'] += 1
-                        fuel_data['has_fuel_data'] = True
-                    except (ValueError, TypeError):
-                        pass
-
-                elif any(word in key_lower for word in ['fl2', 'дут2', 'tank2', 'бак2']):
-                    try:
-                        fuel_data['tank2_volume'] = float(value)
-                        fuel_data['total_volume'] += fuel_data['tank2_volume']
-                        fuel_data['tanks_count'] += 1
-                        fuel_data['has_fuel_data'] = True
-                    except (ValueError, TypeError):
-                        pass
-
-                elif any(word in key_lower for word in ['fl3', 'дут3', 'tank3', 'бак3']):
-                    try:
-                        fuel_data['tank3_volume'] = float(value)
-                        fuel_data['total_volume'] += fuel_data['tank3_volume']
+                        volume = float(value)
+                        fuel_data[f'{role}_volume'] = volume
+                        fuel_data['total_volume'] += volume
                         fuel_data['tanks_count'] += 1
                         fuel_data['has_fuel_data'] = True
                     except (ValueError, TypeError):
                         pass
 
                 # Общий уровень топлива
-                elif any(word in key_lower for word in ['tankmain', 'общий', 'уровень', 'total']):
+                elif role == fuel_keys.MAIN:
                     try:
                         volume = float(value)
                         # Если значение большое, вероятно это объем в литрах
@@ -244,7 +404,7 @@ class AutoGraphService:
                         pass
 
                 # Уровень топлива в процентах
-                elif 'level' in key_lower and ('fuel' in key_lower or 'топл' in key_lower):
+                elif role == fuel_keys.PERCENT:
                     try:
                         level = float(value)
                         if 0 <= level <= 100:  # Уровень в процентах
@@ -292,7 +452,8 @@ class AutoGraphService:
         online_data = online_data_dict[device_id]
 
         # Извлекаем данные о топливе
-        fuel_data = self.extract_fuel_data(online_data)
+        classifier = fuel_keys.for_schema(schema_id)
+        fuel_data = self.extract_fuel_data(online_data, classifier)
 
         # Если нет данных, пробуем получить параметры для более точного запроса
         if not fuel_data['has_fuel_data']:
@@ -320,7 +481,6 @@ class AutoGraphService:
                     fuel_params_str = ','.join(fuel_param_names[:10])  # Ограничиваем количество
 
                     # Делаем запрос с конкретными параметрами топлива
-                    url = f"{self.BASE_URL}/GetOnlineInfo"
                     params = {
                         'session': self.token,
                         'schemaID': schema_id,
@@ -330,12 +490,12 @@ class AutoGraphService:
                     }
 
                     try:
-                        response = self.session.get(url, params=params, timeout=30)
+                        response = self.transport.get('GetOnlineInfo', params=params)
                         if response.status_code == 200:
-                            fuel_response = response.json()
+                            fuel_response = fastjson.parse_response(response)
                             if fuel_response and device_id in fuel_response:
                                 fuel_online_data = fuel_response[device_id]
-                                fuel_data = self.extract_fuel_data(fuel_online_data)
+                                fuel_data = self.extract_fuel_data(fuel_online_data, classifier)
                     except Exception as e:
                         logger.error(f"Ошибка запроса данных топлива: {e}")
 
@@ -363,10 +523,12 @@ class AutoGraphService:
             'devices': {}  # Данные по каждому устройству
         }
 
+        classifier = fuel_keys.for_schema(schema_id)
+
         for device_id in device_ids:
             if device_id in online_data_dict:
                 online_data = online_data_dict[device_id]
-                fuel_data = self.extract_fuel_data(online_data)
+                fuel_data = self.extract_fuel_data(online_data, classifier)
 
                 # Находим имя устройства
                 device_name = online_data.get('name', f'ТС {device_id[:8]}')
@@ -394,4 +556,90 @@ class AutoGraphService:
 
                 fuel_report['devices'][device_id] = device_fuel_info
 
-        return fuel_report
\ No newline at end of file
+        return fuel_report
+
+
+
+def build_dashboard_data(service, devices, online_data, schema_id=None):
+    """Формирование данных дашборда из списка устройств и онлайн данных"""
+    if not devices:
+        return {
+            'vehicles': [],
+            'total': 0,
+            'online': 0,
+            'warning': 0,
+            'offline': 0,
+        }
+
+    vehicles = []
+    stats = {'total': 0, 'online': 0, 'warning': 0, 'offline': 0}
+    classifier = fuel_keys.for_schema(schema_id)
+
+    for device in devices:
+        device_id = device['id']
+        online = online_data.get(device_id) if isinstance(online_data, dict) else None
+
+        # Определяем статус
+        status = 'offline'
+        if online:
+            # Проверяем скорость
+            speed = 0
+            if 'Speed' in online:
+                try:
+                    speed = float(online['Speed'])
+                except:
+                    pass
+
+            if speed > 1:  # Если движется
+                status = 'online'
+            else:  # Если стоит
+                status = 'warning'
+
+        stats[status] += 1
+        stats['total'] += 1
+
+        # Скорость
+        speed = 0
+        if online and 'Speed' in online:
+            try:
+                speed = float(online['Speed'])
+            except:
+                pass
+
+        # Топливо - используем существующий метод
+        fuel_volume = 0
+        if online:
+            fuel_data = service.extract_fuel_data(online, classifier)
+            fuel_volume = fuel_data.get('total_volume', 0)
+
+        # Адрес
+        address = online.get('Address', '') if online else ''
+
+        # Время обновления
+        last_update = ''
+        if online:
+            for field in ['DTLocal', 'DT', '_LastDataLocal']:
+                if field in online and online[field]:
+                    last_update = online[field]
+                    break
+
+        vehicles.append({
+            'id': device_id,
+            'name': device['name'],
+            'license_plate': device['reg_num'],
+            'serial': device['serial'],
+            'status': status,
+            'speed': speed,
+            'fuel_volume': fuel_volume,  # Объем топлива в литрах
+            'address': address,
+            'last_update': last_update,
+        })
+
+    return {
+        'vehicles': vehicles,
+        'total': stats['total'],
+        'online': stats['online'],
+        'warning': stats['warning'],
+        'offline': stats['offline'],
+        'timestamp': datetime.now().isoformat(),
+    }
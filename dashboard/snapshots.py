@@ -0,0 +1,246 @@
+"""
+Снимки состояния парка по схемам (fleet snapshot)
+
+Фоновый опросчик (vehicles.tasks.refresh_vehicles_data_for_all_users)
+раз в AUTOGRAPH_FLEET_POLL_INTERVAL секунд запрашивает GetOnlineInfo
+по каждой активной схеме и сохраняет компактный снимок в Django-кэш.
+API дашборда отдает снимок из кэша, не обращаясь к AutoGRAPH, поэтому
+время ответа не зависит от числа пользователей, смотрящих на схему.
+Опросчик работает только с общим кэшем (AUTOGRAPH_FLEET_POLLER_ENABLED):
+снимки в LocMem процесса Celery воркеры веб-сервера не видят.
+
+Активные схемы опросчик берет из реестра в кэше: схема и токен
+отмечаются при входе и при запросах дашборда (register_session) и
+выпадают из реестра через AUTOGRAPH_FLEET_ACTIVE_WINDOW секунд без запросов.
+
+Версия снимка ('<эпоха>.<номер>') растет, только если изменился хотя бы
+один ТС (TRACKED_FIELDS). Каждый ТС помнит номер версии, в которой он
+изменился, поэтому по версии клиента (since) отдаются только изменившиеся ТС.
+Смена состава парка или потеря предыдущего снимка начинает новую эпоху:
+клиент со старой версией получает снимок целиком.
+"""
+import hashlib
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from api import fastjson
+from .services import AutoGraphService, build_dashboard_data
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'autograph:fleet'
+
+# Поля ТС, изменение которых дает новую версию снимка; last_update - с точностью до часа
+TRACKED_FIELDS = ('status', 'speed', 'fuel_volume', 'address', 'name', 'license_plate', 'serial')
+LAST_UPDATE_PRECISION = len('YYYY-MM-DDTHH')
+
+# Служебные данные версий ТС в снимке (в ответ API не попадают)
+CHANGES_KEY = '_changes'
+
+# Реестр активных схем: {schema_id: {token: время последнего запроса}}
+ACTIVE_KEY = f"{KEY_PREFIX}:active"
+
+# Реестр обновляется не чаще раза в REGISTRY_TOUCH_INTERVAL секунд на токен;
+# на схему хранятся самые свежие токены (запасные на случай просроченного)
+REGISTRY_TOUCH_INTERVAL = 60
+MAX_TOKENS_PER_SCHEMA = 5
+
+
+def snapshot_key(schema_id) -> str:
+    return f"{KEY_PREFIX}:snapshot:{schema_id}"
+
+
+def _snapshot_ttl() -> int:
+    return getattr(settings, 'AUTOGRAPH_FLEET_SNAPSHOT_TTL', 60)
+
+
+def get_snapshot(schema_id) -> Optional[Dict]:
+    """Последний снимок схемы или None"""
+    return cache.get(snapshot_key(schema_id))
+
+
+async def aget_snapshot(schema_id) -> Optional[Dict]:
+    """Асинхронная версия get_snapshot"""
+    return await cache.aget(snapshot_key(schema_id))
+
+
+def _fingerprint(vehicle: Dict) -> str:
+    values = [vehicle.get(field) for field in TRACKED_FIELDS]
+    values.append(str(vehicle.get('last_update') or '')[:LAST_UPDATE_PRECISION])
+    return hashlib.sha1(fastjson.dumps(values)).hexdigest()[:16]
+
+
+def _assign_version(snapshot: Dict, previous: Optional[Dict]):
+    """Версия снимка и номера версий изменения ТС относительно предыдущего снимка"""
+    previous_changes = (previous or {}).get(CHANGES_KEY) or {}
+    fingerprints = {vehicle['id']: _fingerprint(vehicle) for vehicle in snapshot['vehicles']}
+
+    if not previous_changes or set(previous_changes) != set(fingerprints):
+        # Новая эпоха: дельта от версий предыдущего снимка невозможна
+        epoch, number = secrets.token_hex(4), 1
+        changes = {vehicle_id: [fingerprint, number] for vehicle_id, fingerprint in fingerprints.items()}
+    else:
+        epoch, number = previous['epoch'], previous['number']
+        changed = [vehicle_id for vehicle_id, fingerprint in fingerprints.items()
+                   if previous_changes[vehicle_id][0] != fingerprint]
+        if changed:
+            number += 1
+        changes = {
+            vehicle_id: [fingerprint, number if vehicle_id in changed else previous_changes[vehicle_id][1]]
+            for vehicle_id, fingerprint in fingerprints.items()
+        }
+
+    snapshot.update({'epoch': epoch, 'number': number, 'version': f"{epoch}.{number}", CHANGES_KEY: changes})
+
+
+def _make_snapshot(schema_id, service, devices, online_data, previous=None) -> Dict:
+    snapshot = build_dashboard_data(service, devices, online_data, schema_id)
+    snapshot['schema_id'] = schema_id
+    snapshot.setdefault('timestamp', timezone.now().isoformat())
+    _assign_version(snapshot, previous)
+    return snapshot
+
+
+def snapshot_payload(snapshot: Dict, since: str = None) -> Dict:
+    """
+    Данные для API: снимок целиком ('delta': False) или, если версия since
+    относится к текущей эпохе, только ТС, изменившиеся после нее ('delta': True)
+    """
+    changes = snapshot.get(CHANGES_KEY)
+    payload = {key: value for key, value in snapshot.items() if key != CHANGES_KEY}
+    payload['delta'] = False
+
+    epoch, _, number = (since or '').partition('.')
+    if not changes or epoch != snapshot.get('epoch') or not number.isdigit() or int(number) > snapshot['number']:
+        return payload
+
+    base = int(number)
+    payload['vehicles'] = [vehicle for vehicle in snapshot['vehicles'] if changes[vehicle['id']][1] > base]
+    payload['delta'] = True
+    payload['since'] = since
+    return payload
+
+
+def collect_snapshot(service: AutoGraphService, schema_id) -> Dict:
+    """Запросить состояние парка схемы и сохранить снимок (пустой парк не сохраняется)"""
+    devices = service.get_devices(schema_id)
+    online_data = {}
+    if devices:
+        device_ids = [d['id'] for d in devices]
+        final_params = service.dashboard_final_params(schema_id, device_ids)
+        online_data = service.get_online_data(schema_id, device_ids, final_params)
+
+    snapshot = _make_snapshot(schema_id, service, devices, online_data, get_snapshot(schema_id))
+    if devices:
+        cache.set(snapshot_key(schema_id), snapshot, _snapshot_ttl())
+
+    return snapshot
+
+
+async def acollect_snapshot(service: AutoGraphService, schema_id) -> Dict:
+    """Асинхронная версия collect_snapshot"""
+    devices = await service.aget_devices(schema_id)
+    online_data = {}
+    if devices:
+        device_ids = [d['id'] for d in devices]
+        final_params = await service.adashboard_final_params(schema_id, device_ids)
+        online_data = await service.aget_online_data(schema_id, device_ids, final_params)
+
+    snapshot = _make_snapshot(schema_id, service, devices, online_data, await aget_snapshot(schema_id))
+    if devices:
+        await cache.aset(snapshot_key(schema_id), snapshot, _snapshot_ttl())
+
+    return snapshot
+
+
+def _active_window() -> int:
+    return getattr(settings, 'AUTOGRAPH_FLEET_ACTIVE_WINDOW', 900)
+
+
+def _touch(registry: Dict, schema_id, token: str, now: float) -> Optional[Dict]:
+    """Реестр с отметкой токена схемы и без устаревших записей; None - отметка еще свежая"""
+    if now - (registry.get(schema_id) or {}).get(token, 0) < REGISTRY_TOUCH_INTERVAL:
+        return None
+
+    threshold = now - _active_window()
+    touched = {}
+    for registered_schema, tokens in registry.items():
+        tokens = {key: seen for key, seen in tokens.items() if seen >= threshold}
+        if registered_schema == schema_id:
+            tokens[token] = now
+        if tokens:
+            freshest = sorted(tokens.items(), key=lambda item: item[1], reverse=True)[:MAX_TOKENS_PER_SCHEMA]
+            touched[registered_schema] = dict(freshest)
+
+    touched.setdefault(schema_id, {token: now})
+    return touched
+
+
+def register_session(schema_id, token: str):
+    """Отметить схему сессии активной для фонового опросчика"""
+    if not schema_id or not token:
+        return
+
+    registry = _touch(cache.get(ACTIVE_KEY) or {}, schema_id, token, time.time())
+    if registry is not None:
+        cache.set(ACTIVE_KEY, registry, _active_window())
+
+
+async def aregister_session(schema_id, token: str):
+    """Асинхронная версия register_session"""
+    if not schema_id or not token:
+        return
+
+    registry = _touch(await cache.aget(ACTIVE_KEY) or {}, schema_id, token, time.time())
+    if registry is not None:
+        await cache.aset(ACTIVE_KEY, registry, _active_window())
+
+
+def active_schema_tokens() -> Dict[str, List[str]]:
+    """
+    Токены активных схем (сначала самые свежие): схемы, для которых был вход
+    или запрос дашборда за последние AUTOGRAPH_FLEET_ACTIVE_WINDOW секунд
+    """
+    threshold = time.time() - _active_window()
+
+    schemas = OrderedDict()
+    for schema_id, tokens in (cache.get(ACTIVE_KEY) or {}).items():
+        fresh = sorted((seen, token) for token, seen in tokens.items() if seen >= threshold)
+        if fresh:
+            schemas[schema_id] = [token for _, token in reversed(fresh)]
+
+    return schemas
+
+
+def refresh_all_snapshots() -> int:
+    """Обновить снимки всех активных схем; возвращает число обновленных схем"""
+    if not getattr(settings, 'AUTOGRAPH_FLEET_POLLER_ENABLED', False):
+        logger.warning("⚠️ Опросчик снимков парка отключен: кэш не общий для воркеров (REDIS_CACHE_ENABLED)")
+        return 0
+
+    refreshed = 0
+
+    for schema_id, tokens in active_schema_tokens().items():
+        # Токен может быть просрочен в AutoGRAPH - пробуем следующий токен схемы
+        for token in tokens:
+            try:
+                snapshot = collect_snapshot(AutoGraphService(token=token), schema_id)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обновления снимка схемы {schema_id}: {e}")
+                continue
+
+            if snapshot['total']:
+                refreshed += 1
+                break
+        else:
+            logger.warning(f"⚠️ Не удалось обновить снимок схемы {schema_id}")
+
+    logger.info(f"🚚 Снимки парка обновлены: {refreshed} схем")
+    return refreshed
@@ -1,3 +1,176 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api import metadata_cache
+from dashboard import fuel_keys, live, snapshots
+from dashboard.services import AutoGraphService
+
+
+class FleetSnapshotTests(TestCase):
+    """Тесты снимков состояния парка"""
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['autograph_token'] = 'token-1'
+        session['autograph_schema_id'] = 'schema-1'
+        session.save()
+
+    def test_dashboard_api_served_from_snapshot(self):
+        """При наличии снимка API дашборда не обращается к AutoGRAPH"""
+        snapshot = {'vehicles': [], 'total': 3, 'online': 1, 'warning': 1, 'offline': 1}
+        cache.set(snapshots.snapshot_key('schema-1'), snapshot)
+
+        with mock.patch('dashboard.snapshots.collect_snapshot') as collect:
+            response = self.client.get('/dashboard/api/')
+
+        collect.assert_not_called()
+        self.assertEqual(response.json()['data']['total'], 3)
+
+    def test_snapshot_versions_and_delta(self):
+        """Версия растет только при изменениях; since отдает изменившиеся ТС, If-None-Match - 304"""
+        service = AutoGraphService(token='token-1')
+        devices = [
+            {'id': 'dev-1', 'name': 'ТС 1', 'reg_num': 'А001', 'serial': '1'},
+            {'id': 'dev-2', 'name': 'ТС 2', 'reg_num': 'А002', 'serial': '2'},
+        ]
+        first = snapshots._make_snapshot('schema-1', service, devices, {'dev-1': {'Speed': 10}, 'dev-2': {'Speed': 0}})
+        second = snapshots._make_snapshot('schema-1', service, devices, {'dev-1': {'Speed': 20}, 'dev-2': {'Speed': 0}}, first)
+        third = snapshots._make_snapshot('schema-1', service, devices, {'dev-1': {'Speed': 20}, 'dev-2': {'Speed': 0}}, second)
+
+        self.assertEqual((second['epoch'], second['number']), (first['epoch'], 2))
+        self.assertEqual(third['version'], second['version'])
+
+        cache.set(snapshots.snapshot_key('schema-1'), third)
+
+        response = self.client.get('/dashboard/api/', {'since': first['version']})
+        data = response.json()['data']
+        self.assertEqual(response['ETag'], f'"{third["version"]}"')
+        self.assertTrue(data['delta'])
+        self.assertEqual([vehicle['id'] for vehicle in data['vehicles']], ['dev-1'])
+        self.assertNotIn(snapshots.CHANGES_KEY, data)
+
+        self.assertEqual(len(self.client.get('/dashboard/api/', {'since': 'other.1'}).json()['data']['vehicles']), 2)
+
+        response = self.client.get('/dashboard/api/', HTTP_IF_NONE_MATCH=f'"{third["version"]}"')
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(AUTOGRAPH_FLEET_POLL_INTERVAL=0.01, AUTOGRAPH_LIVE_HEARTBEAT=0.05)
+    async def test_live_channel_pushes_snapshot_then_delta(self):
+        """Push-канал: снимок целиком, пинг без изменений, затем дельта; сообщение кодируется один раз"""
+        service = AutoGraphService(token='token-1')
+        devices = [
+            {'id': 'dev-1', 'name': 'ТС 1', 'reg_num': 'А001', 'serial': '1'},
+            {'id': 'dev-2', 'name': 'ТС 2', 'reg_num': 'А002', 'serial': '2'},
+        ]
+        first = snapshots._make_snapshot('schema-1', service, devices, {'dev-1': {'Speed': 10}, 'dev-2': {'Speed': 0}})
+        second = snapshots._make_snapshot('schema-1', service, devices, {'dev-1': {'Speed': 20}, 'dev-2': {'Speed': 0}}, first)
+        cache.set(snapshots.snapshot_key('schema-1'), first)
+
+        # Поток, который так и не начали читать, не подписывается
+        live.event_stream('schema-1', 'token-1')
+        self.assertEqual(live.subscriber_count(), 0)
+
+        stream = live.event_stream('schema-1', 'token-1')
+        other = live.event_stream('schema-1', 'token-1')
+        receive = lambda source: asyncio.wait_for(anext(source), timeout=2)
+
+        self.assertTrue((await receive(stream)).startswith(b'retry:'))
+        await receive(other)
+        message = await receive(stream)
+        self.assertTrue(message.startswith(f"id: {first['version']}\nevent: snapshot\n".encode()))
+        self.assertIs(await receive(other), message)
+        self.assertEqual(await receive(stream), b': ping\n\n')
+
+        cache.set(snapshots.snapshot_key('schema-1'), second)
+        message = await receive(stream)
+        self.assertTrue(message.startswith(f"id: {second['version']}\nevent: delta\n".encode()))
+        self.assertIn(b'"dev-1"', message)
+        self.assertNotIn(b'"dev-2"', message)
+
+        await stream.aclose()
+        await other.aclose()
+        self.assertEqual(live.subscriber_count(), 0)
+
+    def test_active_schema_tokens_registry(self):
+        """Опросчик берет схемы и токены из реестра запросов дашборда; неактивные выпадают"""
+        cache.set(snapshots.snapshot_key('schema-1'), {'vehicles': [], 'total': 0})
+        self.client.get('/dashboard/api/')
+        with mock.patch('dashboard.snapshots.time.time', return_value=snapshots.time.time() + 120):
+            snapshots.register_session('schema-1', 'token-2')
+            self.assertEqual(snapshots.active_schema_tokens(), {'schema-1': ['token-2', 'token-1']})
+
+        with mock.patch('dashboard.snapshots.time.time', return_value=snapshots.time.time() + 3600):
+            self.assertEqual(snapshots.active_schema_tokens(), {})
+
+    def test_poller_requires_shared_cache(self):
+        """С кэшем в памяти процесса опросчик не запрашивает AutoGRAPH"""
+        snapshots.register_session('schema-1', 'token-1')
+        collected = {'vehicles': [], 'total': 1}
+
+        with mock.patch('dashboard.snapshots.collect_snapshot', return_value=collected) as collect:
+            self.assertEqual(snapshots.refresh_all_snapshots(), 0)
+            collect.assert_not_called()
+
+            with override_settings(AUTOGRAPH_FLEET_POLLER_ENABLED=True):
+                self.assertEqual(snapshots.refresh_all_snapshots(), 1)
+
+
+class FuelKeyClassifierTests(TestCase):
+    """Тесты классификатора параметров топлива"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_extract_fuel_data_by_roles(self):
+        """Роли параметров Final: баки, общий уровень, процент; остальные только в raw_values"""
+        online = {'Final': {
+            'ДУТ1 объем': '120.5', 'Tank2Volume': 80, 'FL3': 'н/д',
+            'TankMainFuelLevel': 150, 'FuelLevelPercent': 55, 'Speed': 40
+        }}
+
+        fuel = AutoGraphService(token='token').extract_fuel_data(online, fuel_keys.for_schema('schema-1'))
+
+        self.assertEqual((fuel['tank1_volume'], fuel['tank2_volume'], fuel['tanks_count']), (120.5, 80.0, 2))
+        self.assertEqual(fuel['total_volume'], 200.5)
+        self.assertEqual(fuel['fuel_level_percent'], 55.0)
+        self.assertEqual(fuel['raw_values']['Speed'], 40)
+        self.assertEqual(fuel_keys.classify('FuelLevelPercent'), fuel_keys.PERCENT)
+        self.assertIsNone(fuel_keys.classify('Speed'))
+
+    def test_classifier_rebuilt_after_schema_invalidation(self):
+        """Классификатор схемы запоминается и строится заново после смены справочников схемы"""
+        classifier = fuel_keys.for_schema('schema-1')
+        classifier.role('Tank1')
+
+        self.assertIs(fuel_keys.for_schema('schema-1'), classifier)
+        self.assertEqual(len(classifier), 1)
+
+        metadata_cache.invalidate_schema('schema-1')
+        self.assertIsNot(fuel_keys.for_schema('schema-1'), classifier)
+
+    def test_dashboard_requests_only_fuel_final_params(self):
+        """Дашборд запрашивает в Final только параметры топлива; без описания параметров - все, без топлива - один"""
+        service = AutoGraphService(token='token')
+        parameters = {
+            'dev-1': {'FinalParams': [{'Name': 'Speed'}, {'Name': 'ДУТ1'}]},
+            'dev-2': {'FinalParams': [{'Name': 'FuelLevelPercent'}, {'Name': 'Address'}]},
+        }
+
+        with mock.patch.object(service, '_request_json', return_value=parameters) as request:
+            self.assertEqual(service.dashboard_final_params('schema-1', ['dev-1', 'dev-2']), 'FuelLevelPercent,ДУТ1')
+            self.assertEqual(service.dashboard_final_params('schema-1', ['dev-2', 'dev-1']), 'FuelLevelPercent,ДУТ1')
+            self.assertEqual(request.call_count, 1)
+
+            # Описания параметров dev-3 нет - состав Final неизвестен
+            self.assertEqual(service.dashboard_final_params('schema-1', ['dev-1', 'dev-3']), '*')
+
+        # Параметры описаны, топлива нет - Final целиком не нужен
+        parameters['dev-4'] = {'FinalParams': [{'Name': 'Speed'}, {'Name': 'Address'}]}
+        with mock.patch.object(service, '_request_json', return_value=parameters):
+            self.assertEqual(service.dashboard_final_params('schema-1', ['dev-4']), 'Address')
+
+        self.assertEqual(service._online_request_params('schema-1', ['dev-1'], 'ДУТ1')['finalParams'], 'ДУТ1')
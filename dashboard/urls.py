@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -5,5 +6,10 @@ app_name = 'dashboard'
 
 urlpatterns = [
     path('', views.dashboard_view, name='dashboard'),
-    path('api/', views.dashboard_api_view, name='api_dashboard'),
-]
\ No newline at end of file
+    path('api/', views.dashboard_api_async_view if settings.AUTOGRAPH_ASYNC_VIEWS else views.dashboard_api_view,
+         name='api_dashboard'),
+]
+
+if settings.AUTOGRAPH_ASYNC_VIEWS and settings.AUTOGRAPH_LIVE_UPDATES_ENABLED:
+    # SSE держит соединение открытым - только под ASGI
+    urlpatterns.append(path('live/', views.dashboard_live_view, name='live'))
@@ -1,8 +1,12 @@
 # dashboard/views.py
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
 import logging
 from datetime import datetime
+from api.fastjson import FastJsonResponse
+from . import live, snapshots
 from .services import AutoGraphService
 
 logger = logging.getLogger(__name__)
@@ -62,6 +66,7 @@ def dashboard_view(request):
         'current_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'schema_name': request.session.get('autograph_schema_name', 'Неизвестно'),
         'username': request.session.get('autograph_username', 'Пользователь'),
+        'live_updates': settings.AUTOGRAPH_ASYNC_VIEWS and settings.AUTOGRAPH_LIVE_UPDATES_ENABLED,
     })
 
 
@@ -71,109 +76,95 @@ def dashboard_api_view(request):
     schema_id = request.session.get('autograph_schema_id')
 
     if not token or not schema_id:
-        return JsonResponse({'success': False, 'error': 'Требуется авторизация'}, status=401)
+        return FastJsonResponse({'success': False, 'error': 'Требуется авторизация'}, status=401)
 
     try:
-        service = AutoGraphService(token=token)
-
-        # 1. Получаем все устройства
-        devices = service.get_devices(schema_id)
-
-        if not devices:
-            return JsonResponse({
-                'success': True,
-                'data': {
-                    'vehicles': [],
-                    'total': 0,
-                    'online': 0,
-                    'warning': 0,
-                    'offline': 0,
-                }
-            })
-
-        # 2. Получаем онлайн данные для ВСЕХ устройств
-        device_ids = [d['id'] for d in devices]
-        online_data = service.get_online_data(schema_id, device_ids)
-
-        # 3. Формируем данные для дашборда
-        vehicles = []
-        stats = {'total': 0, 'online': 0, 'warning': 0, 'offline': 0}
-
-        for device in devices:
-            device_id = device['id']
-            online = online_data.get(device_id) if isinstance(online_data, dict) else None
-
-            # Определяем статус
-            status = 'offline'
-            if online:
-                # Проверяем скорость
-                speed = 0
-                if 'Speed' in online:
-                    try:
-                        speed = float(online['Speed'])
-                    except:
-                        pass
-
-                if speed > 1:  # Если движется
-                    status = 'online'
-                else:  # Если стоит
-                    status = 'warning'
-
-            stats[status] += 1
-            stats['total'] += 1
-
-            # Скорость
-            speed = 0
-            if online and 'Speed' in online:
-                try:
-                    speed = float(online['Speed'])
-                except:
-                    pass
-
-            # Топливо - используем существующий метод
-            fuel_volume = 0
-            if online:
-                fuel_data = service.extract_fuel_data(online)
-                fuel_volume = fuel_data.get('total_volume', 0)
-
-            # Адрес
-            address = online.get('Address', '') if online else ''
-
-            # Время обновления
-            last_update = ''
-            if online:
-                for field in ['DTLocal', 'DT', '_LastDataLocal']:
-                    if field in online and online[field]:
-                        last_update = online[field]
-                        break
-
-            vehicles.append({
-                'id': device_id,
-                'name': device['name'],
-                'license_plate': device['reg_num'],
-                'serial': device['serial'],
-                'status': status,
-                'speed': speed,
-                'fuel_volume': fuel_volume,  # Объем топлива в литрах
-                'address': address,
-                'last_update': last_update,
-            })
-
-        return JsonResponse({
-            'success': True,
-            'data': {
-                'vehicles': vehicles,
-                'total': stats['total'],
-                'online': stats['online'],
-                'warning': stats['warning'],
-                'offline': stats['offline'],
-                'timestamp': datetime.now().isoformat(),
-            }
-        })
+        # Снимок парка обновляет фоновый опросчик; без него - запрашиваем и сохраняем сами
+        snapshots.register_session(schema_id, token)
+        data = snapshots.get_snapshot(schema_id)
+        if data is None:
+            data = snapshots.collect_snapshot(AutoGraphService(token=token), schema_id)
+
+        return _snapshot_response(request, data)
+
+    except Exception as e:
+        logger.error(f"Ошибка API дашборда: {e}")
+        return FastJsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+async def dashboard_api_async_view(request):
+    """API для получения данных дашборда (асинхронная версия для ASGI)"""
+    token = await request.session.aget('autograph_token')
+    schema_id = await request.session.aget('autograph_schema_id')
+
+    if not token or not schema_id:
+        return FastJsonResponse({'success': False, 'error': 'Требуется авторизация'}, status=401)
+
+    try:
+        await snapshots.aregister_session(schema_id, token)
+        data = await snapshots.aget_snapshot(schema_id)
+        if data is None:
+            data = await snapshots.acollect_snapshot(AutoGraphService(token=token), schema_id)
+
+        return _snapshot_response(request, data)
 
     except Exception as e:
         logger.error(f"Ошибка API дашборда: {e}")
-        return JsonResponse({
+        return FastJsonResponse({
             'success': False,
             'error': str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+
+async def dashboard_live_view(request):
+    """Push-канал состояния парка (Server-Sent Events): снимок, затем дельты при изменениях"""
+    token = await request.session.aget('autograph_token')
+    schema_id = await request.session.aget('autograph_schema_id')
+
+    if not token or not schema_id:
+        return FastJsonResponse({'success': False, 'error': 'Требуется авторизация'}, status=401)
+
+    if live.at_capacity():
+        logger.warning(f"⚠️ Push-канал: превышен предел подписчиков, схема {schema_id}")
+        response = FastJsonResponse({'success': False, 'error': 'Сервер перегружен'}, status=503)
+        response['Retry-After'] = str(int(settings.AUTOGRAPH_FLEET_POLL_INTERVAL))
+        return response
+
+    # Переподключение EventSource: дельта от последней полученной версии
+    last_version = request.headers.get('Last-Event-ID') or request.GET.get('since')
+
+    response = StreamingHttpResponse(
+        live.event_stream(schema_id, token, last_version),
+        content_type='text/event-stream; charset=utf-8'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _snapshot_response(request, snapshot):
+    """
+    Ответ API дашборда по снимку: 304, если версия снимка совпадает с If-None-Match;
+    с параметром since - только ТС, изменившиеся после этой версии
+    """
+    version = snapshot.get('version')
+    etag = f'"{version}"' if version else None
+
+    if etag:
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in client_etags or '*' in client_etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+    response = FastJsonResponse({
+        'success': True,
+        'data': snapshots.snapshot_payload(snapshot, request.GET.get('since'))
+    })
+    if etag:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,12 +1,14 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import JsonResponse
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from api.fastjson import FastJsonResponse
 from vehicles.services import AutoGraphService
 from vehicles.services_enhanced import EnhancedAutoGraphService
+from vehicles.concurrency import run_bounded
 import logging
 from datetime import datetime, timedelta
 import json
@@ -87,13 +89,13 @@ class GenerateReportAPI(View):
             end_date = data.get('end_date')
 
             if not report_type:
-                return JsonResponse({
+                return FastJsonResponse({
                     "success": False,
                     "error": "Не указан тип отчета"
                 })
 
             if not vehicle_ids:
-                return JsonResponse({
+                return FastJsonResponse({
                     "success": False,
                     "error": "Не выбраны транспортные средства"
                 })
@@ -103,7 +105,7 @@ class GenerateReportAPI(View):
                 report_type, vehicle_ids, start_date, end_date
             )
 
-            return JsonResponse({
+            return FastJsonResponse({
                 "success": True,
                 "data": report_data,
                 "report_info": {
@@ -115,7 +117,7 @@ class GenerateReportAPI(View):
 
         except Exception as e:
             logger.error(f"GenerateReportAPI error: {e}")
-            return JsonResponse({
+            return FastJsonResponse({
                 "success": False,
                 "error": f"Ошибка генерации отчета: {str(e)}"
             })
@@ -139,31 +141,60 @@ class GenerateReportAPI(View):
         report_data = {
             "summary": {},
             "details": [],
-            "vehicles": []
+            "vehicles": [],
+            "failed": [],
+            "partial": False
         }
 
-        # Собираем данные по каждому ТС
-        for vehicle_id in vehicle_ids:
+        def collect_vehicle(vehicle_id):
+            # Ошибка ТС не прерывает отчет: ('error', текст) вместо исключения
             try:
-                # Получаем комплексные данные для ТС
-                comprehensive_data = enhanced_service.get_comprehensive_vehicle_data(
+                return 'ok', enhanced_service.get_comprehensive_vehicle_data(
                     schema_id, vehicle_id, start_date, end_date
                 )
+            except Exception as e:
+                logger.error(f"Error processing vehicle {vehicle_id}: {e}")
+                return 'error', str(e)
+
+        # Данные ТС собираются параллельно: время отчета - около самого медленного ТС, а не сумма
+        timeout = getattr(settings, 'REPORT_VEHICLE_TIMEOUT', 60)
+        results = run_bounded(
+            collect_vehicle, vehicle_ids,
+            max_workers=getattr(settings, 'REPORT_MAX_WORKERS', 8),
+            timeout=timeout
+        )
+
+        for vehicle_id, result in zip(vehicle_ids, results):
+            if result is None:
+                report_data["failed"].append({'id': vehicle_id, 'error': f'Превышено время ожидания ({timeout} сек)'})
+                continue
+
+            outcome, comprehensive_data = result
+            if outcome == 'error':
+                report_data["failed"].append({'id': vehicle_id, 'error': comprehensive_data})
+                continue
 
-                if comprehensive_data and comprehensive_data.get('basic_info'):
+            if comprehensive_data and comprehensive_data.get('basic_info'):
+                try:
                     vehicle_report = self._format_vehicle_report(
                         report_type, comprehensive_data, vehicle_id
                     )
-                    report_data["details"].append(vehicle_report)
-                    report_data["vehicles"].append({
-                        'id': vehicle_id,
-                        'name': comprehensive_data['basic_info'].get('name', 'Unknown'),
-                        'license_plate': comprehensive_data['basic_info'].get('license_plate', 'Unknown')
-                    })
+                except Exception as e:
+                    logger.error(f"Error processing vehicle {vehicle_id}: {e}")
+                    report_data["failed"].append({'id': vehicle_id, 'error': str(e)})
+                    continue
+
+                report_data["details"].append(vehicle_report)
+                report_data["vehicles"].append({
+                    'id': vehicle_id,
+                    'name': comprehensive_data['basic_info'].get('name', 'Unknown'),
+                    'license_plate': comprehensive_data['basic_info'].get('license_plate', 'Unknown')
+                })
 
-            except Exception as e:
-                logger.error(f"Error processing vehicle {vehicle_id}: {e}")
-                continue
+        # Частичный отчет: данные по остальным ТС отдаются, неполученные перечислены в failed
+        report_data["partial"] = bool(report_data["failed"])
+        if report_data["partial"]:
+            logger.warning(f"⚠️ Отчет {report_type}: нет данных по {len(report_data['failed'])} из {len(vehicle_ids)} ТС")
 
         # Рассчитываем сводную статистику
         report_data["summary"] = self._calculate_summary_stats(report_data["details"], report_type)
@@ -3,27 +3,23 @@ import requests
 import logging
 from typing import Optional, Dict, Any
 
+from api import fastjson
+from api.transport import get_transport
+
 logger = logging.getLogger(__name__)
 
 
 class AutoGraphAPIClient:
     """Клиент для работы с AutoGRAPH API"""
 
-    BASE_URL = "https://web.tk-ekat.ru/ServiceJSON"
-
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Accept': 'application/json',
-            'User-Agent': 'Django-Monitoring-App/1.0'
-        })
+        self.transport = get_transport()
 
     def login(self, username: str, password: str, utc_offset: int = 300) -> Optional[str]:
         """
         Аутентификация в AutoGRAPH API
         Возвращает токен сессии или None
         """
-        url = f"{self.BASE_URL}/Login"
         params = {
             'UserName': username,
             'Password': password,
@@ -33,7 +29,7 @@ class AutoGraphAPIClient:
         try:
             logger.info(f"🔐 AutoGRAPH login attempt for user: {username}")
 
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get('Login', params=params, verify=True)
 
             if response.status_code == 200 and response.text.strip():
                 token = response.text.strip()
@@ -59,8 +55,6 @@ class AutoGraphAPIClient:
 
     def make_request(self, endpoint: str, params: Dict[str, Any] = None, token: str = None) -> Optional[Dict]:
         """Выполнить запрос к AutoGRAPH API"""
-        url = f"{self.BASE_URL}/{endpoint}"
-
         if params is None:
             params = {}
 
@@ -71,11 +65,11 @@ class AutoGraphAPIClient:
             logger.debug(f"🌐 AutoGRAPH API request: {endpoint}")
             logger.debug(f"Params: {params}")
 
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get(endpoint, params=params)
 
             if response.status_code == 200:
                 try:
-                    return response.json()
+                    return fastjson.parse_response(response)
                 except ValueError as e:
                     logger.error(f"❌ JSON decode error for {endpoint}: {e}")
                     logger.debug(f"Response text: {response.text[:500]}")
@@ -1,10 +1,12 @@
 # users/backend.py
 from django.contrib.auth.backends import BaseBackend
-from django.conf import settings
 import logging
 import requests
 import hashlib
 
+from api import fastjson
+from api.transport import get_transport
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,14 +27,13 @@ class AutoGraphAuthBackend(BaseBackend):
                 self._clear_session_cache(request.session)
 
             # Прямой вызов API AutoGRAPH
-            api_url = f"{settings.AUTOGRAPH_API_BASE_URL}/ServiceJSON/Login"
             params = {
                 'UserName': username,
                 'Password': password,
                 'UTCOffset': 180  # Moscow UTC+3
             }
 
-            response = requests.get(api_url, params=params, timeout=30)
+            response = get_transport().get('Login', params=params, verify=True)
 
             if response.status_code == 200 and response.text.strip():
                 token = response.text.strip()
@@ -58,6 +59,10 @@ class AutoGraphAuthBackend(BaseBackend):
                     request.session['autograph_schema_name'] = first_schema['name']
                     logger.info(f"📋 Auto-selected schema: {first_schema['name']} (ID: {first_schema['id']})")
 
+                    # Схема сразу попадает в опрос снимков парка
+                    from dashboard import snapshots
+                    snapshots.register_session(first_schema['id'], token)
+
                 # Возвращаем объект пользователя
                 user = SimpleUser(username)
                 user.autograph_token = token
@@ -82,13 +87,12 @@ class AutoGraphAuthBackend(BaseBackend):
     def _get_user_schemas(self, token):
         """Получить доступные схемы пользователя"""
         try:
-            api_url = f"{settings.AUTOGRAPH_API_BASE_URL}/ServiceJSON/EnumSchemas"
             params = {'session': token}
 
-            response = requests.get(api_url, params=params, timeout=30)
+            response = get_transport().get('EnumSchemas', params=params, verify=True)
 
             if response.status_code == 200:
-                schemas_data = response.json()
+                schemas_data = fastjson.parse_response(response)
                 logger.debug(f"Raw schemas response: {schemas_data}")
 
                 if isinstance(schemas_data, list):
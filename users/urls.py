@@ -1,6 +1,6 @@
 # users/urls.py
 from django.urls import path
-from .views import LoginView, logout_view, check_session, session_info
+from .views import LoginView, RefreshSchemasView, logout_view, check_session, session_info
 
 app_name = 'users'
 
@@ -9,4 +9,5 @@ urlpatterns = [
     path('logout/', logout_view, name='logout'),
     path('check-session/', check_session, name='check_session'),
     path('session-info/', session_info, name='session_info'),
+    path('refresh-schemas/', RefreshSchemasView.as_view(), name='refresh_schemas'),
 ]
\ No newline at end of file
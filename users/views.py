@@ -533,8 +533,15 @@ class RefreshSchemasView(View):
 
             logger.info(f"🔄 User {username} requested schema refresh")
 
-            from dashboard.services import AutoGraphDashboardService
-            service = AutoGraphDashboardService(token=token)
+            # Сбрасываем кэш справочников: список схем пользователя и устройства/параметры текущей схемы
+            from api import metadata_cache
+            current_schema_id = request.session.get('autograph_schema_id')
+            metadata_cache.invalidate_user(token)
+            if current_schema_id:
+                metadata_cache.invalidate_schema(current_schema_id)
+
+            from dashboard.services import AutoGraphService
+            service = AutoGraphService(token=token)
             schemas = service.get_schemas()
 
             if not schemas:
@@ -545,14 +552,14 @@ class RefreshSchemasView(View):
 
             # Обновляем схемы в сессии
             request.session['autograph_schemas'] = schemas
+            request.session['available_schemas'] = schemas
 
             # Если текущая схема больше не существует, выбираем первую
-            current_schema_id = request.session.get('autograph_schema_id')
-            current_schema_exists = any(str(schema.get('ID')) == str(current_schema_id) for schema in schemas)
+            current_schema_exists = any(str(schema.get('id')) == str(current_schema_id) for schema in schemas)
 
             if not current_schema_exists and schemas:
-                request.session['autograph_schema_id'] = schemas[0].get('ID')
-                request.session['autograph_schema_name'] = schemas[0].get('Name', 'Без названия')
+                request.session['autograph_schema_id'] = schemas[0].get('id')
+                request.session['autograph_schema_name'] = schemas[0].get('name', 'Без названия')
 
             logger.info(f"✅ Schemas refreshed for {username}: Found {len(schemas)} schemas")
 
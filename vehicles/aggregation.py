@@ -0,0 +1,133 @@
+"""
+Агрегация временных рядов по интервалам (pandas/numpy)
+
+Записи ряда раскладываются в колонки (метки времени datetime64, ТС,
+по колонке float64 на параметр), номер интервала считается одной
+векторной операцией над int64-наносекундами, группировка и агрегирование
+выполняются groupby pandas. Поддерживаются функции mean/min/max/sum/last/count,
+произвольная ширина интервала ('5min', '15min', '8h', '1D') и сдвиг начала
+(например, '8h' - смены с 08:00), группировка по ТС или по всем ТС вместе.
+"""
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .timeseries import parse_numeric
+
+logger = logging.getLogger(__name__)
+
+AGGREGATIONS = ('mean', 'min', 'max', 'sum', 'last', 'count')
+
+# Стандартные разрешения: ширина интервала и формат метки
+RESOLUTION_WIDTHS = {
+    'minute': '1min',
+    'hour': '1h',
+    'day': '1D',
+}
+KEY_FORMATS = {
+    'minute': '%Y-%m-%d %H:%M:00',
+    'hour': '%Y-%m-%d %H:00:00',
+    'day': '%Y-%m-%d',
+}
+CUSTOM_KEY_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def bucket_spec(resolution: str = 'minute', bucket: str = None, offset: str = None) -> Tuple[pd.Timedelta, pd.Timedelta, str]:
+    """(ширина, сдвиг, формат метки) интервала; ValueError - некорректная ширина или сдвиг"""
+    if bucket is None and not offset:
+        width = RESOLUTION_WIDTHS.get(resolution, RESOLUTION_WIDTHS['minute'])
+        key_format = KEY_FORMATS.get(resolution, KEY_FORMATS['minute'])
+    else:
+        width = bucket or RESOLUTION_WIDTHS.get(resolution, RESOLUTION_WIDTHS['minute'])
+        key_format = CUSTOM_KEY_FORMAT
+
+    width, offset = pd.Timedelta(width), pd.Timedelta(offset or 0)
+    if width <= pd.Timedelta(0):
+        raise ValueError(f"Некорректная ширина интервала: {bucket}")
+
+    return width, offset, key_format
+
+
+def records_frame(records: List[Dict], params: List[str]) -> pd.DataFrame:
+    """Записи API -> DataFrame: timestamp (datetime64), vehicle_id, vehicle_name и колонки параметров float64"""
+    frame = pd.DataFrame.from_records(
+        [point.get('values') or {} for point in records],
+        columns=params,
+        nrows=len(records)
+    )
+    for param in params:
+        column = frame[param]
+        if column.dtype == object:
+            # Смешанная колонка: числа строками с запятой и текст (длительности) - как в TimeSeriesFrame
+            column = column.map(parse_numeric, na_action='ignore')
+        frame[param] = pd.to_numeric(column, errors='coerce')
+
+    frame['timestamp'] = pd.to_datetime(
+        pd.Series([point.get('timestamp') or None for point in records], dtype=object),
+        errors='coerce', format='ISO8601'
+    )
+    frame['vehicle_id'] = [point.get('vehicle_id', '') for point in records]
+    frame['vehicle_name'] = [point.get('vehicle_name', point.get('vehicle', '')) for point in records]
+    return frame
+
+
+def aggregate(frame: pd.DataFrame, params: List[str], how: str = 'mean', width: pd.Timedelta = pd.Timedelta('1min'),
+              offset: pd.Timedelta = pd.Timedelta(0), key_format: str = KEY_FORMATS['minute'],
+              by_vehicle: bool = True) -> List[Dict]:
+    """
+    Агрегирование по интервалам: [{'timestamp', ('vehicle_id', 'vehicle_name'), 'values'}],
+    отсортировано по интервалу (и ТС). В values - только параметры со значениями в интервале.
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Неизвестная функция агрегации: {how}")
+
+    frame = frame[frame['timestamp'].notna()]
+    if frame.empty:
+        return []
+
+    # Начало интервала: floor((t - сдвиг) / ширина) * ширина + сдвиг в наносекундах
+    nanoseconds = frame['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    step, shift = width.value, offset.value
+    bucket_index = (nanoseconds - shift) // step
+    first_bucket = bucket_index.min()
+
+    # Один целочисленный ключ группы (интервал, ТС) - groupby без сравнения строк
+    if by_vehicle:
+        vehicle_codes, vehicle_ids = pd.factorize(frame['vehicle_id'], sort=True)
+        group_keys = (bucket_index - first_bucket) * len(vehicle_ids) + vehicle_codes
+        _, first_rows = np.unique(vehicle_codes, return_index=True)
+        vehicle_names = frame['vehicle_name'].to_numpy()[first_rows].tolist()
+    else:
+        vehicle_ids = []
+        group_keys = bucket_index - first_bucket
+
+    result = frame[params].groupby(group_keys, sort=True).agg(how)
+
+    keys = result.index.to_numpy()
+    vehicle_count = max(len(vehicle_ids), 1)
+    starts = ((keys // vehicle_count + first_bucket) * step + shift).astype('datetime64[ns]')
+    labels = pd.DatetimeIndex(starts).strftime(key_format).tolist()
+    codes = (keys % vehicle_count).tolist()
+
+    # Значения одной матрицей: дальше только сборка словарей по интервалам
+    matrix = result.to_numpy(dtype=np.float64)
+    as_int = how == 'count'
+
+    points = []
+    for i, row in enumerate(matrix.tolist()):
+        values = {}
+        for param, value in zip(params, row):
+            if value != value or (as_int and not value):  # NaN или нет значений
+                continue
+            values[param] = int(value) if as_int else round(value, 4)
+
+        point = {'timestamp': labels[i]}
+        if by_vehicle:
+            point['vehicle_id'] = vehicle_ids[codes[i]]
+            point['vehicle_name'] = vehicle_names[codes[i]]
+        point['values'] = values
+        points.append(point)
+
+    return points
@@ -0,0 +1,178 @@
+"""
+Ограниченный параллелизм для запросов к AutoGRAPH API
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов (token bucket)"""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Забрать токен; возвращает время ожидания (0 - токен получен)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Ожидание свободного токена"""
+        if not self.rate or self.rate <= 0:
+            return
+
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Ожидание свободного токена без блокировки event loop"""
+        if not self.rate or self.rate <= 0:
+            return
+
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+_buckets = {}  # (ключ, rate, capacity) -> TokenBucket
+_buckets_lock = threading.Lock()
+
+
+def shared_bucket(key: tuple, rate: float, capacity: int = 1) -> TokenBucket:
+    """
+    Ограничитель частоты, общий для процесса: все сервисы с одним ключом
+    (например, адрес API и схема) делят один token bucket, поэтому
+    одновременные запросы пользователей вместе не превышают rate
+    """
+    bucket_key = (key, rate, capacity)
+    bucket = _buckets.get(bucket_key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(bucket_key, TokenBucket(rate=rate, capacity=capacity))
+    return bucket
+
+
+def run_bounded(func: Callable[[Any], Any], items: Iterable[Any], max_workers: int = 4,
+                rate_limiter: Optional[TokenBucket] = None, timeout: Optional[float] = None) -> List[Any]:
+    """
+    Выполнение func(item) для каждого элемента с ограниченным параллелизмом.
+    Результаты возвращаются в порядке items, для упавших задач - None.
+    timeout - предел выполнения одной задачи (секунды): результат просроченной
+    задачи - None, и ее завершения вызывающий не ждет.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def _call(item):
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            return func(item)
+        except Exception as e:
+            logger.error(f"❌ Ошибка параллельной задачи: {e}")
+            return None
+
+    workers = max(1, min(max_workers, len(items)))
+    if timeout:
+        return _run_with_timeout(_call, items, workers, timeout)
+
+    if workers == 1:
+        return [_call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_call, items))
+
+
+def _run_with_timeout(call: Callable[[Any], Any], items: List[Any], workers: int, timeout: float) -> List[Any]:
+    """
+    run_bounded с пределом времени задачи, отсчитываемым от ее запуска в пуле.
+    Зависшая задача занимает поток, и очередь за ней не запускается, поэтому
+    есть и общий предел: timeout на каждую волну пула (ceil(задач / потоков)).
+    По его истечении все незавершенные задачи считаются неудачными.
+    """
+    started = {}
+
+    def _timed(index):
+        started[index] = time.monotonic()
+        return call(items[index])
+
+    results = [None] * len(items)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {executor.submit(_timed, index): index for index in range(len(items))}
+    pending = set(futures)
+    limit = timeout * math.ceil(len(items) / workers)
+    deadline = time.monotonic() + limit
+
+    try:
+        while pending:
+            deadlines = [started[futures[future]] + timeout for future in pending if futures[future] in started]
+            wait_time = max(0.0, min(deadlines + [deadline]) - time.monotonic())
+            done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                results[futures[future]] = future.result()
+
+            now = time.monotonic()
+            if now >= deadline and pending:
+                logger.warning(f"⏱️ Общий предел {limit} сек истек: не завершено {len(pending)} задач из {len(items)}")
+                break
+
+            expired = {
+                future for future in pending
+                if futures[future] in started and now - started[futures[future]] >= timeout
+            }
+            for future in expired:
+                logger.warning(f"⏱️ Параллельная задача {futures[future]} не уложилась в {timeout} сек")
+            pending -= expired
+    finally:
+        # Просроченные задачи дорабатывают в фоне, незапущенные отменяются
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
+async def gather_bounded(func: Callable[[Any], Awaitable[Any]], items: Iterable[Any], max_workers: int = 4,
+                         rate_limiter: Optional[TokenBucket] = None) -> List[Any]:
+    """Асинхронный аналог run_bounded: не более max_workers корутин одновременно"""
+    items = list(items)
+    if not items:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def _call(item):
+        async with semaphore:
+            if rate_limiter:
+                await rate_limiter.acquire_async()
+            try:
+                return await func(item)
+            except Exception as e:
+                logger.error(f"❌ Ошибка параллельной задачи: {e}")
+                return None
+
+    return list(await asyncio.gather(*(_call(item) for item in items)))
@@ -0,0 +1,125 @@
+"""
+Прореживание временных рядов для графиков (max_points)
+
+Каждый ряд (ТС x параметр) прореживается отдельно до max_points точек:
+- 'lttb' - Largest-Triangle-Three-Buckets: из каждой корзины выбирается
+  точка, образующая наибольший треугольник с предыдущей выбранной точкой
+  и средней точкой следующей корзины (форма линии сохраняется);
+- 'minmax' - огибающая: минимум и максимум каждой корзины (пики не теряются).
+Первая и последняя точки ряда сохраняются. В ответ попадают записи,
+выбранные хотя бы для одного параметра, и только выбранные значения.
+Полные данные остаются доступны через экспорт.
+"""
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+from .aggregation import records_frame
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('lttb', 'minmax')
+MIN_POINTS = 3
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Индексы точек, выбранных LTTB (x возрастает)"""
+    size = len(x)
+    if threshold >= size or threshold < MIN_POINTS:
+        return np.arange(size)
+
+    # Корзины равного числа точек между первой и последней точкой
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else size
+        if next_start >= next_end:
+            next_start, next_end = size - 1, size
+
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        # Удвоенная площадь треугольника (предыдущая точка, кандидат, среднее следующей корзины)
+        areas = np.abs(
+            (x[previous] - average_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (average_y - y[previous])
+        )
+        previous = start + int(areas.argmax()) if end > start else previous
+        selected[i + 1] = previous
+
+    return np.unique(selected)
+
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Индексы минимума и максимума каждой корзины (плюс первая и последняя точки)"""
+    size = len(y)
+    if threshold >= size or threshold < MIN_POINTS:
+        return np.arange(size)
+
+    buckets = max((threshold - 2) // 2, 1)
+    segments = np.minimum(np.arange(size) * buckets // size, buckets - 1)
+
+    # Внутри корзины точки упорядочены по значению: первая - минимум, последняя - максимум
+    order = np.lexsort((y, segments))
+    bounds = np.searchsorted(segments[order], np.arange(buckets + 1))
+    first, last = bounds[:-1], bounds[1:] - 1
+    present = last >= first
+
+    return np.unique(np.concatenate([
+        [0, size - 1], order[first[present]], order[last[present]]
+    ]))
+
+
+def downsample_records(records: List[Dict], params: List[str], max_points: int, method: str = 'lttb') -> List[Dict]:
+    """Прореживание записей API по каждому ряду ТС x параметр до max_points точек"""
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод прореживания: {method}")
+    if not max_points or max_points < MIN_POINTS:
+        raise ValueError(f"max_points должен быть не меньше {MIN_POINTS}")
+
+    if len(records) <= max_points or not params:
+        return records
+
+    frame = records_frame(records, params)
+    x = frame['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64).astype(np.float64)
+    valid_time = frame['timestamp'].notna().to_numpy()
+    vehicle_codes = frame['vehicle_id'].factorize()[0]
+
+    columns = {param: frame[param].to_numpy() for param in params}
+    selected = {param: np.zeros(len(records), dtype=bool) for param in params}
+
+    for code in range(vehicle_codes.max() + 1):
+        rows = np.flatnonzero((vehicle_codes == code) & valid_time)
+
+        for param in params:
+            column = columns[param]
+            points = rows[~np.isnan(column[rows])]
+            if len(points) > max_points:
+                if method == 'lttb':
+                    points = points[lttb_indices(x[points], column[points], max_points)]
+                else:
+                    points = points[minmax_indices(column[points], max_points)]
+            selected[param][points] = True
+
+    # Нечисловые параметры (длительности и т.п.) не прореживаются и остаются в выбранных записях
+    plotted = {param for param in params if selected[param].any()}
+    keep = np.zeros(len(records), dtype=bool)
+    for param in plotted:
+        keep |= selected[param]
+
+    result = []
+    for i in np.flatnonzero(keep).tolist():
+        record = records[i]
+        values = {
+            param: value for param, value in (record.get('values') or {}).items()
+            if param not in plotted or selected[param][i]
+        }
+        result.append({**record, 'values': values})
+
+    logger.info(f"📉 Прореживание {method}: {len(records)} -> {len(result)} записей (max_points={max_points})")
+    return result
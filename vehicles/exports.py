@@ -0,0 +1,248 @@
+"""
+Потоковый экспорт временных рядов
+
+Строки экспорта - кортежи (время, ТС, этап, {параметр: значение}) - берутся
+генератором из локальной истории (RawTrackData, курсор по времени) или из
+уже полученных записей API. Весь файл в памяти не собирается:
+- CSV пишется модулем csv (корректное экранирование) пачками строк;
+- Parquet и Arrow IPC (pyarrow) - пачками RecordBatch по COLUMNAR_BATCH_ROWS
+  строк: время - timestamp, параметры - float64 (нечисловые значения пустые);
+- XLSX - openpyxl в режиме write-only через временный файл.
+"""
+import csv
+import io
+import logging
+import tempfile
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from django.utils import timezone
+
+from .history_store import DT_FORMAT, day_bounds, schema_vehicles
+from .models import RawTrackData
+from .timeseries import parse_numeric
+
+logger = logging.getLogger(__name__)
+
+CSV_HEADERS = ['Время', 'ТС', 'Тип']
+CSV_BATCH_ROWS = 1000
+COLUMNAR_BATCH_ROWS = 10000
+XLSX_MAX_ROWS = 1048576
+
+ExportRow = Tuple[str, str, str, Dict]
+
+
+def stored_rows(schema_id: str, device_ids: List[str], start_date: date, end_date: date) -> Iterator[ExportRow]:
+    """Строки ТС схемы из локальной истории по времени (курсор БД, постоянная память)"""
+    start_dt, end_dt = day_bounds(start_date, end_date)
+
+    rows = RawTrackData.objects.filter(
+        vehicle__in=schema_vehicles(schema_id, device_ids),
+        timestamp__gte=start_dt,
+        timestamp__lt=end_dt
+    ).order_by('timestamp', 'vehicle_id').values_list('timestamp', 'vehicle__name', 'stage', 'parameters_json')
+
+    for timestamp, name, stage, values in rows.iterator(chunk_size=2000):
+        yield timezone.localtime(timestamp).strftime(DT_FORMAT), name, stage or 'Unknown', values
+
+
+def record_rows(records: Iterable[Dict]) -> Iterator[ExportRow]:
+    """Строки из записей API (формат AdvancedDataFormatter.format_for_timeseries)"""
+    for point in records:
+        yield (
+            point.get('timestamp', ''),
+            point.get('vehicle', point.get('vehicle_name', '')),
+            point.get('type', point.get('stage', '')),
+            point.get('values') or {}
+        )
+
+
+def _format_value(value) -> str:
+    if value is None or value == '':
+        return ''
+    number = parse_numeric(value)
+    if number is not None and number == number:
+        return f"{number:.4f}"
+    return str(value)
+
+
+def csv_stream(rows: Iterable[ExportRow], params: List[str]) -> Iterator[bytes]:
+    """CSV пачками по CSV_BATCH_ROWS строк"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def flush() -> bytes:
+        chunk = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk
+
+    writer.writerow(CSV_HEADERS + list(params))
+    count = 0
+
+    for timestamp, vehicle, stage, values in rows:
+        writer.writerow([timestamp, vehicle, stage] + [_format_value(values.get(param)) for param in params])
+        count += 1
+        if count % CSV_BATCH_ROWS == 0:
+            yield flush()
+
+    yield flush()
+    logger.info(f"📤 Экспорт CSV: {count} строк, {len(params)} параметров")
+
+
+class _ChunkSink:
+    """Файлоподобный приемник: записанные байты забираются пачками для потоковой отдачи"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema(params: List[str]):
+    import pyarrow as pa
+
+    return pa.schema(
+        [(CSV_HEADERS[0], pa.timestamp('s')), (CSV_HEADERS[1], pa.string()), (CSV_HEADERS[2], pa.string())]
+        + [(param, pa.float64()) for param in params]
+    )
+
+
+def _record_batches(rows: Iterable[ExportRow], params: List[str], schema) -> Iterator:
+    """RecordBatch по COLUMNAR_BATCH_ROWS строк"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    def build(timestamps, vehicles, stages, columns):
+        times = pc.strptime(pa.array(timestamps, pa.string()), format=DT_FORMAT, unit='s', error_is_null=True)
+        return pa.RecordBatch.from_arrays(
+            [times, pa.array(vehicles, pa.string()), pa.array(stages, pa.string())]
+            + [pa.array(columns[param], pa.float64()) for param in params],
+            schema=schema
+        )
+
+    timestamps, vehicles, stages = [], [], []
+    columns = {param: [] for param in params}
+
+    for timestamp, vehicle, stage, values in rows:
+        timestamps.append(timestamp)
+        vehicles.append(vehicle)
+        stages.append(stage)
+        for param in params:
+            columns[param].append(parse_numeric(values.get(param)))
+
+        if len(timestamps) >= COLUMNAR_BATCH_ROWS:
+            yield build(timestamps, vehicles, stages, columns)
+            timestamps, vehicles, stages = [], [], []
+            columns = {param: [] for param in params}
+
+    if timestamps:
+        yield build(timestamps, vehicles, stages, columns)
+
+
+def parquet_stream(rows: Iterable[ExportRow], params: List[str]) -> Iterator[bytes]:
+    """Parquet (сжатие zstd), группа строк на каждую пачку"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(params)
+
+    def generate():
+        sink = _ChunkSink()
+        count = 0
+        with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd') as writer:
+            for batch in _record_batches(rows, params, schema):
+                writer.write_batch(batch)
+                count += batch.num_rows
+                yield sink.drain()
+        yield sink.drain()
+        logger.info(f"📤 Экспорт Parquet: {count} строк, {len(params)} параметров")
+
+    return generate()
+
+
+def arrow_stream(rows: Iterable[ExportRow], params: List[str]) -> Iterator[bytes]:
+    """Arrow IPC file (Feather v2, сжатие zstd): читается pandas.read_feather"""
+    import pyarrow as pa
+
+    schema = _arrow_schema(params)
+
+    def generate():
+        sink = _ChunkSink()
+        count = 0
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.ipc.new_file(pa.PythonFile(sink, mode='w'), schema, options=options) as writer:
+            for batch in _record_batches(rows, params, schema):
+                writer.write_batch(batch)
+                count += batch.num_rows
+                yield sink.drain()
+        yield sink.drain()
+        logger.info(f"📤 Экспорт Arrow: {count} строк, {len(params)} параметров")
+
+    return generate()
+
+
+def xlsx_file(rows: Iterable[ExportRow], params: List[str]):
+    """XLSX в режиме write-only: строки не держатся в памяти, файл собирается во временном файле"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Временные ряды')
+    sheet.append(CSV_HEADERS + list(params))
+
+    count = 0
+    for timestamp, vehicle, stage, values in rows:
+        if count + 1 >= XLSX_MAX_ROWS:
+            logger.warning(f"⚠️ Экспорт XLSX обрезан до {XLSX_MAX_ROWS - 1} строк (лимит листа Excel)")
+            break
+
+        try:
+            timestamp = datetime.strptime(timestamp, DT_FORMAT)
+        except (TypeError, ValueError):
+            pass
+
+        cells = [timestamp, vehicle, stage]
+        for param in params:
+            value = values.get(param)
+            number = parse_numeric(value)
+            cells.append(number if number is not None else value)
+        sheet.append(cells)
+        count += 1
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+
+    logger.info(f"📤 Экспорт XLSX: {count} строк, {len(params)} параметров")
+    return output
+
+
+# Потоковые форматы: (content_type, расширение файла, функция)
+STREAM_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', csv_stream),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', parquet_stream),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow', arrow_stream),
+}
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
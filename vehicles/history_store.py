@@ -0,0 +1,337 @@
+"""
+Локальное хранилище истории GetTripItems
+
+Полученные из AutoGRAPH строки сохраняются в RawTrackData (bulk_create
+пачками; строка с тем же (vehicle, timestamp) обновляется - незавершенный
+этап текущего дня заменяется полным при повторной загрузке), а загруженные
+периоды образуют индекс покрытия на HistoricalData (data_type='trip_items'):
+интервалы дат по ТС и набору параметров, смежные интервалы сливаются.
+Из AutoGRAPH запрашиваются только пропуски (missing_ranges), остальное
+отдается из базы в формате ответа GetTripItems {device_id: {Name, Params, Items}}.
+
+ТС хранилища принадлежат схеме AutoGRAPH (AutoGraphSchema), и все чтения
+ограничены схемой вызывающего: ID ТС из запроса без своей схемы не дают
+доступа к истории чужой схемы. Устройство, входящее в несколько схем,
+хранится в каждой из них отдельно.
+"""
+import hashlib
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .models import AutoGraphSchema, HistoricalData, RawTrackData, Vehicle
+from .timeseries import parse_numeric
+
+logger = logging.getLogger(__name__)
+
+COVERAGE_DATA_TYPE = 'trip_items'
+
+# Параметры AutoGRAPH, которые дублируются в колонки RawTrackData
+TRACK_FIELDS = {
+    'Speed': 'speed',
+    'Latitude': 'latitude',
+    'Longitude': 'longitude',
+    'Altitude': 'altitude',
+    'GPSSatellites': 'satellites',
+    'GPSHDOP': 'hdop',
+    'EngineTemperature': 'engine_temp',
+    'TankMainFuelLevel': 'fuel_level',
+    'PowerVoltage': 'voltage',
+    'EngineRPM': 'rpm',
+}
+
+DT_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# Колонки строки, обновляемые при повторной загрузке
+UPDATE_FIELDS = ['parameters_json', 'stage', 'duration', 'caption', 'movement', 'gps_valid'] + list(TRACK_FIELDS.values())
+
+
+def parameters_hash(params: Iterable[str]) -> str:
+    """Ключ набора параметров (покрытие учитывается отдельно для каждого набора)"""
+    return hashlib.sha1(','.join(sorted(params)).encode()).hexdigest()[:16]
+
+
+def parse_date(value: str) -> Optional[date]:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_dt(value: str) -> Optional[datetime]:
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+def day_bounds(start_date: date, end_date: date) -> tuple:
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min)),
+        timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    )
+
+
+def last_complete_day() -> date:
+    """Последний завершенный день: данные за сегодня еще дополняются и не считаются покрытыми"""
+    return timezone.localdate() - timedelta(days=1)
+
+
+def schema_vehicles(schema_id: str, device_ids: Iterable[str]):
+    """ТС схемы с указанными ID AutoGRAPH (ТС других схем не попадают)"""
+    return Vehicle.objects.filter(autograph_schema__schema_id=schema_id, vehicle_id__in=list(device_ids))
+
+
+def get_vehicles(schema_id: str, names: Dict[str, str]) -> Dict[str, Vehicle]:
+    """
+    ТС хранилища схемы по ID AutoGRAPH: ТС без схемы закрепляются за ней,
+    недостающие создаются. Устройство другой схемы получает в этой схеме
+    свою запись - история схем хранится раздельно
+    """
+    schema, _ = AutoGraphSchema.objects.get_or_create(schema_id=schema_id)
+
+    owned = set(schema_vehicles(schema_id, names).values_list('vehicle_id', flat=True))
+    unowned = [device_id for device_id in names if device_id not in owned]
+    if unowned:
+        Vehicle.objects.filter(autograph_schema__isnull=True, vehicle_id__in=unowned).update(autograph_schema=schema)
+        owned |= set(schema_vehicles(schema_id, unowned).values_list('vehicle_id', flat=True))
+
+    missing = [
+        Vehicle(autograph_schema=schema, vehicle_id=device_id, name=name[:200])
+        for device_id, name in names.items() if device_id not in owned
+    ]
+    if missing:
+        Vehicle.objects.bulk_create(missing, ignore_conflicts=True)
+
+    return {v.vehicle_id: v for v in schema_vehicles(schema_id, names)}
+
+
+def _track_rows(vehicle: Vehicle, device_data: Dict) -> Iterable[RawTrackData]:
+    params = device_data.get('Params', []) or []
+
+    for item in device_data.get('Items', []) or []:
+        timestamp = _parse_dt(item.get('DT', '')) if isinstance(item, dict) else None
+        if timestamp is None:
+            continue
+
+        values = {
+            param: value
+            for param, value in zip(params, item.get('Values', []) or [])
+            if value is not None and value != ''
+        }
+        fields = {
+            field: parse_numeric(values.get(param))
+            for param, field in TRACK_FIELDS.items()
+        }
+        if fields['satellites'] is not None:
+            fields['satellites'] = int(fields['satellites'])
+
+        yield RawTrackData(
+            vehicle=vehicle,
+            timestamp=timestamp,
+            parameters_json=values,
+            stage=(item.get('Stage') or '')[:20],
+            duration=(item.get('Duration') or '')[:20],
+            caption=(item.get('Caption') or '')[:200],
+            movement=item.get('Stage') == 'Motion',
+            gps_valid=fields['latitude'] is not None and fields['longitude'] is not None,
+            **fields
+        )
+
+
+def _upsert(rows: List[RawTrackData]):
+    RawTrackData.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['vehicle', 'timestamp'], update_fields=UPDATE_FIELDS
+    )
+
+
+def ingest_trip_items(schema_id: str, all_data: Dict) -> int:
+    """
+    Сохранить ответ GetTripItems в RawTrackData и пересчитать агрегаты
+    затронутых дней; возвращает число переданных на вставку строк
+    """
+    devices = {
+        device_id: device_data for device_id, device_data in (all_data or {}).items()
+        if isinstance(device_data, dict)
+    }
+    if not devices:
+        return 0
+
+    batch_size = getattr(settings, 'AUTOGRAPH_HISTORY_INGEST_BATCH', 1000)
+    vehicles = get_vehicles(schema_id, {
+        device_id: device_data.get('Name', f'ТС {device_id[:8]}') for device_id, device_data in devices.items()
+    })
+
+    inserted = 0
+    affected_days = {}
+    with transaction.atomic():
+        for device_id, device_data in devices.items():
+            vehicle = vehicles.get(device_id)
+            if vehicle is None:
+                continue
+
+            batch = []
+            days = affected_days.setdefault(vehicle.pk, set())
+            for row in _track_rows(vehicle, device_data):
+                days.add(timezone.localtime(row.timestamp).date())
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    _upsert(batch)
+                    inserted += len(batch)
+                    batch = []
+
+            if batch:
+                _upsert(batch)
+                inserted += len(batch)
+
+    logger.info(f"💾 Сохранено в историю: {inserted} строк, {len(vehicles)} ТС")
+
+    rollups.rebuild(affected_days)
+    return inserted
+
+
+def merge_intervals(intervals: Iterable[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    """Объединение пересекающихся и смежных интервалов дат"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(intervals: List[Tuple[date, date]], start: date, end: date) -> List[Tuple[date, date]]:
+    """Пропуски периода start..end, не покрытые интервалами (интервалы отсортированы и объединены)"""
+    gaps = []
+    cursor = start
+
+    for covered_start, covered_end in intervals:
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start - timedelta(days=1)))
+        cursor = max(cursor, covered_end + timedelta(days=1))
+
+    if cursor <= end:
+        gaps.append((cursor, end))
+
+    return gaps
+
+
+def coverage(schema_id: str, device_ids: List[str], params: List[str]) -> Dict[str, List[Tuple[date, date]]]:
+    """Индекс покрытия: объединенные интервалы загруженных дат по ТС схемы для набора параметров"""
+    intervals = {}
+
+    for device_id, start, end in HistoricalData.objects.filter(
+        vehicle__in=schema_vehicles(schema_id, device_ids),
+        data_type=COVERAGE_DATA_TYPE,
+        summary__params_hash=parameters_hash(params)
+    ).values_list('vehicle__vehicle_id', 'start_date', 'end_date'):
+        intervals.setdefault(device_id, []).append((start, end))
+
+    return {device_id: merge_intervals(items) for device_id, items in intervals.items()}
+
+
+def mark_covered(schema_id: str, names: Dict[str, str], start_date: date, end_date: date,
+                 params: List[str]):
+    """
+    Отметить период загруженным для ТС. Пересекающиеся и смежные записи
+    покрытия сливаются в одну, чтобы индекс не дробился на дни.
+    Сегодняшний день не отмечается: данные за него еще дополняются.
+    """
+    end_date = min(end_date, last_complete_day())
+    if start_date > end_date:
+        return
+
+    params_hash = parameters_hash(params)
+    vehicles = get_vehicles(schema_id, names)
+
+    with transaction.atomic():
+        for vehicle in vehicles.values():
+            existing = HistoricalData.objects.select_for_update().filter(
+                vehicle=vehicle,
+                data_type=COVERAGE_DATA_TYPE,
+                summary__params_hash=params_hash,
+                start_date__lte=end_date + timedelta(days=1),
+                end_date__gte=start_date - timedelta(days=1)
+            )
+
+            new_start, new_end = start_date, end_date
+            for record in existing:
+                new_start, new_end = min(new_start, record.start_date), max(new_end, record.end_date)
+            existing.delete()
+
+            HistoricalData.objects.create(
+                vehicle=vehicle,
+                start_date=new_start,
+                end_date=new_end,
+                data_type=COVERAGE_DATA_TYPE,
+                summary={'params_hash': params_hash, 'params': len(params)}
+            )
+
+
+def is_covered(schema_id: str, device_ids: List[str], start_date: date, end_date: date, params: List[str]) -> bool:
+    """Весь период загружен для всех ТС схемы с этим набором параметров"""
+    intervals = coverage(schema_id, device_ids, params)
+    return all(not missing_ranges(intervals.get(device_id, []), start_date, end_date) for device_id in device_ids)
+
+
+def load_trip_items(schema_id: str, device_ids: List[str], start_date: date, end_date: date) -> Dict:
+    """Строки хранилища ТС схемы за период в формате ответа GetTripItems"""
+    start_dt, end_dt = day_bounds(start_date, end_date)
+
+    rows = RawTrackData.objects.filter(
+        vehicle__in=schema_vehicles(schema_id, device_ids),
+        timestamp__gte=start_dt,
+        timestamp__lt=end_dt
+    ).order_by('vehicle_id', 'timestamp').values_list(
+        'vehicle__vehicle_id', 'vehicle__name', 'timestamp', 'stage', 'duration', 'caption', 'parameters_json'
+    )
+
+    data = {}
+    param_index = {}
+
+    for device_id, name, timestamp, stage, duration, caption, values in rows.iterator(chunk_size=2000):
+        if device_id not in data:
+            data[device_id] = {'Name': name, 'Params': [], 'Items': []}
+            param_index[device_id] = {}
+
+        device_data = data[device_id]
+        index = param_index[device_id]
+        for param in values:
+            if param not in index:
+                index[param] = len(device_data['Params'])
+                device_data['Params'].append(param)
+
+        device_data['Items'].append({
+            'DT': timezone.localtime(timestamp).strftime(DT_FORMAT),
+            'Stage': stage or 'Unknown',
+            'Duration': duration,
+            'Caption': caption,
+            'Values': values
+        })
+
+    # Значения строк выравниваются по итоговому списку параметров ТС
+    for device_id, device_data in data.items():
+        params = device_data['Params']
+        for item in device_data['Items']:
+            values = item['Values']
+            item['Values'] = [values.get(param) for param in params]
+
+    # ТС без строк за период (например, стояли) тоже попадают в ответ
+    missing = [device_id for device_id in device_ids if device_id not in data]
+    if missing:
+        names = dict(schema_vehicles(schema_id, missing).values_list('vehicle_id', 'name'))
+        for device_id in missing:
+            data[device_id] = {'Name': names.get(device_id, f'ТС {device_id[:8]}'), 'Params': [], 'Items': []}
+
+    return data
@@ -0,0 +1,100 @@
+"""
+Сравнение json и orjson на теле ответа AutoGRAPH
+
+    python manage.py json_benchmark ответ_GetTripItems.json
+    python manage.py json_benchmark --points 100000
+
+Без файла используется сгенерированный ответ GetTripItems заданного размера.
+Замеряются разбор тела, сериализация разобранных данных и сериализация
+записей временного ряда в ответ API (JsonResponse / FastJsonResponse).
+"""
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+
+from api import fastjson
+
+
+def _sample_trip_items(points: int, params: int = 20) -> dict:
+    """Ответ GetTripItems: одно ТС, points строк по params параметров"""
+    names = [f"Param{i}" for i in range(params)]
+    start = datetime(2024, 1, 1)
+    items = [
+        {
+            'DT': (start + timedelta(seconds=30 * i)).strftime('%Y-%m-%dT%H:%M:%S'),
+            'Stage': random.choice(('Motion', 'Parking')),
+            'Values': [round(random.uniform(0, 500), 2) for _ in names]
+        }
+        for i in range(points)
+    ]
+    return {'dev-1': {'Name': 'ТС-1', 'Params': names, 'Items': items}}
+
+
+def _records(body: dict) -> list:
+    """Записи временного ряда (формат time_series в ответах API)"""
+    records = []
+    for device_id, device in body.items():
+        if not isinstance(device, dict):
+            continue
+        names = device.get('Params') or []
+        for item in device.get('Items') or []:
+            records.append({
+                'timestamp': item.get('DT'),
+                'vehicle_id': device_id,
+                'vehicle_name': device.get('Name', ''),
+                'type': item.get('Stage'),
+                'values': dict(zip(names, item.get('Values') or []))
+            })
+    return records
+
+
+def _best(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = 'Сравнение json и orjson на теле ответа AutoGRAPH'
+
+    def add_arguments(self, parser):
+        parser.add_argument('payload', nargs='?', help='Файл с записанным телом ответа AutoGRAPH')
+        parser.add_argument('--points', type=int, default=100000, help='Число строк сгенерированного ответа')
+        parser.add_argument('--repeat', type=int, default=5, help='Число повторов (берется лучшее время)')
+
+    def handle(self, *args, **options):
+        if fastjson.orjson is None:
+            raise CommandError('orjson не установлен')
+
+        if options['payload']:
+            with open(options['payload'], 'rb') as f:
+                raw = f.read()
+        else:
+            raw = json.dumps(_sample_trip_items(options['points']), ensure_ascii=False).encode('utf-8')
+
+        body = json.loads(raw)
+        response_data = {'success': True, 'data': {'time_series': _records(body)}}
+        repeat = options['repeat']
+
+        cases = [
+            ('Разбор тела ответа', lambda: json.loads(raw), lambda: fastjson.loads(raw)),
+            ('Сериализация тела', lambda: json.dumps(body, ensure_ascii=False), lambda: fastjson.dumps(body)),
+            ('Ответ API (time_series)', lambda: JsonResponse(response_data), lambda: fastjson.FastJsonResponse(response_data)),
+        ]
+
+        self.stdout.write(
+            f"Тело: {len(raw) / 1024 / 1024:.1f} МБ, записей временного ряда: {len(response_data['data']['time_series'])}"
+        )
+        for title, standard, fast in cases:
+            standard_time, fast_time = _best(standard, repeat), _best(fast, repeat)
+            self.stdout.write(
+                f"{title}: json {standard_time * 1000:.1f} мс, orjson {fast_time * 1000:.1f} мс "
+                f"(x{standard_time / fast_time:.1f})"
+            )
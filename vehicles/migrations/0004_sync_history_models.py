@@ -0,0 +1,315 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0003_vehicledatasnapshot_remove_vehiclealert_resolved_by_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название')),
+                ('vehicles', models.JSONField(default=list, verbose_name='ТС')),
+                ('period', models.JSONField(default=dict, verbose_name='Период')),
+                ('fuel_analysis', models.JSONField(default=dict, verbose_name='Анализ топлива')),
+                ('mileage_analysis', models.JSONField(default=dict, verbose_name='Анализ пробега')),
+                ('engine_analysis', models.JSONField(default=dict, verbose_name='Анализ двигателя')),
+                ('signals_analysis', models.JSONField(default=dict, verbose_name='Анализ сигналов')),
+                ('charts', models.JSONField(default=dict, verbose_name='Диаграммы')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Отчет анализа',
+                'verbose_name_plural': 'Отчеты анализа',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AutoGraphConnection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.TextField(verbose_name='Токен сессии')),
+                ('schema_id', models.CharField(blank=True, max_length=100, verbose_name='ID схемы')),
+                ('schema_name', models.CharField(blank=True, max_length=200, verbose_name='Название схемы')),
+                ('last_sync', models.DateTimeField(auto_now=True, verbose_name='Последняя синхронизация')),
+            ],
+            options={
+                'verbose_name': 'Подключение AutoGRAPH',
+                'verbose_name_plural': 'Подключения AutoGRAPH',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChartConfiguration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('chart_type', models.CharField(max_length=50, verbose_name='Тип диаграммы')),
+                ('config', models.JSONField(default=dict, verbose_name='Конфигурация')),
+                ('parameters', models.JSONField(default=list, verbose_name='Параметры')),
+                ('filters', models.JSONField(default=dict, verbose_name='Фильтры')),
+                ('is_default', models.BooleanField(default=False, verbose_name='По умолчанию')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Конфигурация диаграммы',
+                'verbose_name_plural': 'Конфигурации диаграмм',
+            },
+        ),
+        migrations.CreateModel(
+            name='DataCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_key', models.CharField(db_index=True, max_length=100, verbose_name='Ключ периода')),
+                ('data_type', models.CharField(max_length=50, verbose_name='Тип данных')),
+                ('compressed_data', models.BinaryField(verbose_name='Сжатые данные')),
+                ('data_size', models.IntegerField(verbose_name='Размер данных')),
+                ('record_count', models.IntegerField(verbose_name='Количество записей')),
+                ('date_from', models.DateField(verbose_name='Дата начала')),
+                ('date_to', models.DateField(verbose_name='Дата окончания')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('expires_at', models.DateTimeField(verbose_name='Истекает')),
+            ],
+            options={
+                'verbose_name': 'Кэш данных',
+                'verbose_name_plural': 'Кэши данных',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistoricalData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='Дата начала')),
+                ('end_date', models.DateField(verbose_name='Дата окончания')),
+                ('data_type', models.CharField(choices=[('trip_items', 'Точки трека'), ('trips', 'Рейсы'), ('fuel', 'Топливо'), ('mileage', 'Пробег')], max_length=20, verbose_name='Тип данных')),
+                ('raw_data', models.JSONField(default=dict, verbose_name='Сырые данные')),
+                ('processed_data', models.JSONField(default=dict, verbose_name='Обработанные данные')),
+                ('summary', models.JSONField(default=dict, verbose_name='Сводка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Исторические данные',
+                'verbose_name_plural': 'Исторические данные',
+            },
+        ),
+        migrations.CreateModel(
+            name='RawTrackData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True, verbose_name='Время')),
+                ('latitude', models.FloatField(blank=True, null=True, verbose_name='Широта')),
+                ('longitude', models.FloatField(blank=True, null=True, verbose_name='Долгота')),
+                ('altitude', models.FloatField(blank=True, null=True, verbose_name='Высота')),
+                ('speed', models.FloatField(blank=True, null=True, verbose_name='Скорость')),
+                ('satellites', models.IntegerField(blank=True, null=True, verbose_name='Спутники')),
+                ('hdop', models.FloatField(blank=True, null=True, verbose_name='HDOP')),
+                ('engine_temp', models.FloatField(blank=True, null=True, verbose_name='Температура двигателя')),
+                ('fuel_level', models.FloatField(blank=True, null=True, verbose_name='Уровень топлива')),
+                ('voltage', models.FloatField(blank=True, null=True, verbose_name='Напряжение')),
+                ('rpm', models.FloatField(blank=True, null=True, verbose_name='Обороты')),
+                ('parameters_json', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('stage', models.CharField(blank=True, max_length=20, verbose_name='Этап')),
+                ('duration', models.CharField(blank=True, max_length=20, verbose_name='Длительность')),
+                ('caption', models.CharField(blank=True, max_length=200, verbose_name='Подпись')),
+                ('ignition', models.BooleanField(default=False, verbose_name='Зажигание')),
+                ('movement', models.BooleanField(default=False, verbose_name='Движение')),
+                ('gps_valid', models.BooleanField(default=False, verbose_name='GPS валиден')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Сырые данные трека',
+                'verbose_name_plural': 'Сырые данные треков',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.RemoveField(
+            model_name='vehicledatasnapshot',
+            name='vehicle',
+        ),
+        migrations.AlterModelOptions(
+            name='vehicle',
+            options={'ordering': ['name'], 'verbose_name': 'Транспортное средство', 'verbose_name_plural': 'Транспортные средства'},
+        ),
+        migrations.RemoveIndex(
+            model_name='vehicle',
+            name='vehicles_ve_externa_2d65d2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='vehicle',
+            name='vehicles_ve_is_onli_8b2aae_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='vehicle',
+            name='vehicles_ve_last_up_9a5bc6_idx',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='address',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='created_at',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='current_speed',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='external_id',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='fuel_level',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='is_active',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='is_online',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='latitude',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='longitude',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='schema_id',
+        ),
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='updated_at',
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='available_parameters',
+            field=models.JSONField(default=dict, verbose_name='Доступные параметры'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='group',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Группа'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='model',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Модель'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='serial',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Серийный номер'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='type',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Тип'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='vehicle_id',
+            field=models.CharField(default='', max_length=100, unique=True, verbose_name='ID в AutoGRAPH'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='id',
+            field=models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='last_update',
+            field=models.DateTimeField(auto_now=True, verbose_name='Последнее обновление'),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='license_plate',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Госномер'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='name',
+            field=models.CharField(max_length=200, verbose_name='Название'),
+        ),
+        migrations.AddField(
+            model_name='analysisreport',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='autographconnection',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='connection',
+            field=models.ForeignKey(default=0, on_delete=django.db.models.deletion.CASCADE, related_name='vehicles', to='vehicles.autographconnection'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='chartconfiguration',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='datacache',
+            name='vehicle',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cache', to='vehicles.vehicle'),
+        ),
+        migrations.AddField(
+            model_name='historicaldata',
+            name='vehicle',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historical_data', to='vehicles.vehicle'),
+        ),
+        migrations.AddField(
+            model_name='rawtrackdata',
+            name='vehicle',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='raw_tracks', to='vehicles.vehicle'),
+        ),
+        migrations.DeleteModel(
+            name='VehicleDataSnapshot',
+        ),
+        migrations.AddIndex(
+            model_name='datacache',
+            index=models.Index(fields=['period_key'], name='vehicles_da_period__e4816e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datacache',
+            index=models.Index(fields=['expires_at'], name='vehicles_da_expires_3f1165_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicaldata',
+            index=models.Index(fields=['vehicle', 'start_date', 'end_date'], name='vehicles_hi_vehicle_8c1611_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rawtrackdata',
+            index=models.Index(fields=['vehicle', 'timestamp'], name='vehicles_ra_vehicle_b95d1f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rawtrackdata',
+            index=models.Index(fields=['vehicle', '-timestamp'], name='vehicles_ra_vehicle_65444a_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rawtrackdata',
+            constraint=models.UniqueConstraint(fields=('vehicle', 'timestamp'), name='unique_raw_track_vehicle_timestamp'),
+        ),
+    ]
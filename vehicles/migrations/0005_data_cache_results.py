@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0004_sync_history_models'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='datacache',
+            name='period_key',
+            field=models.CharField(max_length=100, unique=True, verbose_name='Ключ периода'),
+        ),
+        migrations.AlterField(
+            model_name='datacache',
+            name='vehicle',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cache', to='vehicles.vehicle'),
+        ),
+    ]
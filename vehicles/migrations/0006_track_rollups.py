@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def reset_trip_items_coverage(apps, schema_editor):
+    """Периоды, загруженные до появления агрегатов, догружаются заново - агрегаты пересчитываются при сохранении"""
+    HistoricalData = apps.get_model('vehicles', 'HistoricalData')
+    HistoricalData.objects.filter(data_type='trip_items').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0005_data_cache_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Минута'), ('hour', 'Час'), ('day', 'День')], max_length=10, verbose_name='Разрешение')),
+                ('bucket', models.DateTimeField(verbose_name='Начало интервала')),
+                ('parameter', models.CharField(max_length=100, verbose_name='Параметр')),
+                ('count', models.IntegerField(verbose_name='Количество значений')),
+                ('sum', models.FloatField(verbose_name='Сумма')),
+                ('min', models.FloatField(verbose_name='Минимум')),
+                ('max', models.FloatField(verbose_name='Максимум')),
+                ('last', models.FloatField(verbose_name='Последнее значение')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='vehicles.vehicle')),
+            ],
+            options={
+                'verbose_name': 'Агрегат трека',
+                'verbose_name_plural': 'Агрегаты треков',
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='vehicles_tr_resolut_796522_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'resolution', 'parameter', 'bucket'), name='unique_track_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(reset_trip_items_coverage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_history_owners(apps, schema_editor):
+    """ТС локальной истории переходят к записи схемы; общие подключения с токеном сессии удаляются"""
+    AutoGraphConnection = apps.get_model('vehicles', 'AutoGraphConnection')
+    AutoGraphSchema = apps.get_model('vehicles', 'AutoGraphSchema')
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+
+    for connection in AutoGraphConnection.objects.exclude(schema_id=''):
+        schema, _ = AutoGraphSchema.objects.get_or_create(schema_id=connection.schema_id)
+        Vehicle.objects.filter(connection=connection).update(autograph_schema=schema)
+
+    shared = AutoGraphConnection.objects.filter(user__isnull=True)
+    Vehicle.objects.filter(connection__in=shared).update(connection=None)
+    shared.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0006_track_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutoGraphSchema',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema_id', models.CharField(max_length=100, unique=True, verbose_name='ID схемы')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Схема AutoGRAPH',
+                'verbose_name_plural': 'Схемы AutoGRAPH',
+            },
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='connection',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vehicles', to='vehicles.autographconnection'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='autograph_schema',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vehicles', to='vehicles.autographschema', verbose_name='Схема'),
+        ),
+        migrations.RunPython(move_history_owners, migrations.RunPython.noop),
+    ]
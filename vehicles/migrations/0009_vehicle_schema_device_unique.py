@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0008_connection_user_required'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vehicle',
+            name='vehicle_id',
+            field=models.CharField(max_length=100, verbose_name='ID в AutoGRAPH'),
+        ),
+        migrations.AddConstraint(
+            model_name='vehicle',
+            constraint=models.UniqueConstraint(fields=('autograph_schema', 'vehicle_id'), name='unique_vehicle_schema_device'),
+        ),
+    ]
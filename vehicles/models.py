@@ -17,10 +17,26 @@ class AutoGraphConnection(models.Model):
         verbose_name_plural = "Подключения AutoGRAPH"
 
 
+class AutoGraphSchema(models.Model):
+    """Схема AutoGRAPH - владелец локальной истории ТС (без токена сессии)"""
+    schema_id = models.CharField("ID схемы", max_length=100, unique=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Схема AutoGRAPH"
+        verbose_name_plural = "Схемы AutoGRAPH"
+
+    def __str__(self):
+        return self.schema_id
+
+
 class Vehicle(models.Model):
     """Транспортное средство"""
-    connection = models.ForeignKey(AutoGraphConnection, on_delete=models.CASCADE, related_name='vehicles')
-    vehicle_id = models.CharField("ID в AutoGRAPH", max_length=100, unique=True)
+    connection = models.ForeignKey(AutoGraphConnection, on_delete=models.CASCADE, related_name='vehicles',
+                                   null=True, blank=True)
+    autograph_schema = models.ForeignKey(AutoGraphSchema, on_delete=models.CASCADE, related_name='vehicles',
+                                         null=True, blank=True, verbose_name="Схема")
+    vehicle_id = models.CharField("ID в AutoGRAPH", max_length=100)
     name = models.CharField("Название", max_length=200)
     license_plate = models.CharField("Госномер", max_length=50, blank=True)
     serial = models.CharField("Серийный номер", max_length=100, blank=True)
@@ -36,6 +52,10 @@ class Vehicle(models.Model):
         verbose_name = "Транспортное средство"
         verbose_name_plural = "Транспортные средства"
         ordering = ['name']
+        constraints = [
+            # Одно устройство может входить в несколько схем: у каждой схемы своя запись
+            models.UniqueConstraint(fields=['autograph_schema', 'vehicle_id'], name='unique_vehicle_schema_device'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.license_plate or '—'})"
@@ -61,6 +81,11 @@ class RawTrackData(models.Model):
     # Параметры
     parameters_json = models.JSONField("Параметры", default=dict)
 
+    # Этап GetTripItems
+    stage = models.CharField("Этап", max_length=20, blank=True)
+    duration = models.CharField("Длительность", max_length=20, blank=True)
+    caption = models.CharField("Подпись", max_length=200, blank=True)
+
     # Статусы
     ignition = models.BooleanField("Зажигание", default=False)
     movement = models.BooleanField("Движение", default=False)
@@ -71,6 +96,9 @@ class RawTrackData(models.Model):
     class Meta:
         verbose_name = "Сырые данные трека"
         verbose_name_plural = "Сырые данные треков"
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'timestamp'], name='unique_raw_track_vehicle_timestamp'),
+        ]
         indexes = [
             models.Index(fields=['vehicle', 'timestamp']),
             models.Index(fields=['vehicle', '-timestamp']),
@@ -82,9 +110,9 @@ class RawTrackData(models.Model):
 
 
 class DataCache(models.Model):
-    """Кэш данных для ускорения доступа"""
-    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='cache')
-    period_key = models.CharField("Ключ периода", max_length=100, db_index=True)
+    """Кэш данных для ускорения доступа (результаты по нескольким ТС хранятся без vehicle)"""
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='cache', null=True, blank=True)
+    period_key = models.CharField("Ключ периода", max_length=100, unique=True)
     data_type = models.CharField("Тип данных", max_length=50)
 
     # Данные
@@ -150,6 +178,41 @@ class HistoricalData(models.Model):
         return f"{self.vehicle.name} ({self.start_date} - {self.end_date})"
 
 
+class TrackRollup(models.Model):
+    """Агрегаты параметров ТС по интервалам (минута/час/день), обновляются при сохранении истории"""
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='rollups')
+
+    RESOLUTIONS = [
+        ('minute', 'Минута'),
+        ('hour', 'Час'),
+        ('day', 'День'),
+    ]
+    resolution = models.CharField("Разрешение", max_length=10, choices=RESOLUTIONS)
+    bucket = models.DateTimeField("Начало интервала")
+    parameter = models.CharField("Параметр", max_length=100)
+
+    # Агрегаты числовых значений интервала
+    count = models.IntegerField("Количество значений")
+    sum = models.FloatField("Сумма")
+    min = models.FloatField("Минимум")
+    max = models.FloatField("Максимум")
+    last = models.FloatField("Последнее значение")
+
+    class Meta:
+        verbose_name = "Агрегат трека"
+        verbose_name_plural = "Агрегаты треков"
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'resolution', 'parameter', 'bucket'],
+                                    name='unique_track_rollup_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle.name} - {self.parameter} {self.resolution} {self.bucket}"
+
+
 class ChartConfiguration(models.Model):
     """Конфигурация диаграмм"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -0,0 +1,176 @@
+"""
+L2-кэш отформатированных временных рядов (DataCache)
+
+Результат AdvancedDataFormatter.format_for_timeseries сохраняется в базе
+сжатым (zlib - есть на любом воркере, запись читается всеми) под ключом
+(схема, набор ТС, период). Повторный анализ тех же ТС за тот же период
+не обращается к AutoGRAPH и не форматирует данные заново.
+
+Периоды, захватывающие сегодняшний день, живут недолго
+(AUTOGRAPH_RESULT_CACHE_TTL_RECENT): данные за них еще дополняются.
+Очистка (clean_old_cache) удаляет истекшие записи и самые давно
+использованные, пока суммарный размер не уложится в AUTOGRAPH_RESULT_CACHE_MAX_BYTES.
+"""
+import hashlib
+import logging
+import threading
+import zlib
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from api import fastjson
+from .history_store import parse_date
+from .models import DataCache
+
+logger = logging.getLogger(__name__)
+
+DATA_TYPE = 'time_series'
+
+# Первый байт сжатых данных - кодек
+CODEC_ZLIB = b'z'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'skipped': 0}
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats() -> Dict:
+    """Счетчики попаданий и промахов кэша (в пределах процесса)"""
+    with _stats_lock:
+        result = dict(_stats)
+    lookups = result['hits'] + result['misses']
+    result['hit_rate'] = round(result['hits'] / lookups, 4) if lookups else 0.0
+    return result
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'AUTOGRAPH_RESULT_CACHE_ENABLED', True)
+
+
+def cache_key(schema_id: str, vehicle_ids: List[str], start_date: str, end_date: str) -> str:
+    """Ключ периода: не зависит от порядка ТС в запросе"""
+    raw = f"{schema_id}|{','.join(sorted(vehicle_ids))}|{start_date}|{end_date}"
+    return f"{DATA_TYPE}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def compress(payload: bytes) -> bytes:
+    return CODEC_ZLIB + zlib.compress(payload, 6)
+
+
+def decompress(data: bytes) -> bytes:
+    """ValueError - запись другого кодека (например, zstd прежних версий): считается промахом и перезаписывается"""
+    data = bytes(data)
+    codec, body = data[:1], data[1:]
+    if codec != CODEC_ZLIB:
+        raise ValueError(f"Неизвестный кодек записи кэша: {codec!r}")
+    return zlib.decompress(body)
+
+
+def _ttl(end_date: str) -> int:
+    end = parse_date(end_date)
+    if end is None or end >= timezone.localdate():
+        return getattr(settings, 'AUTOGRAPH_RESULT_CACHE_TTL_RECENT', 300)
+    return getattr(settings, 'AUTOGRAPH_RESULT_CACHE_TTL', 86400)
+
+
+def get(schema_id: str, vehicle_ids: List[str], start_date: str, end_date: str) -> Optional[Dict]:
+    """Отформатированные данные из кэша или None"""
+    if not is_enabled():
+        return None
+
+    key = cache_key(schema_id, vehicle_ids, start_date, end_date)
+
+    try:
+        entry = DataCache.objects.filter(
+            period_key=key, expires_at__gt=timezone.now()
+        ).only('id', 'compressed_data').first()
+
+        if entry is None:
+            _count('misses')
+            return None
+
+        data = fastjson.loads(decompress(entry.compressed_data))
+        # Отметка использования для вытеснения давно не используемых записей
+        DataCache.objects.filter(id=entry.id).update(updated_at=timezone.now())
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения кэша результатов: {e}")
+        _count('misses')
+        return None
+
+    _count('hits')
+    logger.info(f"⚡ Кэш результатов: попадание {key[-12:]}")
+    return data
+
+
+def store(schema_id: str, vehicle_ids: List[str], start_date: str, end_date: str, formatted: Dict) -> bool:
+    """Сохранить отформатированные данные; записи крупнее AUTOGRAPH_RESULT_CACHE_MAX_ENTRY_BYTES не кэшируются"""
+    if not is_enabled() or not formatted:
+        return False
+
+    key = cache_key(schema_id, vehicle_ids, start_date, end_date)
+
+    try:
+        payload = fastjson.dumps(formatted)
+        compressed = compress(payload)
+
+        max_entry = getattr(settings, 'AUTOGRAPH_RESULT_CACHE_MAX_ENTRY_BYTES', 50 * 1024 * 1024)
+        if max_entry and len(compressed) > max_entry:
+            _count('skipped')
+            logger.warning(f"⚠️ Результат не кэшируется: {len(compressed)} байт больше лимита {max_entry}")
+            return False
+
+        start, end = parse_date(start_date), parse_date(end_date)
+        today = timezone.localdate()
+
+        DataCache.objects.update_or_create(
+            period_key=key,
+            defaults={
+                'vehicle': None,
+                'data_type': DATA_TYPE,
+                'compressed_data': compressed,
+                'data_size': len(compressed),
+                'record_count': formatted.get('total_records', 0),
+                'date_from': start or today,
+                'date_to': end or today,
+                'expires_at': timezone.now() + timedelta(seconds=_ttl(end_date))
+            }
+        )
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения в кэш результатов: {e}")
+        return False
+
+    _count('stores')
+    logger.info(f"💾 Кэш результатов: {len(payload)} -> {len(compressed)} байт ({key[-12:]})")
+    return True
+
+
+def clean_old_cache(max_bytes: int = None) -> Dict:
+    """Удаление истекших записей и вытеснение давно не используемых сверх бюджета по размеру"""
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'AUTOGRAPH_RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+    expired, _ = DataCache.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    total = DataCache.objects.aggregate(total=Sum('data_size'))['total'] or 0
+    evicted_ids = []
+
+    if max_bytes and total > max_bytes:
+        for entry_id, size in DataCache.objects.order_by('updated_at').values_list('id', 'data_size').iterator():
+            if total <= max_bytes:
+                break
+            evicted_ids.append(entry_id)
+            total -= size
+
+        DataCache.objects.filter(id__in=evicted_ids).delete()
+
+    result = {'expired': expired, 'evicted': len(evicted_ids), 'total_bytes': total}
+    logger.info(f"🧹 Очистка кэша результатов: истекло {expired}, вытеснено {len(evicted_ids)}, осталось {total} байт")
+    return result
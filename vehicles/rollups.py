@@ -0,0 +1,175 @@
+"""
+Агрегаты временных рядов по интервалам (TrackRollup)
+
+Для каждого ТС, параметра и интервала (минута/час/день) хранятся
+count/sum/min/max/last числовых значений. Агрегаты пересчитываются
+при сохранении истории (history_store.ingest_trip_items) за затронутые
+дни целиком по строкам RawTrackData, поэтому повторная загрузка дня
+не удваивает значения. Запрос графика с разрешением читает готовые
+агрегаты вместо перебора сырого ряда.
+"""
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Set
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from . import history_store
+from .aggregation import KEY_FORMATS
+from .models import RawTrackData, TrackRollup
+from .timeseries import parse_numeric
+
+logger = logging.getLogger(__name__)
+
+
+def _buckets(timestamp: datetime) -> tuple:
+    """Начала интервалов (минута, час, день) для метки времени в локальной зоне"""
+    local = timezone.localtime(timestamp)
+    minute = local.replace(second=0, microsecond=0)
+    hour = minute.replace(minute=0)
+    return ('minute', minute), ('hour', hour), ('day', hour.replace(hour=0))
+
+
+def rebuild(affected_days: Dict[int, Set[date]]) -> int:
+    """Пересчет агрегатов ТС (по pk) за затронутые дни; возвращает число записей агрегатов"""
+    batch_size = getattr(settings, 'AUTOGRAPH_HISTORY_INGEST_BATCH', 1000)
+    created = 0
+
+    for vehicle_pk, days in affected_days.items():
+        if not days:
+            continue
+
+        start_dt, end_dt = history_store.day_bounds(min(days), max(days))
+        aggregates = {}
+
+        rows = RawTrackData.objects.filter(
+            vehicle_id=vehicle_pk, timestamp__gte=start_dt, timestamp__lt=end_dt
+        ).order_by('timestamp').values_list('timestamp', 'parameters_json')
+
+        for timestamp, values in rows.iterator(chunk_size=2000):
+            buckets = _buckets(timestamp)
+
+            for param, raw in values.items():
+                value = parse_numeric(raw)
+                if value is None or value != value:
+                    continue
+
+                for resolution, bucket in buckets:
+                    aggregate = aggregates.get((resolution, bucket, param))
+                    if aggregate is None:
+                        aggregates[(resolution, bucket, param)] = [1, value, value, value, value]
+                    else:
+                        aggregate[0] += 1
+                        aggregate[1] += value
+                        aggregate[2] = min(aggregate[2], value)
+                        aggregate[3] = max(aggregate[3], value)
+                        aggregate[4] = value
+
+        with transaction.atomic():
+            TrackRollup.objects.filter(vehicle_id=vehicle_pk, bucket__gte=start_dt, bucket__lt=end_dt).delete()
+            TrackRollup.objects.bulk_create([
+                TrackRollup(
+                    vehicle_id=vehicle_pk, resolution=resolution, bucket=bucket, parameter=param[:100],
+                    count=count, sum=total, min=low, max=high, last=last
+                )
+                for (resolution, bucket, param), (count, total, low, high, last) in aggregates.items()
+            ], batch_size=batch_size)
+
+        created += len(aggregates)
+
+    logger.info(f"📐 Пересчитано агрегатов: {created} ({len(affected_days)} ТС)")
+    return created
+
+
+def supports(aggregation: str, by_vehicle: bool) -> bool:
+    """Агрегаты по всем ТС вместе не хранят последнее значение интервала"""
+    return aggregation in ('mean', 'min', 'max', 'sum', 'count') or (aggregation == 'last' and by_vehicle)
+
+
+def _value(aggregation: str, row: Dict):
+    if aggregation == 'mean':
+        return round(row['total'] / row['value_count'], 4)
+    if aggregation == 'count':
+        return row['value_count']
+    return round({'min': row['low'], 'max': row['high'], 'sum': row['total'], 'last': row.get('last')}[aggregation], 4)
+
+
+def series(schema_id: str, device_ids: List[str], start_date: date, end_date: date, params: List[str],
+           resolution: str, aggregation: str = 'mean', by_vehicle: bool = False) -> List[Dict]:
+    """
+    Ряд ТС схемы по интервалам в формате vehicles.aggregation.aggregate:
+    [{'timestamp', ('vehicle_id', 'vehicle_name'), 'values': {param: значение}}]
+    """
+    start_dt, end_dt = history_store.day_bounds(start_date, end_date)
+
+    rows = TrackRollup.objects.filter(
+        vehicle__in=history_store.schema_vehicles(schema_id, device_ids),
+        resolution=resolution,
+        parameter__in=params,
+        bucket__gte=start_dt,
+        bucket__lt=end_dt
+    )
+
+    if by_vehicle:
+        # Запись агрегата уникальна для (ТС, параметр, интервал) - группировка не нужна
+        rows = rows.values('bucket', 'parameter', 'vehicle__vehicle_id', 'vehicle__name', 'last').annotate(
+            total=Sum('sum'), value_count=Sum('count'), low=Min('min'), high=Max('max')
+        ).order_by('bucket', 'vehicle__vehicle_id')
+    else:
+        rows = rows.values('bucket', 'parameter').annotate(
+            total=Sum('sum'), value_count=Sum('count'), low=Min('min'), high=Max('max')
+        ).order_by('bucket')
+
+    points = {}
+    key_format = KEY_FORMATS[resolution]
+
+    for row in rows:
+        key = timezone.localtime(row['bucket']).strftime(key_format)
+        if by_vehicle:
+            point = points.setdefault((key, row['vehicle__vehicle_id']), {
+                'timestamp': key,
+                'vehicle_id': row['vehicle__vehicle_id'],
+                'vehicle_name': row['vehicle__name'],
+                'values': {}
+            })
+        else:
+            point = points.setdefault(key, {'timestamp': key, 'values': {}})
+        point['values'][row['parameter']] = _value(aggregation, row)
+
+    return list(points.values())
+
+
+def summary(schema_id: str, device_ids: List[str], start_date: date, end_date: date, params: List[str]) -> Dict:
+    """Статистика параметров ТС схемы за период по дневным агрегатам"""
+    start_dt, end_dt = history_store.day_bounds(start_date, end_date)
+
+    rows = TrackRollup.objects.filter(
+        vehicle__in=history_store.schema_vehicles(schema_id, device_ids),
+        resolution='day',
+        parameter__in=params,
+        bucket__gte=start_dt,
+        bucket__lt=end_dt
+    ).values('parameter').annotate(
+        value_count=Sum('count'), total=Sum('sum'), low=Min('min'), high=Max('max')
+    )
+
+    parameter_stats = {
+        row['parameter']: {
+            'count': row['value_count'],
+            'min': row['low'],
+            'max': row['high'],
+            'avg': row['total'] / row['value_count'],
+            'sum': row['total']
+        }
+        for row in rows
+    }
+
+    return {
+        'vehicle_count': len(device_ids),
+        'time_range': {'start': start_date.isoformat(), 'end': end_date.isoformat()},
+        'parameter_stats': parameter_stats,
+        'source': 'rollups'
+    }
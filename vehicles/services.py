@@ -1,29 +1,54 @@
+import asyncio
 import logging
-import requests
-import warnings
 import time
+import requests
 from typing import Dict, List, Any
-from datetime import datetime
+from datetime import datetime, timedelta
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from api import fastjson, metadata_cache
+from api.transport import get_transport
+from . import history_store
+from .concurrency import gather_bounded, run_bounded, shared_bucket
+from .timeseries import TimeSeriesFrame
+from .trip_items import aparse_stream, merge_trip_items, parse_stream, streaming_available
 
-warnings.filterwarnings('ignore', message='Unverified HTTPS request')
 logger = logging.getLogger(__name__)
 
 
 class AutoGraphHistoricalService:
     """Улучшенный сервис для работы с историческими данными AutoGRAPH API"""
 
-    BASE_URL = "https://web.tk-ekat.ru/ServiceJSON"
-
     def __init__(self, token=None, schema_id=None):
         self.token = token
         self.schema_id = schema_id
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Accept': 'application/json',
-            'User-Agent': 'MonitoringApp/2.0'
-        })
-        self.session.verify = False
+        self.transport = get_transport()
         self.request_timeout = 300
+        self.last_merge_stats = {}
+        self.last_failed_chunks = []
+        self.last_completed_chunks = []
+        self.history_store_enabled = getattr(settings, 'AUTOGRAPH_HISTORY_STORE_ENABLED', True)
+        self._schema_device_ids = None
+
+        # Параллельная загрузка групп параметров GetTripItems
+        self.max_workers = getattr(settings, 'AUTOGRAPH_TRIP_ITEMS_MAX_WORKERS', 4)
+        # Ограничение частоты общее для процесса: на адрес API и схему, а не на запрос пользователя
+        self.rate_limiter = shared_bucket(
+            (self.transport.base_url, schema_id),
+            rate=getattr(settings, 'AUTOGRAPH_REQUESTS_PER_SECOND', 2.0),
+            capacity=getattr(settings, 'AUTOGRAPH_REQUESTS_BURST', 2)
+        )
+
+        # Повторы отрезка периода при сбое (пауза растет вдвое с каждой попыткой)
+        self.chunk_retries = getattr(settings, 'AUTOGRAPH_HISTORY_CHUNK_RETRIES', 2)
+        self.chunk_retry_backoff = getattr(settings, 'AUTOGRAPH_HISTORY_CHUNK_RETRY_BACKOFF', 1.0)
+
+        # Потоковый разбор крупных ответов GetTripItems (ijson)
+        self.stream_json = streaming_available() and getattr(settings, 'AUTOGRAPH_TRIP_ITEMS_STREAMING', True)
+        self.stream_json_min_bytes = getattr(settings, 'AUTOGRAPH_TRIP_ITEMS_STREAM_MIN_BYTES', 8 * 1024 * 1024)
 
         # Полный список всех параметров для временных рядов
         self.ALL_PARAMETERS = [
@@ -81,17 +106,33 @@ class AutoGraphHistoricalService:
             logger.info(f"  - ТС: {len(device_ids)} шт")
             logger.info(f"  - Период: {start_date} - {end_date}")
 
-            # 1. Получаем ВСЕ данные через GetTripItems
-            logger.info("1️⃣ Получение ВСЕХ данных через GetTripItems...")
-            all_data = self._get_complete_trip_items_data(device_ids, start_fmt, end_fmt)
+            # 1. Из AutoGRAPH запрашиваются только дни, которых нет в локальной истории
+            ranges = self._history_gaps(device_ids, start_date, end_date)
+            use_history = self._history_available(device_ids, start_date, end_date)
+            all_data = None
+            summary_data = {}
+
+            if ranges:
+                logger.info("1️⃣ Получение недостающих данных через GetTripItems...")
+                if use_history:
+                    # Окна отрезков сохраняются в историю и освобождаются, период читается из базы
+                    received = self._ingest_history(ranges)[1]
+                else:
+                    all_data = self._fetch_trip_items_ranges(ranges)
+                    received = bool(all_data)
+
+                if not received:
+                    logger.warning("❌ Не удалось получить данные через GetTripItems")
+                    return self._get_fallback_data(device_ids, start_date, end_date)
 
-            if not all_data:
-                logger.warning("❌ Не удалось получить данные через GetTripItems")
-                return self._get_fallback_data(device_ids, start_date, end_date)
+                # 2. Получаем данные через GetTripsTotal для сводки
+                logger.info("2️⃣ Получение сводных данных GetTripsTotal...")
+                summary_data = self._get_trips_total_data(device_ids, start_fmt, end_fmt)
+            else:
+                logger.info("1️⃣ Период уже загружен - данные из локальной истории")
 
-            # 2. Получаем данные через GetTripsTotal для сводки
-            logger.info("2️⃣ Получение сводных данных GetTripsTotal...")
-            summary_data = self._get_trips_total_data(device_ids, start_fmt, end_fmt)
+            if use_history:
+                all_data = self._load_history(device_ids, start_date, end_date)
 
             # 3. Форматируем для временных рядов (БЕЗ ОГРАНИЧЕНИЯ НА 1000 ЗАПИСЕЙ)
             logger.info("3️⃣ Форматирование данных для временных рядов...")
@@ -109,11 +150,151 @@ class AutoGraphHistoricalService:
             logger.error(f"❌ Ошибка получения расширенных данных: {e}", exc_info=True)
             return self._get_fallback_data(device_ids, start_date, end_date)
 
+    # ==================== ЛОКАЛЬНАЯ ИСТОРИЯ ====================
+
+    def _history_gaps(self, device_ids: List[str], start_date: str, end_date: str) -> List[tuple]:
+        """
+        Диапазоны для запроса в AutoGRAPH [(ТС, SD, ED)] - пропуски индекса покрытия.
+        ТС с одинаковыми пропусками запрашиваются вместе; без локальной истории - весь период.
+        """
+        full_period = [(device_ids, start_date.replace('-', ''), end_date.replace('-', '') + '-2359')]
+
+        if not self._history_available(device_ids, start_date, end_date):
+            return full_period
+
+        start, end = history_store.parse_date(start_date), history_store.parse_date(end_date)
+
+        try:
+            intervals = history_store.coverage(self.schema_id, device_ids, self.ALL_PARAMETERS)
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения локальной истории: {e}")
+            return full_period
+
+        devices_by_gaps = {}
+        for device_id in device_ids:
+            gaps = tuple(history_store.missing_ranges(intervals.get(device_id, []), start, end))
+            if gaps:
+                devices_by_gaps.setdefault(gaps, []).append(device_id)
+
+        ranges = [
+            (gap_devices, gap_start.strftime('%Y%m%d'), gap_end.strftime('%Y%m%d') + '-2359')
+            for gaps, gap_devices in devices_by_gaps.items()
+            for gap_start, gap_end in gaps
+        ]
+
+        days = sum((gap_end - gap_start).days + 1 for gaps in devices_by_gaps for gap_start, gap_end in gaps)
+        logger.info(f"🗂️ Локальная история: к запросу {len(ranges)} диапазонов ({days} дн.) из {(end - start).days + 1} дн.")
+        return ranges
+
+    def ensure_history(self, device_ids: List[str], start_date: str, end_date: str) -> bool:
+        """
+        Догрузка недостающих дней периода в локальную историю (без форматирования).
+        True - весь период есть в базе и агрегаты TrackRollup актуальны.
+        """
+        if not self._history_available(device_ids, start_date, end_date):
+            return False
+
+        ranges = self._history_gaps(device_ids, start_date, end_date)
+        if not ranges:
+            return True
+
+        return self._ingest_history(ranges)[0]
+
+    def _ingest_history(self, ranges: List[tuple]) -> tuple:
+        """
+        Загрузка диапазонов в локальную историю: окно отрезков загружается, сохраняется
+        и освобождается до загрузки следующего - память не растет с длиной периода.
+        Возвращает (все отрезки сохранены, получены хоть какие-то данные).
+        """
+        complete, received, failed_chunks = True, False, []
+        for tasks in self._history_windows(ranges):
+            results = self._fetch_trip_items_tasks(tasks)
+            self._remember_chunks(tasks, results)
+            failed_chunks.extend(self.last_failed_chunks)
+            window_data = self._merge_trip_items_data(results)
+            received = received or bool(window_data)
+            complete = self._store_fetched_history(window_data) and complete
+
+        self.last_failed_chunks = failed_chunks
+        return complete, received
+
+    def _history_windows(self, ranges: List[tuple]) -> List[List[tuple]]:
+        """Запросы диапазонов окнами целых отрезков: все группы параметров отрезка - в одном окне"""
+        tasks = self._trip_items_tasks(ranges)
+        groups = len(self._split_parameters_into_groups(self.ALL_PARAMETERS, group_size=50))
+        window = max(self.max_workers // groups, 1) * groups
+        return [tasks[i:i + window] for i in range(0, len(tasks), window)]
+
+    def _history_available(self, device_ids: List[str], start_date: str, end_date: str) -> bool:
+        """Локальную историю можно использовать: период задан и все ТС запроса - из схемы сессии"""
+        return bool(
+            self.history_store_enabled and self.token and self.schema_id and device_ids
+            and history_store.parse_date(start_date) and history_store.parse_date(end_date)
+            and self._devices_in_schema(device_ids)
+        )
+
+    def _devices_in_schema(self, device_ids: List[str]) -> bool:
+        """
+        ТС запроса есть в EnumDevices схемы сессии (кэш справочников). История
+        отдается из базы без обращения к AutoGRAPH, поэтому ID из тела запроса
+        проверяются до чтения хранилища.
+        """
+        if self._schema_device_ids is None:
+            devices = AutoGraphDeviceService(token=self.token).get_devices(self.schema_id)
+            self._schema_device_ids = {device['id'] for device in devices}
+
+        foreign = set(device_ids) - self._schema_device_ids
+        if foreign:
+            logger.warning(f"⚠️ ТС не из схемы {self.schema_id}: {len(foreign)} - локальная история не используется")
+        return not foreign
+
+    def _store_fetched_history(self, fresh_data: Dict) -> bool:
+        """Сохранение догруженных дней; True - получены все отрезки"""
+        if not fresh_data:
+            return False
+
+        try:
+            self._store_history(fresh_data)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения в локальную историю: {e}")
+            return False
+
+        return not self.last_failed_chunks
+
+    def _store_history(self, fresh_data: Dict):
+        """Сохранение полученных строк; загруженными отмечаются только отрезки, полученные по всем группам параметров"""
+        if self.last_failed_chunks:
+            logger.warning(f"⚠️ Не получено отрезков: {len(self.last_failed_chunks)} - они не отмечаются загруженными")
+
+        if fresh_data:
+            history_store.ingest_trip_items(self.schema_id, fresh_data)
+
+        for chunk_devices, chunk_start, chunk_end in self.last_completed_chunks:
+            names = {
+                device_id: (fresh_data or {}).get(device_id, {}).get('Name', f'ТС {device_id[:8]}')
+                for device_id in chunk_devices
+            }
+            history_store.mark_covered(
+                self.schema_id, names,
+                datetime.strptime(chunk_start[:8], '%Y%m%d').date(),
+                datetime.strptime(chunk_end[:8], '%Y%m%d').date(),
+                self.ALL_PARAMETERS
+            )
+
+    def _load_history(self, device_ids: List[str], start_date: str, end_date: str) -> Dict:
+        """Период из локальной истории в формате ответа GetTripItems"""
+        start, end = history_store.parse_date(start_date), history_store.parse_date(end_date)
+        return history_store.load_trip_items(self.schema_id, device_ids, start, end)
+
     def _format_for_timeseries_full(self, all_data: Dict, summary_data: Dict,
                                   start_date: str, end_date: str) -> Dict:
-        """Форматирование данных для временных рядов (БЕЗ ОГРАНИЧЕНИЙ)"""
+        """
+        Форматирование данных для временных рядов (БЕЗ ОГРАНИЧЕНИЙ).
+        Записи хранятся в колоночном TimeSeriesFrame ('frame'), список
+        словарей строится только при формировании ответа API.
+        """
         processed_data = {
-            'time_series': [],
+            'frame': TimeSeriesFrame.empty(),
             'summary': {},
             'vehicle_info': {},
             'parameters': [],
@@ -126,58 +307,32 @@ class AutoGraphHistoricalService:
             logger.warning("⚠️ Нет данных для форматирования")
             return processed_data
 
-        total_records = 0
+        frame = TimeSeriesFrame.from_trip_items(all_data).sort_by_time()
 
-        for device_id, device_data in all_data.items():
-            try:
-                if not device_data or not isinstance(device_data, dict):
-                    logger.warning(f"⚠️ Пропускаем некорректные данные ТС {device_id}")
-                    continue
+        processed_data['frame'] = frame
+        processed_data['vehicle_info'] = self._vehicle_info(all_data)
+        processed_data['parameters'] = list(frame.parameters)
+        processed_data['total_records'] = len(frame)
+        processed_data['summary'] = self._create_timeseries_summary(frame, summary_data)
 
-                vehicle_name = device_data.get('Name', f'ТС {device_id[:8]}')
-                params = device_data.get('Params', [])
-                items = device_data.get('Items', [])
-
-                if not items:
-                    logger.debug(f"⚠️ Нет записей для ТС {vehicle_name}")
-                    continue
-
-                processed_data['vehicle_info'][device_id] = {
-                    'name': vehicle_name,
-                    'param_count': len(params),
-                    'item_count': len(items)
-                }
-
-                if params and isinstance(params, list):
-                    for param in params:
-                        if param and param not in processed_data['parameters']:
-                            processed_data['parameters'].append(param)
-
-                # ВАЖНО: УБИРАЕМ ОГРАНИЧЕНИЕ НА 1000 ЗАПИСЕЙ
-                for item in items:  # Без [:1000]
-                    if not item or not isinstance(item, dict):
-                        continue
-
-                    time_point = self._create_time_point(item, params, vehicle_name, device_id)
-                    if time_point:
-                        processed_data['time_series'].append(time_point)
-                        total_records += 1
+        logger.info(f"📊 Итог: {len(frame)} записей, {len(frame.parameters)} параметров")
+        return processed_data
 
-                logger.info(f"✅ Обработан ТС {vehicle_name}: {len(items)} записей, {len(params)} параметров")
+    def _vehicle_info(self, all_data: Dict) -> Dict:
+        """Сведения о ТС с записями в ответе GetTripItems"""
+        vehicle_info = {}
 
-            except Exception as e:
-                logger.error(f"❌ Ошибка обработки ТС {device_id}: {e}")
+        for device_id, device_data in all_data.items():
+            if not device_data or not isinstance(device_data, dict) or not device_data.get('Items'):
+                continue
 
-        processed_data['time_series'].sort(key=lambda x: x.get('timestamp', ''))
-        processed_data['total_records'] = total_records
+            vehicle_info[device_id] = {
+                'name': device_data.get('Name', f'ТС {device_id[:8]}'),
+                'param_count': len(device_data.get('Params', []) or []),
+                'item_count': len(device_data['Items'])
+            }
 
-        processed_data['summary'] = self._create_timeseries_summary(
-            processed_data['time_series'],
-            summary_data
-        )
-
-        logger.info(f"📊 Итог: {total_records} записей, {len(processed_data['parameters'])} параметров")
-        return processed_data
+        return vehicle_info
 
     def _get_fallback_data(self, device_ids: List[str], start_date: str, end_date: str) -> Dict:
         """Получение данных fallback способом для совместимости"""
@@ -205,48 +360,26 @@ class AutoGraphHistoricalService:
                 return self._create_empty_response(start_date, end_date)
 
             # Форматируем минимальные данные
+            frame = TimeSeriesFrame.from_trip_items(data).sort_by_time()
+
             processed_data = {
-                'time_series': [],
+                'frame': frame,
                 'summary': {},
-                'vehicle_info': {},
-                'parameters': [],
-                'total_records': 0,
+                'vehicle_info': self._vehicle_info(data),
+                'parameters': list(frame.parameters),
+                'total_records': len(frame),
                 'period': {'start': start_date, 'end': end_date},
                 'data_type': 'fallback_basic'
             }
 
-            for device_id, device_data in data.items():
-                if not device_data:
-                    continue
-
-                vehicle_name = device_data.get('Name', f'ТС {device_id[:8]}')
-                params = device_data.get('Params', [])
-                items = device_data.get('Items', [])
-
-                processed_data['vehicle_info'][device_id] = {
-                    'name': vehicle_name,
-                    'param_count': len(params),
-                    'item_count': len(items)
-                }
-
-                # Обрабатываем записи (БЕЗ ОГРАНИЧЕНИЙ)
-                for item in items:  # Без [:100]
-                    time_point = self._create_time_point(item, params, vehicle_name, device_id)
-                    if time_point:
-                        processed_data['time_series'].append(time_point)
-
-            processed_data['time_series'].sort(key=lambda x: x.get('timestamp', ''))
-            processed_data['total_records'] = len(processed_data['time_series'])
-
             # Создаем простую сводку
-            if processed_data['time_series']:
+            if len(frame):
                 processed_data['summary'] = {
                     'total_records': processed_data['total_records'],
                     'vehicle_count': len(processed_data['vehicle_info']),
                     'time_range': {
-                        'first': processed_data['time_series'][0].get('timestamp'),
-                        'last': processed_data['time_series'][-1].get('timestamp') if processed_data[
-                            'time_series'] else None
+                        'first': frame.timestamps[0].item(),
+                        'last': frame.timestamps[-1].item()
                     }
                 }
 
@@ -276,67 +409,111 @@ class AutoGraphHistoricalService:
 
     def _get_complete_trip_items_data(self, device_ids: List[str], start_fmt: str, end_fmt: str) -> Dict:
         """
-        Получаем полные данные через GetTripItems с оптимизацией
+        Получаем полные данные через GetTripItems с оптимизацией:
+        длинный период делится на отрезки, каждый отрезок - на группы параметров
         """
-        # Разбиваем на группы по 50 параметров для избежания превышения лимита URL
-        param_groups = self._split_parameters_into_groups(self.ALL_PARAMETERS, group_size=50)
+        return self._fetch_trip_items_ranges([(device_ids, start_fmt, end_fmt)])
+
+    def _fetch_trip_items_ranges(self, ranges: List[tuple]) -> Dict:
+        """Загрузка диапазонов [(ТС, SD, ED)] GetTripItems и объединение результата"""
+        tasks = self._trip_items_tasks(ranges)
+        results = self._fetch_trip_items_tasks(tasks)
+
+        self._remember_chunks(tasks, results)
+
+        # Объединяем строго в порядке (отрезок, группа), чтобы результат не зависел от порядка ответов
+        return self._merge_trip_items_data(results)
+
+    def _fetch_trip_items_tasks(self, tasks: List[tuple]) -> List[Dict]:
+        """Ответы запросов GetTripItems в порядке tasks"""
+        def fetch_task(indexed_task):
+            i, (task_devices, chunk_start, chunk_end, param_group) = indexed_task
+            logger.info(f"📦 Запрос {i + 1}/{len(tasks)}: {chunk_start} - {chunk_end}, "
+                        f"{len(task_devices)} ТС, {len(param_group)} параметров")
+            return self._get_trip_items_chunk(task_devices, chunk_start, chunk_end, param_group)
+
+        # Отрезки и группы запрашиваются параллельно, частота ограничивается token bucket
+        return run_bounded(
+            fetch_task,
+            enumerate(tasks),
+            max_workers=self.max_workers,
+            rate_limiter=self.rate_limiter
+        )
 
-        all_data = {}
+    def _remember_chunks(self, tasks: List[tuple], results: List[Dict]):
+        """
+        Отрезки (ТС, SD, ED), полученные по всем группам параметров (last_completed_chunks),
+        и отрезки, по которым не получена хотя бы одна группа (last_failed_chunks)
+        """
+        chunks = {}
+        for (task_devices, chunk_start, chunk_end, _), data in zip(tasks, results):
+            chunk = (tuple(task_devices), chunk_start, chunk_end)
+            chunks[chunk] = chunks.get(chunk, True) and bool(data)
 
-        for i, param_group in enumerate(param_groups):
-            logger.info(f"📦 Запрос группы параметров {i + 1}/{len(param_groups)} ({len(param_group)} параметров)")
+        self.last_completed_chunks = [chunk for chunk, complete in chunks.items() if complete]
+        self.last_failed_chunks = [chunk for chunk, complete in chunks.items() if not complete]
 
-            data = self._get_trip_items_data_with_params(
-                device_ids=device_ids,
-                start_fmt=start_fmt,
-                end_fmt=end_fmt,
-                params=param_group
-            )
-
-            if not data:
-                logger.warning(f"❌ Группа параметров {i + 1} не вернула данных")
-                continue
+    def _trip_items_tasks(self, ranges: List[tuple]) -> List[tuple]:
+        """Запросы GetTripItems: (ТС, SD, ED, группа параметров) в хронологическом порядке диапазонов"""
+        # Разбиваем на группы по 50 параметров для избежания превышения лимита URL
+        param_groups = self._split_parameters_into_groups(self.ALL_PARAMETERS, group_size=50)
 
-            # Объединяем данные
-            self._merge_trip_items_data(all_data, data)
+        return [
+            (range_devices, chunk_start, chunk_end, group)
+            for range_devices, start_fmt, end_fmt in ranges
+            for chunk_start, chunk_end in self._split_period(start_fmt, end_fmt)
+            for group in param_groups
+        ]
 
-            time.sleep(0.5)
+    def _split_period(self, start_fmt: str, end_fmt: str) -> List[tuple]:
+        """Разбиение периода SD..ED на отрезки по AUTOGRAPH_HISTORY_CHUNK_DAYS дней"""
+        chunk_days = getattr(settings, 'AUTOGRAPH_HISTORY_CHUNK_DAYS', 7)
 
-        return all_data if all_data else None
+        try:
+            start = datetime.strptime(start_fmt[:8], '%Y%m%d')
+            end = datetime.strptime(end_fmt[:8], '%Y%m%d')
+        except ValueError:
+            return [(start_fmt, end_fmt)]
+
+        if not chunk_days or chunk_days <= 0 or (end - start).days < chunk_days:
+            return [(start_fmt, end_fmt)]
+
+        chunks = []
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            chunks.append((chunk_start.strftime('%Y%m%d'), chunk_end.strftime('%Y%m%d') + '-2359'))
+            chunk_start = chunk_end + timedelta(days=1)
+
+        logger.info(f"📅 Период разбит на {len(chunks)} отрезков по {chunk_days} дн.")
+        return chunks
+
+    def _get_trip_items_chunk(self, device_ids: List[str], start_fmt: str, end_fmt: str,
+                              params: List[str]) -> Dict:
+        """Запрос одного отрезка с повторами: сбой отрезка не отменяет весь период"""
+        for attempt in range(self.chunk_retries + 1):
+            if attempt:
+                logger.warning(f"🔁 Повтор {attempt}/{self.chunk_retries} отрезка {start_fmt} - {end_fmt}")
+                time.sleep(self.chunk_retry_backoff * 2 ** (attempt - 1))
+                self.rate_limiter.acquire()
+
+            data = self._get_trip_items_data_with_params(device_ids, start_fmt, end_fmt, params)
+            if data:
+                return data
+
+        logger.error(f"❌ Отрезок {start_fmt} - {end_fmt} не получен после {self.chunk_retries + 1} попыток")
+        return {}
 
     def _get_trip_items_data_with_params(self, device_ids: List[str], start_fmt: str,
                                          end_fmt: str, params: List[str]) -> Dict:
         """Получаем данные с конкретными параметрами"""
-        url = f"{self.BASE_URL}/GetTripItems"
-
-        params_str = ','.join(params)
-
-        request_params = {
-            'session': self.token,
-            'schemaID': self.schema_id,
-            'IDs': ','.join(device_ids),
-            'SD': start_fmt,
-            'ED': end_fmt,
-            'tripSplitterIndex': 0,
-            'tripParams': params_str,
-            'stage': 'Motion,Idle,Parking,Unknown'
-        }
+        request_params = self._trip_items_request_params(device_ids, start_fmt, end_fmt, params)
 
         try:
             logger.debug(f"Отправка запроса с параметрами: {len(params)} шт")
-            response = self.session.get(url, params=request_params, timeout=90)
-
-            if response.status_code == 200:
-                data = response.json()
-                if data and isinstance(data, dict):
-                    logger.debug(f"✅ Получены данные для {len(data)} ТС")
-                    return data
-                else:
-                    logger.warning(f"⚠️ Данные пустые или в неверном формате")
-                    return {}
-            else:
-                logger.error(f"❌ HTTP {response.status_code}: {response.text[:200]}")
-                return {}
+            response = self.transport.get('GetTripItems', params=request_params, stream=self.stream_json)
+            with response:
+                return self._parse_trip_items_response(response, streamed=self.stream_json)
 
         except requests.exceptions.Timeout:
             logger.error(f"❌ Таймаут запроса")
@@ -345,136 +522,105 @@ class AutoGraphHistoricalService:
             logger.error(f"❌ Ошибка запроса: {e}")
             return {}
 
-    def _merge_trip_items_data(self, main_data: Dict, new_data: Dict):
-        """Объединение данных из нескольких запросов"""
-        if not new_data or not isinstance(new_data, dict):
-            logger.warning("⚠️ Попытка объединить пустые или некорректные данные")
-            return
-
-        for device_id, device_data in new_data.items():
-            if not device_data or not isinstance(device_data, dict):
-                logger.warning(f"⚠️ Пропускаем некорректные данные для ТС {device_id}")
-                continue
-
-            if device_id not in main_data:
-                main_data[device_id] = {
-                    'Name': device_data.get('Name', f'ТС {device_id[:8]}'),
-                    'Params': [],
-                    'Items': []
-                }
+    def _trip_items_request_params(self, device_ids: List[str], start_fmt: str,
+                                   end_fmt: str, params: List[str]) -> Dict:
+        """Параметры запроса GetTripItems"""
+        return {
+            'session': self.token,
+            'schemaID': self.schema_id,
+            'IDs': ','.join(device_ids),
+            'SD': start_fmt,
+            'ED': end_fmt,
+            'tripSplitterIndex': 0,
+            'tripParams': ','.join(params),
+            'stage': 'Motion,Idle,Parking,Unknown'
+        }
 
-            existing_params = main_data[device_id]['Params']
-            new_params = device_data.get('Params', [])
+    def _parse_trip_items_response(self, response, streamed: bool = False) -> Dict:
+        """Разбор ответа GetTripItems (requests)"""
+        if response.status_code == 200:
+            return self._trip_items_result(self._read_trip_items_body(response, streamed))
+        else:
+            logger.error(f"❌ HTTP {response.status_code}: {response.text[:200]}")
+            return {}
 
-            if new_params and isinstance(new_params, list):
-                for param in new_params:
-                    if param not in existing_params:
-                        existing_params.append(param)
+    async def _aparse_trip_items_response(self, response) -> Dict:
+        """Асинхронная версия _parse_trip_items_response (потоковый ответ httpx)"""
+        if response.status_code == 200:
+            return self._trip_items_result(await self._aread_trip_items_body(response))
+        else:
+            await response.aread()
+            logger.error(f"❌ HTTP {response.status_code}: {response.text[:200]}")
+            return {}
 
-            existing_items = main_data[device_id]['Items']
-            new_items = device_data.get('Items', [])
+    def _trip_items_result(self, data) -> Dict:
+        if data and isinstance(data, dict):
+            logger.debug(f"✅ Получены данные для {len(data)} ТС")
+            return data
+        else:
+            logger.warning(f"⚠️ Данные пустые или в неверном формате")
+            return {}
 
-            if not existing_items and new_items:
-                main_data[device_id]['Items'] = new_items.copy()
-            elif existing_items and new_items and len(existing_items) == len(new_items):
-                for i, (existing_item, new_item) in enumerate(zip(existing_items, new_items)):
-                    if i < len(new_item.get('Values', [])):
-                        existing_item['Values'].extend(new_item['Values'])
+    def _streams_body(self, response) -> bool:
+        """Тело разбирается потоково: ответ без длины (chunked) или не меньше AUTOGRAPH_TRIP_ITEMS_STREAM_MIN_BYTES"""
+        length = int(response.headers.get('Content-Length') or 0)
+        if self.stream_json and (not length or length >= self.stream_json_min_bytes):
+            logger.debug(f"🌊 Потоковый разбор GetTripItems ({length or 'chunked'} байт)")
+            return True
+        return False
 
-    def _create_time_point(self, item: Dict, params: List[str],
-                           vehicle_name: str, device_id: str) -> Dict:
-        """Создание точки временного ряда"""
-        if not item or not isinstance(item, dict):
-            return None
+    def _read_trip_items_body(self, response, streamed: bool):
+        """
+        Тело ответа: крупный ответ, полученный с stream=True, разбирается инкрементально
+        из сокета (без исходных байт и текста в памяти), остальные - целиком через orjson
+        """
+        if streamed and self._streams_body(response):
+            response.raw.decode_content = True
+            return parse_stream(response.raw)
 
-        timestamp = item.get('DT', '')
-        if not timestamp:
-            return None
+        return fastjson.parse_response(response)
 
-        time_point = {
-            'timestamp': timestamp,
-            'vehicle_id': device_id,
-            'vehicle_name': vehicle_name,
-            'stage': item.get('Stage', 'Unknown'),
-            'duration': item.get('Duration', ''),
-            'caption': item.get('Caption', ''),
-            'values': {},
-            'raw_values': item.get('Values', [])
-        }
+    async def _aread_trip_items_body(self, response):
+        """Асинхронная версия _read_trip_items_body: крупный ответ разбирается по мере получения"""
+        if self._streams_body(response):
+            return await aparse_stream(response.aiter_bytes())
 
-        values = item.get('Values', [])
-        if values and isinstance(values, list):
-            for i, param in enumerate(params):
-                if i < len(values):
-                    value = values[i]
-                    numeric_value = self._parse_numeric_value(value)
+        await response.aread()
+        return fastjson.parse_response(response)
 
-                    if numeric_value is not None:
-                        time_point['values'][param] = numeric_value
-                    else:
-                        time_point['values'][param] = value
+    def _merge_trip_items_data(self, responses: List[Dict]) -> Dict:
+        """Объединение ответов групп параметров по ключу (DT, Stage); None - нет данных"""
+        all_data, self.last_merge_stats = merge_trip_items(responses)
+        return all_data
 
-        return time_point
-
-    def _create_timeseries_summary(self, time_series: List[Dict], summary_data: Dict) -> Dict:
-        """Создание сводки для временных рядов"""
+    def _create_timeseries_summary(self, frame: TimeSeriesFrame, summary_data: Dict) -> Dict:
+        """Создание сводки для временных рядов (один проход по колонкам, без перебора записей)"""
         summary = {
-            'total_records': len(time_series),
-            'vehicle_count': len(set(p.get('vehicle_id', '') for p in time_series if p.get('vehicle_id'))),
+            'total_records': len(frame),
+            'vehicle_count': len(frame.vehicles),
             'time_range': {},
             'parameter_stats': {},
             'vehicle_stats': {}
         }
 
-        if not time_series:
+        if not len(frame):
             return summary
 
-        timestamps = [p.get('timestamp', '') for p in time_series if p.get('timestamp')]
-        if timestamps:
-            summary['time_range']['first'] = min(timestamps)
-            summary['time_range']['last'] = max(timestamps)
-
-        all_params = set()
-        for point in time_series:
-            if point.get('values'):
-                all_params.update(point['values'].keys())
-
-        for param in all_params:
-            values = []
-            for point in time_series:
-                if param in point.get('values', {}):
-                    value = point['values'][param]
-                    if isinstance(value, (int, float)):
-                        values.append(value)
-
-            if values:
-                summary['parameter_stats'][param] = {
-                    'count': len(values),
-                    'min': min(values),
-                    'max': max(values),
-                    'avg': sum(values) / len(values),
-                    'sum': sum(values)
-                }
+        # Записи отсортированы по времени
+        summary['time_range']['first'] = frame.timestamps[0].item()
+        summary['time_range']['last'] = frame.timestamps[-1].item()
 
-        vehicles = {}
-        for point in time_series:
-            vehicle_id = point.get('vehicle_id')
-            if vehicle_id:
-                if vehicle_id not in vehicles:
-                    vehicles[vehicle_id] = {
-                        'name': point.get('vehicle_name', ''),
-                        'record_count': 0,
-                        'params': set()
-                    }
-                vehicles[vehicle_id]['record_count'] += 1
-                if point.get('values'):
-                    vehicles[vehicle_id]['params'].update(point['values'].keys())
+        stats = frame.describe()
+        summary['parameter_stats'] = stats['parameters']
+
+        record_counts = np.bincount(frame.vehicle_codes, minlength=len(frame.vehicles))
 
-        for vehicle_id, stats in vehicles.items():
+        for code, (vehicle_id, name) in enumerate(frame.vehicles):
             summary['vehicle_stats'][vehicle_id] = {
-                'name': stats['name'],
-                'record_count': stats['record_count'],
-                'param_count': len(stats['params'])
+                'name': name,
+                'record_count': int(record_counts[code]),
+                'param_count': int(stats['present'][code].sum()),
+                'parameter_stats': stats['vehicles'][code]
             }
 
         return summary
@@ -490,26 +636,29 @@ class AutoGraphHistoricalService:
 
     def _get_trips_total_data(self, device_ids: List[str], start_fmt: str, end_fmt: str) -> Dict:
         """Получаем сводные данные через GetTripsTotal"""
-        url = f"{self.BASE_URL}/GetTripsTotal"
-        params = {
-            'session': self.token,
-            'schemaID': self.schema_id,
-            'IDs': ','.join(device_ids),
-            'SD': start_fmt,
-            'ED': end_fmt,
-            'tripSplitterIndex': 0
-        }
+        params = self._trips_total_request_params(device_ids, start_fmt, end_fmt)
 
         try:
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.transport.get('GetTripsTotal', params=params)
 
             if response.status_code == 200:
-                return response.json()
+                return fastjson.parse_response(response)
         except Exception as e:
             logger.error(f"❌ GetTripsTotal ошибка: {e}")
 
         return {}
 
+    def _trips_total_request_params(self, device_ids: List[str], start_fmt: str, end_fmt: str) -> Dict:
+        """Параметры запроса GetTripsTotal"""
+        return {
+            'session': self.token,
+            'schemaID': self.schema_id,
+            'IDs': ','.join(device_ids),
+            'SD': start_fmt,
+            'ED': end_fmt,
+            'tripSplitterIndex': 0
+        }
+
     def get_historical_data(self, device_ids: List[str], start_date: str, end_date: str) -> Dict:
         """
         Совместимый метод для получения исторических данных
@@ -517,54 +666,168 @@ class AutoGraphHistoricalService:
         """
         return self.get_extended_historical_data(device_ids, start_date, end_date)
 
-    def _parse_numeric_value(self, value):
-        """Парсинг числового значения"""
-        if value is None:
-            return None
+    # ==================== АСИНХРОННЫЙ РЕЖИМ (ASGI) ====================
 
-        if isinstance(value, (int, float)):
-            return float(value)
+    @property
+    def async_transport(self):
+        """Асинхронный транспорт (httpx импортируется только в ASGI-режиме)"""
+        from api.async_transport import get_async_transport
+        return get_async_transport()
 
-        if isinstance(value, str):
-            try:
-                clean_value = value.replace(',', '.').strip()
-                if clean_value == '':
-                    return None
-                return float(clean_value)
-            except:
-                return None
+    async def aget_extended_historical_data(self, device_ids: List[str], start_date: str, end_date: str) -> Dict:
+        """
+        Асинхронная версия get_extended_historical_data:
+        запросы к AutoGRAPH не блокируют воркер, форматирование выполняется в потоке
+        """
+        if not self.token or not self.schema_id or not device_ids:
+            logger.error("Отсутствуют необходимые параметры")
+            return {}
+
+        fallback = sync_to_async(self._get_fallback_data, thread_sensitive=False)
+
+        try:
+            start_fmt = start_date.replace('-', '')
+            end_fmt = end_date.replace('-', '') + '-2359'
+
+            logger.info(f"📊 Асинхронный запрос исторических данных: {len(device_ids)} ТС, {start_date} - {end_date}")
+
+            ranges = await sync_to_async(self._history_gaps)(device_ids, start_date, end_date)
+            use_history = await sync_to_async(self._history_available)(device_ids, start_date, end_date)
+            all_data = None
+            summary_data = {}
+
+            if ranges:
+                if use_history:
+                    received = (await self._aingest_history(ranges))[1]
+                else:
+                    all_data = await self._afetch_trip_items_ranges(ranges)
+                    received = bool(all_data)
+
+                if not received:
+                    logger.warning("❌ Не удалось получить данные через GetTripItems")
+                    return await fallback(device_ids, start_date, end_date)
+
+                summary_data = await self._aget_trips_total_data(device_ids, start_fmt, end_fmt)
+            else:
+                logger.info("1️⃣ Период уже загружен - данные из локальной истории")
+
+            if use_history:
+                all_data = await sync_to_async(self._load_history)(device_ids, start_date, end_date)
+
+            processed_data = await sync_to_async(self._format_for_timeseries_full, thread_sensitive=False)(
+                all_data=all_data,
+                summary_data=summary_data,
+                start_date=start_date,
+                end_date=end_date
+            )
+
+            logger.info(f"✅ Данные успешно обработаны: {processed_data.get('total_records', 0)} записей")
+            return processed_data
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения расширенных данных: {e}", exc_info=True)
+            return await fallback(device_ids, start_date, end_date)
+
+    async def aensure_history(self, device_ids: List[str], start_date: str, end_date: str) -> bool:
+        """Асинхронная версия ensure_history"""
+        if not await sync_to_async(self._history_available)(device_ids, start_date, end_date):
+            return False
+
+        ranges = await sync_to_async(self._history_gaps)(device_ids, start_date, end_date)
+        if not ranges:
+            return True
+
+        return (await self._aingest_history(ranges))[0]
+
+    async def _aingest_history(self, ranges: List[tuple]) -> tuple:
+        """Асинхронная версия _ingest_history"""
+        complete, received, failed_chunks = True, False, []
+        for tasks in self._history_windows(ranges):
+            results = await self._afetch_trip_items_tasks(tasks)
+            self._remember_chunks(tasks, results)
+            failed_chunks.extend(self.last_failed_chunks)
+            window_data = self._merge_trip_items_data(results)
+            received = received or bool(window_data)
+            stored = await sync_to_async(self._store_fetched_history)(window_data)
+            complete = stored and complete
+
+        self.last_failed_chunks = failed_chunks
+        return complete, received
+
+    async def _aget_complete_trip_items_data(self, device_ids: List[str], start_fmt: str, end_fmt: str) -> Dict:
+        """Асинхронная загрузка всех отрезков периода и групп параметров GetTripItems"""
+        return await self._afetch_trip_items_ranges([(device_ids, start_fmt, end_fmt)])
+
+    async def _afetch_trip_items_ranges(self, ranges: List[tuple]) -> Dict:
+        """Асинхронная версия _fetch_trip_items_ranges"""
+        tasks = self._trip_items_tasks(ranges)
+        results = await self._afetch_trip_items_tasks(tasks)
+
+        self._remember_chunks(tasks, results)
+        return self._merge_trip_items_data(results)
+
+    async def _afetch_trip_items_tasks(self, tasks: List[tuple]) -> List[Dict]:
+        """Асинхронная версия _fetch_trip_items_tasks"""
+        async def fetch_task(task):
+            task_devices, chunk_start, chunk_end, param_group = task
+            return await self._aget_trip_items_chunk(task_devices, chunk_start, chunk_end, param_group)
+
+        return await gather_bounded(
+            fetch_task,
+            tasks,
+            max_workers=self.max_workers,
+            rate_limiter=self.rate_limiter
+        )
 
-        return None
+    async def _aget_trip_items_chunk(self, device_ids: List[str], start_fmt: str, end_fmt: str,
+                                     params: List[str]) -> Dict:
+        """Асинхронная версия _get_trip_items_chunk"""
+        for attempt in range(self.chunk_retries + 1):
+            if attempt:
+                logger.warning(f"🔁 Повтор {attempt}/{self.chunk_retries} отрезка {start_fmt} - {end_fmt}")
+                await asyncio.sleep(self.chunk_retry_backoff * 2 ** (attempt - 1))
+                await self.rate_limiter.acquire_async()
 
-    def _time_str_to_hours(self, time_str: str) -> float:
-        """Преобразует строку времени (HH:MM:SS) в часы"""
-        if not time_str:
-            return 0.0
+            data = await self._aget_trip_items_data_with_params(device_ids, start_fmt, end_fmt, params)
+            if data:
+                return data
+
+        logger.error(f"❌ Отрезок {start_fmt} - {end_fmt} не получен после {self.chunk_retries + 1} попыток")
+        return {}
+
+    async def _aget_trip_items_data_with_params(self, device_ids: List[str], start_fmt: str,
+                                                end_fmt: str, params: List[str]) -> Dict:
+        """Асинхронный запрос GetTripItems с конкретными параметрами"""
+        request_params = self._trip_items_request_params(device_ids, start_fmt, end_fmt, params)
 
         try:
-            parts = time_str.split(':')
-            hours = float(parts[0]) if len(parts) > 0 else 0
-            minutes = float(parts[1]) if len(parts) > 1 else 0
-            seconds = float(parts[2]) if len(parts) > 2 else 0
+            async with self.async_transport.stream('GetTripItems', params=request_params) as response:
+                return await self._aparse_trip_items_response(response)
+        except Exception as e:
+            logger.error(f"❌ Ошибка запроса: {e}")
+            return {}
+
+    async def _aget_trips_total_data(self, device_ids: List[str], start_fmt: str, end_fmt: str) -> Dict:
+        """Асинхронный запрос GetTripsTotal"""
+        params = self._trips_total_request_params(device_ids, start_fmt, end_fmt)
 
-            return hours + minutes / 60 + seconds / 3600
-        except:
-            return 0.0
+        try:
+            response = await self.async_transport.get('GetTripsTotal', params=params)
+
+            if response.status_code == 200:
+                return fastjson.parse_response(response)
+        except Exception as e:
+            logger.error(f"❌ GetTripsTotal ошибка: {e}")
+
+        return {}
 
 
 class AutoGraphDeviceService:
     """Сервис для работы с устройствами AutoGRAPH"""
 
-    BASE_URL = "https://web.tk-ekat.ru/ServiceJSON"
-
     def __init__(self, token=None):
         self.token = token
-        self.session = requests.Session()
-        self.session.verify = False
-        self.session.headers.update({
-            'Accept': 'application/json',
-            'User-Agent': 'DeviceService/2.0'
-        })
+        self.transport = get_transport()
 
     def get_devices(self, schema_id: str) -> List[Dict]:
         """Получение списка устройств"""
@@ -573,20 +836,15 @@ class AutoGraphDeviceService:
                 logger.error("Нет токена или ID схемы")
                 return []
 
-            devices_url = f"{self.BASE_URL}/EnumDevices"
             params = {
                 'session': self.token,
                 'schemaID': schema_id
             }
 
-            logger.info(f"Запрос устройств через EnumDevices: schemaID={schema_id}")
-            response = self.session.get(devices_url, params=params, timeout=15)
-
-            if response.status_code != 200:
-                logger.error(f"Ошибка получения устройств: HTTP {response.status_code}")
-                return []
-
-            devices_data = response.json()
+            devices_data = metadata_cache.get_or_fetch(
+                'EnumDevices', metadata_cache.schema_scope(schema_id),
+                lambda: self._fetch_devices(params)
+            )
 
             devices = []
 
@@ -624,4 +882,15 @@ class AutoGraphDeviceService:
 
         except Exception as e:
             logger.error(f"Ошибка получения устройств: {e}", exc_info=True)
-            return []
\ No newline at end of file
+            return []
+
+    def _fetch_devices(self, params: Dict):
+        """Запрос EnumDevices; None при ошибке HTTP"""
+        logger.info(f"Запрос устройств через EnumDevices: schemaID={params['schemaID']}")
+        response = self.transport.get('EnumDevices', params=params)
+
+        if response.status_code != 200:
+            logger.error(f"Ошибка получения устройств: HTTP {response.status_code}")
+            return None
+
+        return fastjson.parse_response(response)
@@ -0,0 +1,23 @@
+"""
+Фоновые задачи Celery (расписание - config/celery.py)
+"""
+import logging
+
+from celery import shared_task
+
+from dashboard import snapshots
+from vehicles import result_cache
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def refresh_vehicles_data_for_all_users():
+    """Опрос GetOnlineInfo по каждой активной схеме и обновление снимков парка"""
+    return snapshots.refresh_all_snapshots()
+
+
+@shared_task(ignore_result=True)
+def clean_old_cache():
+    """Очистка кэша результатов DataCache: истекшие записи и превышение бюджета по размеру"""
+    return result_cache.clean_old_cache()
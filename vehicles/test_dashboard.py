@@ -8,8 +8,9 @@ from django.shortcuts import render
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import json
-import requests
 from datetime import datetime, timedelta
+
+from api.transport import get_transport
 from .services import AutoGraphDeviceService
 
 logger = logging.getLogger(__name__)
@@ -134,7 +135,7 @@ def get_raw_data_from_autograph(token, schema_id, vehicle_ids, start_fmt, end_fm
         "DQExcessAccelPoints Diff", "DQEmergencyBrakePoints Diff"
     ]
 
-    url = "https://web.tk-ekat.ru/ServiceJSON/GetTripItems"
+    transport = get_transport()
 
     # Попробуем сначала со всеми параметрами
     try:
@@ -149,15 +150,8 @@ def get_raw_data_from_autograph(token, schema_id, vehicle_ids, start_fmt, end_fm
             'tripTotalParams': '*'
         }
 
-        session = requests.Session()
-        session.verify = False
-        session.headers.update({
-            'Accept': 'application/json',
-            'User-Agent': 'TestDashboard/1.0'
-        })
-
-        logger.info(f"Запрос всех параметров: {url}")
-        response = session.get(url, params=params, timeout=120)
+        logger.info(f"Запрос всех параметров: {transport.url('GetTripItems')}")
+        response = transport.get('GetTripItems', params=params, timeout=(transport.connect_timeout, 120))
 
         if response.status_code == 200:
             data = response.json()
@@ -181,11 +175,8 @@ def get_raw_data_from_autograph(token, schema_id, vehicle_ids, start_fmt, end_fm
             'tripParams': ','.join(params_list)
         }
 
-        session = requests.Session()
-        session.verify = False
-
         logger.info(f"Запрос основных параметров: {len(params_list)} шт")
-        response = session.get(url, params=params, timeout=90)
+        response = transport.get('GetTripItems', params=params)
 
         if response.status_code == 200:
             data = response.json()
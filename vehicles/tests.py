@@ -1,3 +1,602 @@
-from django.test import TestCase
+import io
+import json
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import pandas as pd
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.async_transport import AsyncAutoGraphTransport
+from vehicles import aggregation, concurrency, downsampling, exports, history_store, result_cache, rollups
+from vehicles.models import AutoGraphConnection, DataCache, RawTrackData, Vehicle
+from vehicles.services import AutoGraphDeviceService, AutoGraphHistoricalService
+from vehicles.timeseries import TimeSeriesFrame
+from vehicles.trip_items import merge_trip_items, parse_stream
+from vehicles.views import aggregate_time_series
+
+
+class TimeSeriesFrameTests(TestCase):
+    """Тесты колоночного представления GetTripItems"""
+
+    def setUp(self):
+        self.data = {
+            'dev-2': {
+                'Name': 'Второе ТС',
+                'Params': ['Speed', 'MoveDuration'],
+                'Items': [
+                    {'DT': '2024-01-01T10:05:00', 'Stage': 'Motion', 'Values': ['42,5', '00:05:00']},
+                ]
+            },
+            'dev-1': {
+                'Name': 'Первое ТС',
+                'Params': ['Speed'],
+                'Items': [
+                    {'DT': '2024-01-01T10:10:00', 'Stage': 'Parking', 'Values': [None]},
+                    {'DT': '2024-01-01T10:00:00', 'Stage': 'Motion', 'Values': [60]},
+                    {'DT': '', 'Values': [1]},
+                ]
+            },
+        }
+
+    def test_columns_and_sorting(self):
+        """Значения хранятся колонками float64, записи отсортированы по времени"""
+        frame = TimeSeriesFrame.from_trip_items(self.data).sort_by_time()
+
+        self.assertEqual(len(frame), 3)
+        self.assertEqual(frame.parameters, ['Speed', 'MoveDuration'])
+        self.assertEqual(frame.vehicle_ids.tolist(), ['dev-1', 'dev-2', 'dev-1'])
+        self.assertEqual(frame.columns['Speed'][:2].tolist(), [60.0, 42.5])
+        self.assertTrue(math.isnan(frame.columns['Speed'][2]))
+
+    def test_records_keep_text_values(self):
+        """Записи ответа содержат нечисловые значения и не содержат пустые"""
+        records = TimeSeriesFrame.from_trip_items(self.data).sort_by_time().to_records()
+
+        self.assertEqual(records[0]['values'], {'Speed': 60.0})
+        self.assertEqual(records[1]['values'], {'Speed': 42.5, 'MoveDuration': '00:05:00'})
+        self.assertEqual(records[2]['values'], {})
+        self.assertEqual(records[1]['vehicle_name'], 'Второе ТС')
+
+    def test_describe_per_vehicle_percentiles(self):
+        """Сводка содержит перцентили и статистику по ТС и параметрам"""
+        frame = TimeSeriesFrame.from_trip_items(self.data).sort_by_time()
+        stats = frame.describe()
+
+        self.assertEqual(stats['parameters']['Speed']['count'], 2)
+        self.assertEqual(stats['parameters']['Speed']['p50'], 51.25)
+        # Коды ТС - в порядке ответа AutoGRAPH: 0 - dev-2, 1 - dev-1
+        self.assertEqual(stats['vehicles'][0]['Speed']['p95'], 42.5)
+        self.assertEqual(stats['vehicles'][1]['Speed']['max'], 60.0)
+        # MoveDuration у dev-2 есть, но только в текстовом виде
+        self.assertNotIn('MoveDuration', stats['vehicles'][0])
+        self.assertEqual(stats['present'].tolist(), [[True, True], [True, False]])
+
+
+class TripItemsMergeTests(TestCase):
+    """Тесты объединения ответов групп параметров GetTripItems"""
+
+    def test_rows_aligned_by_dt_and_stage(self):
+        """Строки групп сопоставляются по (DT, Stage), даже если их число различается"""
+        group_1 = {'dev-1': {'Name': 'ТС', 'Params': ['Speed'], 'Items': [
+            {'DT': '2024-01-01T10:00:00', 'Stage': 'Motion', 'Values': [50]},
+            {'DT': '2024-01-01T10:05:00', 'Stage': 'Parking', 'Values': [0]},
+        ]}}
+        group_2 = {'dev-1': {'Name': 'ТС', 'Params': ['Speed', 'Fuel'], 'Items': [
+            {'DT': '2024-01-01T10:05:00', 'Stage': 'Parking', 'Values': [None, 30]},
+        ]}}
+
+        data, stats = merge_trip_items([group_1, None, group_2])
+
+        self.assertEqual(data['dev-1']['Params'], ['Speed', 'Fuel'])
+        self.assertEqual([item['Values'] for item in data['dev-1']['Items']], [[50, None], [0, 30]])
+        self.assertEqual(stats['rows_matched'], 1)
+
+    def test_stream_parse_matches_json(self):
+        """Потоковый разбор дает те же ТС и строки, лишние поля строк отбрасываются"""
+        body = {
+            'dev-1': {'Name': 'ТС "1"', 'Params': ['Speed', 'Fuel'], 'Items': [
+                {'DT': '2024-01-01T10:00:00', 'Stage': 'Motion', 'Values': [50.5, None], 'Extra': {'a': [1, 2]}},
+                {'DT': '2024-01-01T10:05:00', 'Stage': 'Parking', 'Caption': 'стоянка', 'Values': ['0,5', 30]},
+            ]},
+            'dev-2': None,
+        }
+
+        data = parse_stream(io.BytesIO(json.dumps(body, ensure_ascii=False).encode('utf-8')))
+
+        del body['dev-1']['Items'][0]['Extra']
+        self.assertEqual(data, body)
+        self.assertEqual(parse_stream(io.BytesIO(b'[]')), [])
+
+    async def test_async_stream_parse_from_httpx(self):
+        """Асинхронный путь разбирает тело GetTripItems по мере получения, без чтения ответа целиком"""
+        body = json.dumps({'dev-1': {'Name': 'ТС', 'Params': ['Speed'], 'Items': [
+            {'DT': f'2024-01-01T10:{minute:02d}:00', 'Stage': 'Motion', 'Values': [minute]} for minute in range(60)
+        ]}}).encode('utf-8')
+
+        async def chunks():
+            for offset in range(0, len(body), 64):
+                yield body[offset:offset + 64]
+
+        transport = AsyncAutoGraphTransport()
+        transport.client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+        )
+        service = AutoGraphHistoricalService(token='token', schema_id='schema')
+
+        with mock.patch('api.async_transport.get_async_transport', return_value=transport), \
+                mock.patch('vehicles.trip_items.STREAM_QUEUE_CHUNKS', 2), \
+                mock.patch('vehicles.trip_items.parse_stream', wraps=parse_stream) as parsed:
+            data = await service._aget_trip_items_data_with_params(['dev-1'], '20240101', '20240101-2359', ['Speed'])
+        await transport.aclose()
+
+        parsed.assert_called_once()
+        self.assertEqual(data, json.loads(body))
+
+
+@override_settings(AUTOGRAPH_HISTORY_CHUNK_DAYS=7, AUTOGRAPH_HISTORY_CHUNK_RETRY_BACKOFF=0,
+                   AUTOGRAPH_REQUESTS_PER_SECOND=0)
+class HistoryChunkingTests(TestCase):
+    """Тесты разбиения длинного периода GetTripItems на отрезки"""
+
+    def setUp(self):
+        self.service = AutoGraphHistoricalService(token='token', schema_id='schema')
+        self.service.ALL_PARAMETERS = ['Speed']
+
+    def test_split_period_by_weeks(self):
+        """Период делится на недели, последний отрезок - до конца периода"""
+        self.assertEqual(self.service._split_period('20240101', '20240120-2359'), [
+            ('20240101', '20240107-2359'),
+            ('20240108', '20240114-2359'),
+            ('20240115', '20240120-2359'),
+        ])
+        self.assertEqual(self.service._split_period('20240101', '20240103-2359'), [('20240101', '20240103-2359')])
+
+    def test_failed_chunk_retried_alone(self):
+        """Неудачный отрезок повторяется отдельно, результат склеивается по времени"""
+        calls = []
+
+        def fetch(device_ids, start_fmt, end_fmt, params):
+            calls.append(start_fmt)
+            if start_fmt == '20240108' and calls.count(start_fmt) == 1:
+                return {}
+            return {'dev-1': {'Name': 'ТС', 'Params': params, 'Items': [
+                {'DT': f'{start_fmt[:4]}-{start_fmt[4:6]}-{start_fmt[6:]}T00:00:00', 'Stage': 'Motion', 'Values': [1]}
+            ]}}
+
+        with mock.patch.object(self.service, '_get_trip_items_data_with_params', side_effect=fetch):
+            data = self.service._get_complete_trip_items_data(['dev-1'], '20240101', '20240114-2359')
+
+        self.assertEqual(sorted(calls), ['20240101', '20240108', '20240108'])
+        self.assertEqual([item['DT'] for item in data['dev-1']['Items']],
+                         ['2024-01-01T00:00:00', '2024-01-08T00:00:00'])
+
+
+class HistoryStoreTests(TestCase):
+    """Тесты локальной истории GetTripItems"""
+
+    def setUp(self):
+        self.params = ['Speed', 'MoveDuration']
+        self.data = {'dev-1': {'Name': 'ТС', 'Params': self.params, 'Items': [
+            {'DT': '2024-01-01T10:00:00', 'Stage': 'Motion', 'Values': [42.5, '00:05:00']},
+            {'DT': '2024-01-02T11:00:00', 'Stage': 'Parking', 'Values': [0, None]},
+        ]}}
+
+    def test_ingest_and_load_round_trip(self):
+        """Сохраненный период отдается из базы в формате GetTripItems, повторы пропускаются"""
+        start, end = date(2024, 1, 1), date(2024, 1, 2)
+        history_store.ingest_trip_items('schema-1', self.data)
+        history_store.ingest_trip_items('schema-1', self.data)
+        history_store.mark_covered('schema-1', {'dev-1': 'ТС'}, start, end, self.params)
+
+        self.assertEqual(RawTrackData.objects.count(), 2)
+        self.assertTrue(history_store.is_covered('schema-1', ['dev-1'], start, end, self.params))
+        self.assertFalse(history_store.is_covered('schema-1', ['dev-1'], start, date(2024, 1, 3), self.params))
+        self.assertFalse(history_store.is_covered('schema-1', ['dev-1'], start, end, ['Speed']))
+
+        loaded = history_store.load_trip_items('schema-1', ['dev-1'], start, end)['dev-1']
+        self.assertEqual(loaded['Params'], self.params)
+        self.assertEqual(loaded['Items'][0]['DT'], '2024-01-01T10:00:00')
+        self.assertEqual(loaded['Items'][0]['Values'], [42.5, '00:05:00'])
+        self.assertEqual(loaded['Items'][1]['Values'], [0, None])
+
+    def test_refetched_rows_replace_partial_stage(self):
+        """Повторная загрузка дня обновляет строку незавершенного этапа, а не оставляет первую версию"""
+        history_store.ingest_trip_items('schema-1', self.data)
+        completed = {'dev-1': {'Name': 'ТС', 'Params': self.params, 'Items': [
+            {'DT': '2024-01-01T10:00:00', 'Stage': 'Motion', 'Duration': '00:40:00', 'Values': [50.0, '00:40:00']},
+        ]}}
+        history_store.ingest_trip_items('schema-1', completed)
+
+        row = RawTrackData.objects.get(timestamp__date=date(2024, 1, 1))
+        self.assertEqual((row.duration, row.speed), ('00:40:00', 50.0))
+        self.assertEqual(row.parameters_json, {'Speed': 50.0, 'MoveDuration': '00:40:00'})
+
+    def test_history_scoped_by_schema(self):
+        """История схемы не читается и не перезаписывается из другой схемы, токен сессии не сохраняется"""
+        start, end = date(2024, 1, 1), date(2024, 1, 2)
+        history_store.ingest_trip_items('schema-1', self.data)
+        history_store.mark_covered('schema-1', {'dev-1': 'ТС'}, start, end, self.params)
+
+        self.assertFalse(history_store.is_covered('schema-2', ['dev-1'], start, end, self.params))
+        self.assertEqual(history_store.load_trip_items('schema-2', ['dev-1'], start, end)['dev-1']['Items'], [])
+        self.assertEqual(len(history_store.load_trip_items('schema-1', ['dev-1'], start, end)['dev-1']['Items']), 2)
+        self.assertFalse(AutoGraphConnection.objects.exists())
+
+        # То же устройство в другой схеме хранится отдельной записью
+        history_store.ingest_trip_items('schema-2', {'dev-1': {'Name': 'ТС', 'Params': self.params, 'Items': [
+            {'DT': '2024-01-01T12:00:00', 'Stage': 'Motion', 'Values': [10.0, None]},
+        ]}})
+        self.assertEqual(Vehicle.objects.filter(vehicle_id='dev-1').count(), 2)
+        self.assertEqual(len(history_store.load_trip_items('schema-2', ['dev-1'], start, end)['dev-1']['Items']), 1)
+        self.assertEqual(len(history_store.load_trip_items('schema-1', ['dev-1'], start, end)['dev-1']['Items']), 2)
+
+    def test_coverage_intervals_compacted(self):
+        """Смежные отметки покрытия сливаются в один интервал, пропуски считаются по нему"""
+        for day in (1, 2, 5):
+            history_store.mark_covered('schema-1', {'dev-1': 'ТС'},
+                                       date(2024, 1, day), date(2024, 1, day), self.params)
+
+        intervals = history_store.coverage('schema-1', ['dev-1'], self.params)['dev-1']
+        self.assertEqual(intervals, [(date(2024, 1, 1), date(2024, 1, 2)), (date(2024, 1, 5), date(2024, 1, 5))])
+        self.assertEqual(history_store.missing_ranges(intervals, date(2024, 1, 1), date(2024, 1, 6)), [
+            (date(2024, 1, 3), date(2024, 1, 4)),
+            (date(2024, 1, 6), date(2024, 1, 6)),
+        ])
+
+
+@override_settings(AUTOGRAPH_HISTORY_CHUNK_DAYS=7, AUTOGRAPH_HISTORY_CHUNK_RETRY_BACKOFF=0,
+                   AUTOGRAPH_HISTORY_CHUNK_RETRIES=0, AUTOGRAPH_REQUESTS_PER_SECOND=0)
+class HistoryGapsTests(TestCase):
+    """Тесты догрузки только недостающих дней периода"""
+
+    def setUp(self):
+        self.service = AutoGraphHistoricalService(token='token', schema_id='schema')
+        self.service.ALL_PARAMETERS = ['Speed']
+        self.calls = []
+
+        # EnumDevices схемы сессии
+        patcher = mock.patch.object(AutoGraphDeviceService, 'get_devices', return_value=[{'id': 'dev-1'}])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, device_ids, start_fmt, end_fmt, params):
+        self.calls.append((start_fmt, end_fmt))
+        start = datetime.strptime(start_fmt[:8], '%Y%m%d').date()
+        end = datetime.strptime(end_fmt[:8], '%Y%m%d').date()
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        return {'dev-1': {'Name': 'ТС', 'Params': params, 'Items': [
+            {'DT': f'{day.isoformat()}T12:00:00', 'Stage': 'Motion', 'Values': [day.day]} for day in days
+        ]}}
+
+    def test_sliding_window_fetches_only_new_day(self):
+        """Повтор периода не обращается к AutoGRAPH, сдвиг на день загружает один день"""
+        with mock.patch.object(self.service, '_get_trip_items_data_with_params', side_effect=self.fetch), \
+                mock.patch.object(self.service, '_get_trips_total_data', return_value={}):
+            first = self.service.get_extended_historical_data(['dev-1'], '2024-01-01', '2024-01-10')
+            self.assertEqual(len(self.calls), 2)
+
+            self.calls.clear()
+            repeated = self.service.get_extended_historical_data(['dev-1'], '2024-01-01', '2024-01-10')
+            self.assertEqual(self.calls, [])
+            self.assertEqual(repeated['total_records'], first['total_records'])
+
+            shifted = self.service.get_extended_historical_data(['dev-1'], '2024-01-02', '2024-01-11')
+
+        self.assertEqual(self.calls, [('20240111', '20240111-2359')])
+        self.assertEqual(shifted['total_records'], 10)
+        self.assertEqual(shifted['frame'].timestamps[-1].item(), '2024-01-11T12:00:00')
+
+    def test_devices_outside_session_schema_not_served_from_store(self):
+        """ТС не из EnumDevices схемы сессии запрашиваются в AutoGRAPH, даже если период есть в базе"""
+        with mock.patch.object(self.service, '_get_trip_items_data_with_params', side_effect=self.fetch), \
+                mock.patch.object(self.service, '_get_trips_total_data', return_value={}):
+            self.service.get_extended_historical_data(['dev-1'], '2024-01-01', '2024-01-03')
+
+            other = AutoGraphHistoricalService(token='token', schema_id='schema')
+            other.ALL_PARAMETERS = ['Speed']
+            with mock.patch.object(AutoGraphDeviceService, 'get_devices', return_value=[{'id': 'dev-2'}]):
+                self.calls.clear()
+                self.assertFalse(other.ensure_history(['dev-1'], '2024-01-01', '2024-01-03'))
+                with mock.patch.object(other, '_get_trip_items_data_with_params', side_effect=self.fetch), \
+                        mock.patch.object(other, '_get_trips_total_data', return_value={}):
+                    other.get_extended_historical_data(['dev-1'], '2024-01-01', '2024-01-03')
+
+        self.assertEqual(self.calls, [('20240101', '20240103-2359')])
+
+    def test_device_shared_by_two_schemas(self):
+        """Устройство из двух схем: вторая схема сохраняет свою историю и не запрашивает ее повторно"""
+        other = AutoGraphHistoricalService(token='token', schema_id='schema-b')
+        other.ALL_PARAMETERS = ['Speed']
+
+        with mock.patch.object(self.service, '_get_trip_items_data_with_params', side_effect=self.fetch), \
+                mock.patch.object(self.service, '_get_trips_total_data', return_value={}):
+            self.service.get_extended_historical_data(['dev-1'], '2024-01-01', '2024-01-03')
+
+        self.calls.clear()
+        with mock.patch.object(other, '_get_trip_items_data_with_params', side_effect=self.fetch), \
+                mock.patch.object(other, '_get_trips_total_data', return_value={}):
+            first = other.get_extended_historical_data(['dev-1'], '2024-01-01', '2024-01-03')
+            self.assertEqual(len(self.calls), 1)
+
+            self.calls.clear()
+            repeated = other.get_extended_historical_data(['dev-1'], '2024-01-01', '2024-01-03')
+
+        self.assertEqual(self.calls, [])
+        self.assertEqual(first['total_records'], 3)
+        self.assertEqual(repeated['total_records'], 3)
+
+    @override_settings(AUTOGRAPH_HISTORY_CHUNK_DAYS=7, AUTOGRAPH_TRIP_ITEMS_MAX_WORKERS=1, AUTOGRAPH_REQUESTS_PER_SECOND=0)
+    def test_ensure_history_ingests_window_by_window(self):
+        """Длинный период сохраняется по отрезкам: каждое окно сохраняется до загрузки следующего"""
+        service = AutoGraphHistoricalService(token='token', schema_id='schema')
+        service.ALL_PARAMETERS = ['Speed']
+        ingested = []
+
+        def ingest(schema_id, all_data):
+            ingested.append(len(all_data['dev-1']['Items']))
+            return real_ingest(schema_id, all_data)
+
+        real_ingest = history_store.ingest_trip_items
+        with mock.patch.object(service, '_get_trip_items_data_with_params', side_effect=self.fetch), \
+                mock.patch.object(history_store, 'ingest_trip_items', side_effect=ingest):
+            self.assertTrue(service.ensure_history(['dev-1'], '2024-01-01', '2024-01-20'))
+
+        self.assertEqual(ingested, [7, 7, 6])
+        self.assertEqual(RawTrackData.objects.count(), 20)
+
+        # Основной путь тоже сохраняет окна по очереди и читает период из базы
+        ingested.clear()
+        with mock.patch.object(service, '_get_trip_items_data_with_params', side_effect=self.fetch), \
+                mock.patch.object(service, '_get_trips_total_data', return_value={}), \
+                mock.patch.object(history_store, 'ingest_trip_items', side_effect=ingest):
+            data = service.get_extended_historical_data(['dev-1'], '2024-01-15', '2024-01-31')
+
+        self.assertEqual(ingested, [7, 4])
+        self.assertEqual(data['total_records'], 17)
+
+
+class ResultCacheTests(TestCase):
+    """Тесты кэша отформатированных временных рядов (DataCache)"""
+
+    def setUp(self):
+        self.formatted = {
+            'time_series': [{'timestamp': '2024-01-01T10:00:00', 'vehicle_id': 'dev-1', 'values': {'Speed': 42.5}}],
+            'summary': {'total_records': 1},
+            'parameters': ['Speed'],
+            'total_records': 1,
+            'period': {'start': '2024-01-01', 'end': '2024-01-02'}
+        }
+
+    def test_store_and_get_compressed(self):
+        """Результат хранится сжатым и находится независимо от порядка ТС"""
+        self.assertIsNone(result_cache.get('schema', ['dev-1', 'dev-2'], '2024-01-01', '2024-01-02'))
+        self.assertTrue(result_cache.store('schema', ['dev-1', 'dev-2'], '2024-01-01', '2024-01-02', self.formatted))
+
+        entry = DataCache.objects.get()
+        self.assertEqual(entry.data_size, len(entry.compressed_data))
+        self.assertEqual(result_cache.get('schema', ['dev-2', 'dev-1'], '2024-01-01', '2024-01-02'), self.formatted)
+        self.assertIsNone(result_cache.get('schema', ['dev-1'], '2024-01-01', '2024-01-02'))
+
+    def test_clean_removes_expired_and_evicts_over_budget(self):
+        """Очистка удаляет истекшие записи, затем самые давно использованные сверх бюджета"""
+        for day in (1, 2, 3):
+            result_cache.store('schema', ['dev-1'], f'2024-01-0{day}', f'2024-01-0{day}', self.formatted)
+        DataCache.objects.filter(date_from=date(2024, 1, 1)).update(expires_at=timezone.now())
+        DataCache.objects.filter(date_from=date(2024, 1, 3)).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        size = DataCache.objects.first().data_size
+        result = result_cache.clean_old_cache(max_bytes=size)
+
+        self.assertEqual((result['expired'], result['evicted']), (1, 1))
+        self.assertEqual(list(DataCache.objects.values_list('date_from', flat=True)), [date(2024, 1, 2)])
+
+
+class TrackRollupTests(TestCase):
+    """Тесты агрегатов временных рядов по интервалам"""
+
+    def setUp(self):
+        self.data = {'dev-1': {'Name': 'ТС', 'Params': ['Speed', 'MoveDuration'], 'Items': [
+            {'DT': '2024-01-01T10:00:10', 'Stage': 'Motion', 'Values': [40, '00:05:00']},
+            {'DT': '2024-01-01T10:00:40', 'Stage': 'Motion', 'Values': ['60,0', None]},
+            {'DT': '2024-01-01T11:30:00', 'Stage': 'Parking', 'Values': [0, None]},
+            {'DT': '2024-01-02T09:00:00', 'Stage': 'Motion', 'Values': [30, None]},
+        ]}}
+
+    def test_series_matches_raw_aggregation(self):
+        """Ряд из агрегатов совпадает с агрегацией сырого ряда, повторная загрузка не удваивает значения"""
+        history_store.ingest_trip_items('schema-1', self.data)
+        history_store.ingest_trip_items('schema-1', self.data)
+
+        records = TimeSeriesFrame.from_trip_items(self.data).sort_by_time().to_records()
+        for resolution in ('minute', 'hour', 'day'):
+            self.assertEqual(
+                rollups.series('schema-1', ['dev-1'], date(2024, 1, 1), date(2024, 1, 2), ['Speed'], resolution),
+                aggregate_time_series(records, ['Speed'], resolution)
+            )
+
+        # По ТС: агрегаты и векторная агрегация сырого ряда дают одинаковый результат
+        frame = aggregation.records_frame(records, ['Speed'])
+        for how in ('last', 'max', 'count'):
+            self.assertEqual(
+                rollups.series('schema-1', ['dev-1'], date(2024, 1, 1), date(2024, 1, 2), ['Speed'], 'hour',
+                               aggregation=how, by_vehicle=True),
+                aggregation.aggregate(frame, ['Speed'], how=how, width=pd.Timedelta('1h'),
+                                      key_format=aggregation.KEY_FORMATS['hour'])
+            )
+
+        stats = rollups.summary('schema-1', ['dev-1'], date(2024, 1, 1), date(2024, 1, 2), ['Speed'])['parameter_stats']['Speed']
+        self.assertEqual((stats['count'], stats['min'], stats['max'], stats['sum']), (4, 0.0, 60.0, 130.0))
+
+        # Агрегаты ТС другой схемы не отдаются
+        self.assertEqual(rollups.series('schema-2', ['dev-1'], date(2024, 1, 1), date(2024, 1, 2), ['Speed'], 'day'), [])
+        self.assertEqual(rollups.summary('schema-2', ['dev-1'], date(2024, 1, 1), date(2024, 1, 2), ['Speed'])['parameter_stats'], {})
+
+
+class AggregationTests(TestCase):
+    """Тесты векторной агрегации временных рядов"""
+
+    def setUp(self):
+        self.records = [
+            {'timestamp': '2024-01-01T07:50:00', 'vehicle_id': 'dev-1', 'vehicle_name': 'Первое', 'values': {'Speed': 10}},
+            {'timestamp': '2024-01-01T08:10:00', 'vehicle_id': 'dev-1', 'vehicle_name': 'Первое', 'values': {'Speed': 20}},
+            {'timestamp': '2024-01-01T19:59:59', 'vehicle_id': 'dev-1', 'vehicle_name': 'Первое', 'values': {'Speed': 40}},
+            {'timestamp': '2024-01-01T09:00:00', 'vehicle_id': 'dev-2', 'vehicle_name': 'Второе', 'values': {'Speed': '5,5'}},
+            {'timestamp': '', 'vehicle_id': 'dev-2', 'values': {'Speed': 100}},
+        ]
+
+    def test_shift_aligned_buckets_per_vehicle(self):
+        """Смены по 12 часов с 08:00, отдельно по каждому ТС"""
+        width, offset, key_format = aggregation.bucket_spec('hour', '12h', '8h')
+        frame = aggregation.records_frame(self.records, ['Speed'])
+
+        points = aggregation.aggregate(frame, ['Speed'], how='sum', width=width, offset=offset, key_format=key_format)
+
+        self.assertEqual([(p['timestamp'], p['vehicle_id'], p['values']['Speed']) for p in points], [
+            ('2023-12-31 20:00:00', 'dev-1', 10.0),
+            ('2024-01-01 08:00:00', 'dev-1', 60.0),
+            ('2024-01-01 08:00:00', 'dev-2', 5.5),
+        ])
+        self.assertEqual(points[2]['vehicle_name'], 'Второе')
+
+    def test_blended_day_mean_and_count(self):
+        """Без группировки по ТС значения всех ТС попадают в один интервал"""
+        frame = aggregation.records_frame(self.records, ['Speed'])
+
+        mean = aggregation.aggregate(frame, ['Speed'], width=pd.Timedelta('1D'), key_format='%Y-%m-%d', by_vehicle=False)
+        count = aggregation.aggregate(frame, ['Speed'], how='count', width=pd.Timedelta('1D'), by_vehicle=False)
+
+        self.assertEqual(mean, [{'timestamp': '2024-01-01', 'values': {'Speed': 18.875}}])
+        self.assertEqual(count[0]['values'], {'Speed': 4})
+        with self.assertRaises(ValueError):
+            aggregation.bucket_spec('hour', 'abc')
+
+
+class DownsamplingTests(TestCase):
+    """Тесты прореживания рядов для графиков"""
+
+    def setUp(self):
+        self.records = [
+            {
+                'timestamp': f'2024-01-01T{i // 60:02d}:{i % 60:02d}:00',
+                'vehicle_id': vehicle_id,
+                'vehicle_name': vehicle_id,
+                'values': {'Speed': 100.0 if i == 300 else float(i % 7), 'MoveDuration': '00:01:00'}
+            }
+            for i in range(600) for vehicle_id in ('dev-1', 'dev-2')
+        ]
+
+    def test_each_series_limited_and_peaks_kept(self):
+        """Каждый ряд ТС x параметр не длиннее max_points, крайние точки и пик сохраняются"""
+        for method in downsampling.METHODS:
+            result = downsampling.downsample_records(self.records, ['Speed', 'MoveDuration'], 50, method)
+
+            for vehicle_id in ('dev-1', 'dev-2'):
+                series = [r for r in result if r['vehicle_id'] == vehicle_id and 'Speed' in r['values']]
+                self.assertLessEqual(len(series), 50)
+                self.assertEqual(series[0]['timestamp'], '2024-01-01T00:00:00')
+                self.assertEqual(series[-1]['timestamp'], '2024-01-01T09:59:00')
+                self.assertIn(100.0, [r['values']['Speed'] for r in series])
+            self.assertEqual(result[0]['values']['MoveDuration'], '00:01:00')
+
+    def test_short_series_unchanged(self):
+        """Ряды короче max_points возвращаются без изменений"""
+        records = self.records[:10]
+        self.assertIs(downsampling.downsample_records(records, ['Speed'], 50), records)
+        with self.assertRaises(ValueError):
+            downsampling.downsample_records(self.records, ['Speed'], 50, 'average')
+
+
+class CsvExportTests(TestCase):
+    """Тесты потокового экспорта CSV, Parquet, Arrow и XLSX"""
+
+    def test_stored_rows_streamed_with_quoting(self):
+        """Строки истории выгружаются по времени, значения с запятыми и кавычками экранируются"""
+        history_store.ingest_trip_items('schema-1', {'dev-1': {'Name': 'ТС "Север", 1', 'Params': ['Speed', 'Caption'], 'Items': [
+            {'DT': '2024-01-01T11:00:00', 'Stage': 'Parking', 'Values': [0, None]},
+            {'DT': '2024-01-01T10:00:00', 'Stage': 'Motion', 'Values': ['42,5', 'въезд, ворота']},
+        ]}})
+
+        rows = exports.stored_rows('schema-1', ['dev-1'], date(2024, 1, 1), date(2024, 1, 1))
+        content = b''.join(exports.csv_stream(rows, ['Speed', 'Caption'])).decode('utf-8')
+        self.assertEqual(list(exports.stored_rows('schema-2', ['dev-1'], date(2024, 1, 1), date(2024, 1, 1))), [])
+
+        self.assertEqual(content.splitlines(), [
+            'Время,ТС,Тип,Speed,Caption',
+            '2024-01-01T10:00:00,"ТС ""Север"", 1",Motion,42.5000,"въезд, ворота"',
+            '2024-01-01T11:00:00,"ТС ""Север"", 1",Parking,0.0000,',
+        ])
+
+    def test_columnar_formats_round_trip(self):
+        """Parquet и Arrow читаются обратно с типизированными колонками, XLSX - с исходными значениями"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from openpyxl import load_workbook
+
+        records = [
+            {'timestamp': '2024-01-01T10:00:00', 'vehicle': 'ТС-1', 'type': 'Motion', 'values': {'Speed': '42,5', 'Caption': 'ворота'}},
+            {'timestamp': '2024-01-01T10:01:00', 'vehicle': 'ТС-1', 'type': 'Parking', 'values': {'Speed': 0}},
+        ]
+        params = ['Speed', 'Caption']
+
+        table = pq.read_table(io.BytesIO(b''.join(exports.parquet_stream(exports.record_rows(records), params))))
+        self.assertEqual(table.column('Speed').to_pylist(), [42.5, 0.0])
+        self.assertEqual(table.column('Caption').to_pylist(), [None, None])
+        self.assertEqual(table.column('Время')[0].as_py(), datetime(2024, 1, 1, 10, 0))
+
+        arrow_table = pa.ipc.open_file(pa.BufferReader(b''.join(exports.arrow_stream(exports.record_rows(records), params)))).read_all()
+        self.assertEqual(arrow_table.to_pylist(), table.to_pylist())
+
+        sheet = load_workbook(exports.xlsx_file(exports.record_rows(records), params), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('Время', 'ТС', 'Тип', 'Speed', 'Caption'))
+        self.assertEqual(rows[1], (datetime(2024, 1, 1, 10, 0), 'ТС-1', 'Motion', 42.5, 'ворота'))
+
+
+class BoundedConcurrencyTests(TestCase):
+    """Тесты параллельного выполнения с пределом времени задачи"""
+
+    def test_run_bounded_timeout_returns_partial_results(self):
+        """Просроченная задача дает None, остальные результаты - в порядке элементов, без ожидания медленной"""
+        def work(delay):
+            if delay < 0:
+                raise ValueError('ошибка')
+            time.sleep(delay)
+            return delay
+
+        started = time.monotonic()
+        results = concurrency.run_bounded(work, [0.01, 1.0, -1, 0.02], max_workers=4, timeout=0.2)
+
+        self.assertEqual(results, [0.01, None, None, 0.02])
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_run_bounded_overall_deadline_with_hung_workers(self):
+        """Зависшие задачи заняли все потоки: очередь за ними считается неудачной по общему пределу"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def work(item):
+            if item == 'hung':
+                release.wait(5)
+            return item
+
+        started = time.monotonic()
+        results = concurrency.run_bounded(work, ['hung', 'hung', 'a', 'b'], max_workers=2, timeout=0.1)
+
+        self.assertEqual(results, [None, None, None, None])
+        self.assertLess(time.monotonic() - started, 1)
+
+    @override_settings(AUTOGRAPH_REQUESTS_PER_SECOND=5.0, AUTOGRAPH_REQUESTS_BURST=2)
+    def test_rate_limit_shared_between_services(self):
+        """Сервисы разных запросов одной схемы делят ограничение частоты, другая схема - свое"""
+        first = AutoGraphHistoricalService(token='token-1', schema_id='schema-rate')
+        second = AutoGraphHistoricalService(token='token-2', schema_id='schema-rate')
+        other = AutoGraphHistoricalService(token='token-1', schema_id='schema-other')
+
+        self.assertIs(first.rate_limiter, second.rate_limiter)
+        self.assertIsNot(first.rate_limiter, other.rate_limiter)
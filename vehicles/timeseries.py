@@ -0,0 +1,327 @@
+"""
+Колоночное представление временных рядов GetTripItems
+
+Вместо словаря на каждую запись данные хранятся колонками: массив меток
+времени, коды ТС и этапов и по одному массиву float64 на параметр
+(NaN - нет значения). Нечисловые значения (например, длительности
+"HH:MM:SS") хранятся в отдельных редких колонках. Список словарей
+для JSON строится только при формировании ответа (to_records).
+"""
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Перцентили в сводке по параметрам
+SUMMARY_PERCENTILES = (50, 95)
+
+
+def parse_numeric(value) -> Optional[float]:
+    """Парсинг числового значения AutoGRAPH (допускается запятая как разделитель)"""
+    if value is None:
+        return None
+
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    if isinstance(value, str):
+        clean_value = value.replace(',', '.').strip()
+        if clean_value == '':
+            return None
+        try:
+            return float(clean_value)
+        except ValueError:
+            return None
+
+    return None
+
+
+def column_stats(values: np.ndarray) -> Dict:
+    """Статистика непустых значений колонки (count/min/max/avg/sum/p50/p95)"""
+    total = float(values.sum())
+    p50, p95 = np.percentile(values, SUMMARY_PERCENTILES)
+    return {
+        'count': int(values.size),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'avg': total / values.size,
+        'sum': total,
+        'p50': float(p50),
+        'p95': float(p95)
+    }
+
+
+def _to_float_column(raw: List) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Колонка float64 и (если есть) колонка нечисловых значений"""
+    try:
+        # Быстрый путь: числа, числовые строки и None (-> NaN)
+        return np.array(raw, dtype=np.float64), None
+    except (TypeError, ValueError):
+        pass
+
+    numeric = np.full(len(raw), np.nan)
+    text = None
+
+    for i, value in enumerate(raw):
+        number = parse_numeric(value)
+        if number is not None:
+            numeric[i] = number
+        elif value not in (None, ''):
+            if text is None:
+                text = np.full(len(raw), None, dtype=object)
+            text[i] = value
+
+    return numeric, text
+
+
+class TimeSeriesFrame:
+    """Колоночный контейнер временного ряда нескольких ТС"""
+
+    def __init__(self, timestamps: np.ndarray, vehicle_codes: np.ndarray, vehicles: List[tuple],
+                 stages: np.ndarray, durations: np.ndarray, captions: np.ndarray,
+                 parameters: List[str], columns: Dict[str, np.ndarray], text_columns: Dict[str, np.ndarray] = None):
+        self.timestamps = timestamps
+        self.vehicle_codes = vehicle_codes
+        self.vehicles = vehicles  # [(device_id, name)] - расшифровка vehicle_codes
+        self.stages = stages
+        self.durations = durations
+        self.captions = captions
+        self.parameters = parameters
+        self.columns = columns
+        self.text_columns = text_columns or {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def empty(cls) -> 'TimeSeriesFrame':
+        return cls(
+            timestamps=np.array([], dtype=str),
+            vehicle_codes=np.array([], dtype=np.int32),
+            vehicles=[],
+            stages=np.array([], dtype=object),
+            durations=np.array([], dtype=object),
+            captions=np.array([], dtype=object),
+            parameters=[],
+            columns={}
+        )
+
+    @classmethod
+    def from_trip_items(cls, all_data: Dict) -> 'TimeSeriesFrame':
+        """Построение из объединенного ответа GetTripItems {device_id: {Name, Params, Items}}"""
+        builder = _FrameBuilder()
+
+        for device_id, device_data in (all_data or {}).items():
+            if not device_data or not isinstance(device_data, dict):
+                logger.warning(f"⚠️ Пропускаем некорректные данные ТС {device_id}")
+                continue
+
+            builder.add_device(
+                device_id,
+                device_data.get('Name', f'ТС {device_id[:8]}'),
+                device_data.get('Params', []) or [],
+                device_data.get('Items', []) or []
+            )
+
+        return builder.build()
+
+    @property
+    def vehicle_ids(self) -> np.ndarray:
+        """ID ТС для каждой записи"""
+        ids = np.array([vehicle_id for vehicle_id, _ in self.vehicles], dtype=object)
+        return ids[self.vehicle_codes]
+
+    def take(self, indices: np.ndarray) -> 'TimeSeriesFrame':
+        """Новый контейнер из записей с указанными индексами"""
+        return TimeSeriesFrame(
+            timestamps=self.timestamps[indices],
+            vehicle_codes=self.vehicle_codes[indices],
+            vehicles=self.vehicles,
+            stages=self.stages[indices],
+            durations=self.durations[indices],
+            captions=self.captions[indices],
+            parameters=self.parameters,
+            columns={name: column[indices] for name, column in self.columns.items()},
+            text_columns={name: column[indices] for name, column in self.text_columns.items()}
+        )
+
+    def sort_by_time(self) -> 'TimeSeriesFrame':
+        """
+        Сортировка по времени на месте (устойчивая: порядок записей одного
+        времени сохраняется). Колонки переставляются по одной, поэтому
+        в памяти не появляется вторая копия всех данных.
+        """
+        if not len(self):
+            return self
+
+        order = np.argsort(self.timestamps, kind='stable')
+        for field in ('timestamps', 'vehicle_codes', 'stages', 'durations', 'captions'):
+            setattr(self, field, getattr(self, field)[order])
+        for columns in (self.columns, self.text_columns):
+            for name in columns:
+                columns[name] = columns[name][order]
+
+        return self
+
+    def describe(self) -> Dict:
+        """
+        Статистика за один проход по колонкам:
+        'parameters' - по параметрам в целом, 'vehicles' - по ТС и параметрам
+        (список по кодам ТС), 'present' - матрица наличия значений [ТС x параметр].
+
+        Записи один раз группируются по ТС (устойчивая сортировка кодов),
+        после чего каждая колонка просматривается ровно один раз.
+        """
+        vehicle_count = len(self.vehicles)
+        order = np.argsort(self.vehicle_codes, kind='stable')
+        bounds = np.searchsorted(self.vehicle_codes[order], np.arange(vehicle_count + 1))
+
+        result = {
+            'parameters': {},
+            'vehicles': [{} for _ in range(vehicle_count)],
+            'present': np.zeros((vehicle_count, len(self.parameters)), dtype=bool)
+        }
+
+        for j, param in enumerate(self.parameters):
+            grouped = self.columns[param][order]
+            numeric = ~np.isnan(grouped)
+
+            present = numeric
+            if param in self.text_columns:
+                present = numeric | (self.text_columns[param][order] != None)
+
+            values = grouped[numeric]
+            if values.size:
+                result['parameters'][param] = column_stats(values)
+
+            for code in range(vehicle_count):
+                start, end = bounds[code], bounds[code + 1]
+                result['present'][code, j] = present[start:end].any()
+
+                segment = grouped[start:end][numeric[start:end]]
+                if segment.size:
+                    result['vehicles'][code][param] = column_stats(segment)
+
+        return result
+
+    def iter_records(self, params: List[str] = None) -> Iterator[Dict]:
+        """Записи в формате API: {'timestamp', 'vehicle_id', 'vehicle_name', 'stage', ..., 'values'}"""
+        names = [name for name in (params or self.parameters) if name in self.columns]
+        # tolist() один раз на колонку - дальше работа с обычными float без накладных расходов numpy
+        columns = [(name, self.columns[name].tolist(), self.text_columns.get(name)) for name in names]
+
+        timestamps = self.timestamps.tolist()
+        codes = self.vehicle_codes.tolist()
+        stages = self.stages.tolist()
+        durations = self.durations.tolist()
+        captions = self.captions.tolist()
+
+        for i in range(len(timestamps)):
+            values = {}
+            for name, column, text in columns:
+                value = column[i]
+                if value == value:  # не NaN
+                    values[name] = value
+                elif text is not None and text[i] is not None:
+                    values[name] = text[i]
+
+            vehicle_id, vehicle_name = self.vehicles[codes[i]]
+            yield {
+                'timestamp': timestamps[i],
+                'vehicle_id': vehicle_id,
+                'vehicle_name': vehicle_name,
+                'stage': stages[i],
+                'duration': durations[i],
+                'caption': captions[i],
+                'values': values
+            }
+
+    def to_records(self, params: List[str] = None) -> List[Dict]:
+        return list(self.iter_records(params))
+
+
+class _FrameBuilder:
+    """Накопление данных по ТС и сборка TimeSeriesFrame"""
+
+    def __init__(self):
+        self.vehicles = []
+        self.parameters = []
+        self._known_parameters = set()
+        self._chunks = []
+
+    def add_device(self, device_id: str, name: str, params: List[str], items: List[Dict]):
+        rows = [item for item in items if isinstance(item, dict) and item.get('DT')]
+        if not rows:
+            return
+
+        code = len(self.vehicles)
+        self.vehicles.append((device_id, name))
+
+        for param in params:
+            if param and param not in self._known_parameters:
+                self._known_parameters.add(param)
+                self.parameters.append(param)
+
+        values_rows = [item.get('Values') or [] for item in rows]
+        columns = {}
+        text_columns = {}
+
+        for j, param in enumerate(params):
+            if not param or param in columns:
+                continue
+
+            raw = [values[j] if j < len(values) else None for values in values_rows]
+            columns[param], text = _to_float_column(raw)
+            if text is not None:
+                text_columns[param] = text
+
+        self._chunks.append({
+            'size': len(rows),
+            'timestamps': [item['DT'] for item in rows],
+            'code': code,
+            'stages': [item.get('Stage', 'Unknown') for item in rows],
+            'durations': [item.get('Duration', '') for item in rows],
+            'captions': [item.get('Caption', '') for item in rows],
+            'columns': columns,
+            'text_columns': text_columns
+        })
+
+    def build(self) -> TimeSeriesFrame:
+        if not self._chunks:
+            return TimeSeriesFrame.empty()
+
+        def concat_objects(field):
+            return np.array([value for chunk in self._chunks for value in chunk[field]], dtype=object)
+
+        columns = {}
+        text_columns = {}
+
+        # Колонки частей освобождаются сразу после склейки, чтобы не держать две копии данных
+        for param in self.parameters:
+            columns[param] = np.concatenate([
+                chunk['columns'].pop(param) if param in chunk['columns'] else np.full(chunk['size'], np.nan)
+                for chunk in self._chunks
+            ])
+
+            if any(param in chunk['text_columns'] for chunk in self._chunks):
+                text_columns[param] = np.concatenate([
+                    chunk['text_columns'].pop(param) if param in chunk['text_columns']
+                    else np.full(chunk['size'], None, dtype=object)
+                    for chunk in self._chunks
+                ])
+
+        return TimeSeriesFrame(
+            timestamps=np.array([ts for chunk in self._chunks for ts in chunk['timestamps']], dtype=str),
+            vehicle_codes=np.concatenate([
+                np.full(chunk['size'], chunk['code'], dtype=np.int32) for chunk in self._chunks
+            ]),
+            vehicles=self.vehicles,
+            stages=concat_objects('stages'),
+            durations=concat_objects('durations'),
+            captions=concat_objects('captions'),
+            parameters=self.parameters,
+            columns=columns,
+            text_columns=text_columns
+        )
@@ -0,0 +1,315 @@
+"""
+Объединение ответов GetTripItems по группам параметров
+
+Каждая группа параметров приходит отдельным ответом
+{device_id: {Name, Params, Items}}. Строки разных ответов сопоставляются
+по ключу (DT, Stage, номер повтора ключа в ответе) через словарь-индекс,
+а значения раскладываются по явной карте колонок: позиция параметра
+в ответе группы -> позиция в объединенном списке Params. Стоимость
+объединения линейна по числу значений и замеряется (stats).
+
+Крупные ответы разбираются потоково (parse_stream, ijson): ТС за ТС и
+строка за строкой прямо из сокета, без исходных байт и текста в памяти.
+В асинхронных представлениях (aparse_stream) байты ответа httpx по мере
+получения передаются тому же разбору в потоке через ограниченную очередь.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    import ijson
+except ImportError:  # потоковый разбор - необязательная зависимость
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+# Поля строки Items, которые используются при объединении и сохранении истории
+ITEM_FIELDS = frozenset(('DT', 'Stage', 'Duration', 'Caption', 'Values'))
+
+# Фрагментов ответа в очереди асинхронного разбора (остальные ждут в сокете)
+STREAM_QUEUE_CHUNKS = 16
+
+
+def streaming_available() -> bool:
+    return ijson is not None
+
+
+def _build(events, event: str, value) -> Any:
+    """Значение JSON, начинающееся с события (event, value)"""
+    if event == 'start_map':
+        result = {}
+        for event, value in events:
+            if event == 'end_map':
+                return result
+            result[value] = _build(events, *next(events))
+    elif event == 'start_array':
+        result = []
+        for event, value in events:
+            if event == 'end_array':
+                return result
+            if event in ('start_map', 'start_array'):
+                result.append(_build(events, event, value))
+            else:
+                result.append(value)
+    return value
+
+
+def _parse_item(events) -> Dict:
+    """Строка Items: только поля ITEM_FIELDS, остальные значения пропускаются"""
+    item = {}
+    for event, value in events:
+        if event == 'end_map':
+            return item
+        field = value
+        value = _build(events, *next(events))
+        if field in ITEM_FIELDS:
+            item[field] = value
+    return item
+
+
+def _parse_device(events) -> Dict:
+    device = {}
+    for event, key in events:
+        if event == 'end_map':
+            return device
+
+        event, value = next(events)
+        if key == 'Items' and event == 'start_array':
+            items = device['Items'] = []
+            for event, value in events:
+                if event == 'end_array':
+                    break
+                if event == 'start_map':
+                    items.append(_parse_item(events))
+                else:
+                    _build(events, event, value)
+        else:
+            device[key] = _build(events, event, value)
+    return device
+
+
+def parse_stream(source) -> Any:
+    """
+    Инкрементальный разбор тела GetTripItems из файлоподобного source.
+    Результат - как у json.loads, но в строках Items только ITEM_FIELDS.
+    """
+    events = ijson.basic_parse(source, use_float=True)
+    event, value = next(events)
+    if event != 'start_map':
+        return _build(events, event, value)
+
+    data = {}
+    for event, device_id in events:
+        if event == 'end_map':
+            break
+        event, value = next(events)
+        data[device_id] = _parse_device(events) if event == 'start_map' else _build(events, event, value)
+    return data
+
+
+class _ChunkSource:
+    """Файлоподобный источник parse_stream из фрагментов, получаемых в event loop"""
+
+    def __init__(self, max_chunks: int):
+        self.chunks = queue.Queue(max_chunks)
+        self.finished = threading.Event()
+        self._buffer = b''
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._buffer:
+            chunk = None if self._eof else self.chunks.get()
+            if chunk is None:
+                self._eof = True
+                return b''
+            self._buffer = chunk
+
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def put(self, chunk: Optional[bytes]) -> bool:
+        """Передать фрагмент разбору (None - конец тела); False - разбор уже завершен"""
+        while not self.finished.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def parse(self) -> Any:
+        try:
+            return parse_stream(self)
+        finally:
+            self.finished.set()
+
+
+async def aparse_stream(chunks: AsyncIterator[bytes]) -> Any:
+    """
+    Асинхронная версия parse_stream: фрагменты тела (например, httpx
+    Response.aiter_bytes()) разбираются в потоке по мере получения, в памяти
+    не больше STREAM_QUEUE_CHUNKS фрагментов
+    """
+    source = _ChunkSource(STREAM_QUEUE_CHUNKS)
+    parsing = asyncio.get_running_loop().run_in_executor(None, source.parse)
+
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            try:
+                source.chunks.put_nowait(chunk)
+            except queue.Full:
+                # Разбор отстает: ждем места в очереди, не блокируя event loop
+                if not await asyncio.to_thread(source.put, chunk):
+                    break
+    except BaseException:
+        await asyncio.to_thread(source.put, None)
+        await asyncio.wait([parsing])
+        raise
+
+    await asyncio.to_thread(source.put, None)
+    return await parsing
+
+
+class TripItemsMerger:
+    """Объединение ответов GetTripItems разных групп параметров (и периодов)"""
+
+    def __init__(self):
+        self.data = {}
+        self._param_index = {}  # device_id -> {param: позиция в Params}
+        self._row_index = {}  # device_id -> {(DT, Stage, n): строка}
+        self.stats = {
+            'responses': 0,
+            'rows_matched': 0,
+            'rows_added': 0,
+            'values': 0,
+            'seconds': 0.0
+        }
+
+    def add(self, response: Dict):
+        """Добавить ответ одной группы параметров"""
+        if not response or not isinstance(response, dict):
+            logger.warning("⚠️ Попытка объединить пустые или некорректные данные")
+            return
+
+        started = time.perf_counter()
+
+        for device_id, device_data in response.items():
+            if not device_data or not isinstance(device_data, dict):
+                logger.warning(f"⚠️ Пропускаем некорректные данные для ТС {device_id}")
+                continue
+
+            self._add_device(device_id, device_data)
+
+        self.stats['responses'] += 1
+        self.stats['seconds'] += time.perf_counter() - started
+
+    def _add_device(self, device_id: str, device_data: Dict):
+        if device_id not in self.data:
+            self.data[device_id] = {
+                'Name': device_data.get('Name', f'ТС {device_id[:8]}'),
+                'Params': [],
+                'Items': []
+            }
+            self._param_index[device_id] = {}
+            self._row_index[device_id] = {}
+
+        merged = self.data[device_id]
+        param_index = self._param_index[device_id]
+        row_index = self._row_index[device_id]
+
+        # Карта колонок: позиция в ответе группы -> позиция в объединенных Params
+        column_map = []
+        first_new = len(merged['Params'])
+        for param in device_data.get('Params', []) or []:
+            if param not in param_index:
+                param_index[param] = len(merged['Params'])
+                merged['Params'].append(param)
+            column_map.append(param_index[param])
+        width = max(column_map) + 1 if column_map else 0
+
+        # Обычный случай: группа целиком из новых параметров, идущих подряд -
+        # значения строки копируются одним срезом
+        block_start = column_map[0] if column_map else 0
+        as_block = bool(column_map) and block_start >= first_new and \
+            column_map == list(range(block_start, block_start + len(column_map)))
+
+        occurrences = {}
+        values_count = 0
+        for item in device_data.get('Items', []) or []:
+            if not item or not isinstance(item, dict):
+                continue
+
+            key = (item.get('DT', ''), item.get('Stage', 'Unknown'))
+            n = occurrences.get(key, 0)
+            occurrences[key] = n + 1
+            row_key = key + (n,)
+
+            row = row_index.get(row_key)
+            if row is None:
+                row = {
+                    'DT': item.get('DT', ''),
+                    'Stage': item.get('Stage', 'Unknown'),
+                    'Duration': item.get('Duration', ''),
+                    'Caption': item.get('Caption', ''),
+                    'Values': []
+                }
+                row_index[row_key] = row
+                merged['Items'].append(row)
+                self.stats['rows_added'] += 1
+            else:
+                self.stats['rows_matched'] += 1
+
+            row_values = row['Values']
+            if len(row_values) < width:
+                row_values.extend([None] * (width - len(row_values)))
+
+            values = item.get('Values', []) or []
+            count = min(len(column_map), len(values))
+            if as_block:
+                row_values[block_start:block_start + count] = values[:count]
+            else:
+                for position, value in zip(column_map, values):
+                    if value is not None or row_values[position] is None:
+                        row_values[position] = value
+            values_count += count
+
+        self.stats['values'] += values_count
+
+    def result(self) -> Optional[Dict]:
+        """Объединенные данные (Values каждой строки выровнены по Params) или None"""
+        if not self.data:
+            return None
+
+        for device_data in self.data.values():
+            width = len(device_data['Params'])
+            for row in device_data['Items']:
+                if len(row['Values']) < width:
+                    row['Values'].extend([None] * (width - len(row['Values'])))
+
+        logger.info(
+            f"🔗 Объединение GetTripItems: {self.stats['responses']} ответов, "
+            f"{self.stats['rows_added']} строк (+{self.stats['rows_matched']} совпадений), "
+            f"{self.stats['values']} значений за {self.stats['seconds'] * 1000:.1f} мс"
+        )
+        return self.data
+
+
+def merge_trip_items(responses: List[Optional[Dict]]) -> Tuple[Optional[Dict], Dict]:
+    """Объединить ответы по порядку (отрезок, группа); пустые ответы пропускаются. Возвращает (данные, stats)"""
+    merger = TripItemsMerger()
+
+    for i, response in enumerate(responses):
+        if not response:
+            logger.warning(f"❌ Запрос GetTripItems {i + 1} не вернул данных")
+            continue
+        merger.add(response)
+
+    return merger.result(), merger.stats
@@ -1,15 +1,20 @@
+import asyncio
 import json
 import logging
 from datetime import datetime, timedelta
 import requests
 import warnings
 
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from functools import wraps
+from urllib.parse import quote
 
+from api.fastjson import FastJsonResponse
+from . import aggregation, downsampling, exports, history_store, result_cache, rollups
 from .services import AutoGraphHistoricalService, AutoGraphDeviceService
 
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
@@ -33,9 +38,10 @@ class AdvancedDataFormatter:
 
         # Проверяем тип данных и форматируем соответствующим образом
         if historical_data.get('data_type') in ['time_series_extended', 'fallback_basic', 'empty']:
-            # Новый формат из get_extended_historical_data
+            # Новый формат из get_extended_historical_data: записи хранятся колонками
+            frame = historical_data.get('frame')
             return {
-                'time_series': historical_data.get('time_series', []),
+                'time_series': frame.to_records() if frame is not None else historical_data.get('time_series', []),
                 'summary': historical_data.get('summary', {}),
                 'parameters': historical_data.get('parameters', []),
                 'total_records': historical_data.get('total_records', 0),
@@ -150,19 +156,32 @@ class AdvancedDataFormatter:
 
 
 def autograph_token_required(view_func):
-    """Декоратор для проверки токена AutoGRAPH"""
+    """Декоратор для проверки токена AutoGRAPH (поддерживает async-представления)"""
+
+    def _no_auth_response(request):
+        logger.warning(f"🔒 No AutoGRAPH token for {request.path}")
+        return FastJsonResponse({
+            'success': False,
+            'error': 'Требуется авторизация в AutoGRAPH',
+            'code': 'NO_AUTH'
+        })
+
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            if not await request.session.aget('autograph_token'):
+                return _no_auth_response(request)
+
+            return await view_func(request, *args, **kwargs)
+
+        return _wrapped_async_view
 
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
         autograph_token = request.session.get('autograph_token')
 
         if not autograph_token:
-            logger.warning(f"🔒 No AutoGRAPH token for {request.path}")
-            return JsonResponse({
-                'success': False,
-                'error': 'Требуется авторизация в AutoGRAPH',
-                'code': 'NO_AUTH'
-            })
+            return _no_auth_response(request)
 
         return view_func(request, *args, **kwargs)
 
@@ -206,7 +225,7 @@ def api_get_vehicles(request):
         schema_id = request.session.get('autograph_schema_id')
 
         if not autograph_token or not schema_id:
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': False,
                 'error': 'Нет подключения к AutoGRAPH'
             })
@@ -227,7 +246,7 @@ def api_get_vehicles(request):
                 "driver": device.get('driver', '')
             })
 
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'data': {
                 'vehicles': vehicles or [],
@@ -237,7 +256,7 @@ def api_get_vehicles(request):
 
     except Exception as e:
         logger.error(f"Ошибка получения ТС: {e}", exc_info=True)
-        return JsonResponse({
+        return FastJsonResponse({
             'success': False,
             'error': str(e)
         })
@@ -254,36 +273,18 @@ def api_get_all_historical_data(request):
         vehicle_ids = data.get('vehicle_ids', [])
         start_date = data.get('start_date')
         end_date = data.get('end_date')
-        all_params = data.get('all_params', True)
-
-        logger.info(f"Запрос расширенных данных: vehicles={len(vehicle_ids)}, period={start_date} - {end_date}")
+        downsample = _downsample_options(data)
 
-        if not vehicle_ids:
-            logger.warning("Не выбраны ТС")
-            return JsonResponse({
-                'success': False,
-                'error': 'Не выбраны ТС',
-                'code': 'NO_VEHICLES'
-            })
-
-        if not start_date or not end_date:
-            logger.warning("Не указан период")
-            return JsonResponse({
-                'success': False,
-                'error': 'Не указан период',
-                'code': 'NO_PERIOD'
-            })
+        error_response = _validate_historical_request(vehicle_ids, start_date, end_date)
+        if error_response:
+            return error_response
 
         autograph_token = request.session.get('autograph_token')
         schema_id = request.session.get('autograph_schema_id')
 
         if not autograph_token or not schema_id:
             logger.warning("Нет подключения к AutoGRAPH")
-            return JsonResponse({
-                'success': False,
-                'error': 'Нет подключения к AutoGRAPH',
-                'code': 'NO_CONNECTION'
-            })
+            return _no_connection_response()
 
         # Получаем исторические данные через обновленный сервис
         historical_service = AutoGraphHistoricalService(
@@ -291,54 +292,199 @@ def api_get_all_historical_data(request):
             schema_id=schema_id
         )
 
-        historical_data = historical_service.get_extended_historical_data(
-            device_ids=vehicle_ids,
-            start_date=start_date,
-            end_date=end_date
-        )
+        formatted_data = _formatted_historical_data(historical_service, vehicle_ids, start_date, end_date)
 
-        if not historical_data:
-            logger.error("Исторические данные не получены или пустые")
-            return JsonResponse({
-                'success': True,
-                'data': {
-                    'historical_data': {
-                        'time_series': [],
-                        'summary': {
-                            'total_records': 0,
-                            'vehicle_count': 0,
-                            'time_range': {'start': start_date, 'end': end_date}
-                        },
-                        'parameters': [],
-                        'total_records': 0,
-                        'period': {'start': start_date, 'end': end_date},
-                        'data_type': 'empty'
-                    }
-                }
-            })
+        return _historical_data_response(formatted_data, vehicle_ids, start_date, end_date, downsample)
 
-        # Форматируем данные для фронтенда
-        formatted_data = AdvancedDataFormatter.format_for_timeseries(historical_data)
-
-        return JsonResponse({
-            'success': True,
-            'data': {
-                'historical_data': formatted_data,
-                'period': historical_data.get('period', {'start': start_date, 'end': end_date}),
-                'vehicle_count': len(vehicle_ids),
-                'total_records': formatted_data.get('total_records', 0)
-            }
+    except Exception as e:
+        logger.error(f"Ошибка получения расширенных данных: {e}", exc_info=True)
+        return FastJsonResponse({
+            'success': False,
+            'error': str(e),
+            'code': 'API_ERROR'
         })
 
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@autograph_token_required
+async def api_get_all_historical_data_async(request):
+    """API: Получение ВСЕХ исторических данных (асинхронная версия для ASGI)"""
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+
+        vehicle_ids = data.get('vehicle_ids', [])
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        downsample = _downsample_options(data)
+
+        error_response = _validate_historical_request(vehicle_ids, start_date, end_date)
+        if error_response:
+            return error_response
+
+        autograph_token = await request.session.aget('autograph_token')
+        schema_id = await request.session.aget('autograph_schema_id')
+
+        if not autograph_token or not schema_id:
+            logger.warning("Нет подключения к AutoGRAPH")
+            return _no_connection_response()
+
+        historical_service = AutoGraphHistoricalService(
+            token=autograph_token,
+            schema_id=schema_id
+        )
+
+        formatted_data = await _aformatted_historical_data(historical_service, vehicle_ids, start_date, end_date)
+
+        return await sync_to_async(_historical_data_response, thread_sensitive=False)(
+            formatted_data, vehicle_ids, start_date, end_date, downsample
+        )
+
     except Exception as e:
         logger.error(f"Ошибка получения расширенных данных: {e}", exc_info=True)
-        return JsonResponse({
+        return FastJsonResponse({
             'success': False,
             'error': str(e),
             'code': 'API_ERROR'
         })
 
 
+def _validate_historical_request(vehicle_ids, start_date, end_date):
+    """Проверка параметров запроса исторических данных"""
+    logger.info(f"Запрос расширенных данных: vehicles={len(vehicle_ids)}, period={start_date} - {end_date}")
+
+    if not vehicle_ids:
+        logger.warning("Не выбраны ТС")
+        return FastJsonResponse({
+            'success': False,
+            'error': 'Не выбраны ТС',
+            'code': 'NO_VEHICLES'
+        })
+
+    if not start_date or not end_date:
+        logger.warning("Не указан период")
+        return FastJsonResponse({
+            'success': False,
+            'error': 'Не указан период',
+            'code': 'NO_PERIOD'
+        })
+
+    return None
+
+
+def _no_connection_response():
+    return FastJsonResponse({
+        'success': False,
+        'error': 'Нет подключения к AutoGRAPH',
+        'code': 'NO_CONNECTION'
+    })
+
+
+def _formatted_historical_data(historical_service, vehicle_ids, start_date, end_date):
+    """Отформатированные временные ряды: из кэша результатов (DataCache) или из AutoGRAPH"""
+    formatted_data = result_cache.get(historical_service.schema_id, vehicle_ids, start_date, end_date)
+    if formatted_data is not None:
+        return formatted_data
+
+    historical_data = historical_service.get_extended_historical_data(
+        device_ids=vehicle_ids,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+    return _format_and_cache(historical_service, historical_data, vehicle_ids, start_date, end_date)
+
+
+async def _aformatted_historical_data(historical_service, vehicle_ids, start_date, end_date):
+    """Асинхронная версия _formatted_historical_data"""
+    formatted_data = await sync_to_async(result_cache.get)(
+        historical_service.schema_id, vehicle_ids, start_date, end_date
+    )
+    if formatted_data is not None:
+        return formatted_data
+
+    historical_data = await historical_service.aget_extended_historical_data(
+        device_ids=vehicle_ids,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+    return await sync_to_async(_format_and_cache)(
+        historical_service, historical_data, vehicle_ids, start_date, end_date
+    )
+
+
+def _format_and_cache(historical_service, historical_data, vehicle_ids, start_date, end_date):
+    """Форматирование для фронтенда; в кэш попадают только полные данные (без fallback и пропущенных отрезков)"""
+    if not historical_data:
+        return None
+
+    formatted_data = AdvancedDataFormatter.format_for_timeseries(historical_data)
+
+    if historical_data.get('data_type') == 'time_series_extended' and not historical_service.last_failed_chunks:
+        result_cache.store(historical_service.schema_id, vehicle_ids, start_date, end_date, formatted_data)
+
+    return formatted_data
+
+
+def _downsample_options(data):
+    """
+    Прореживание рядов для графиков: max_points - предел точек на ряд (ТС x параметр),
+    downsample - метод ('lttb' или 'minmax'). None - данные без прореживания
+    """
+    max_points = data.get('max_points')
+    if not max_points:
+        return None
+
+    options = {'max_points': int(max_points), 'method': data.get('downsample', 'lttb')}
+    if options['method'] not in downsampling.METHODS or options['max_points'] < downsampling.MIN_POINTS:
+        raise ValueError(f"Некорректные параметры прореживания: {options}")
+    return options
+
+
+def _historical_data_response(formatted_data, vehicle_ids, start_date, end_date, downsample=None):
+    """Ответ API с историческими данными"""
+    if not formatted_data:
+        logger.error("Исторические данные не получены или пустые")
+        return FastJsonResponse({
+            'success': True,
+            'data': {
+                'historical_data': {
+                    'time_series': [],
+                    'summary': {
+                        'total_records': 0,
+                        'vehicle_count': 0,
+                        'time_range': {'start': start_date, 'end': end_date}
+                    },
+                    'parameters': [],
+                    'total_records': 0,
+                    'period': {'start': start_date, 'end': end_date},
+                    'data_type': 'empty'
+                }
+            }
+        })
+
+    if downsample:
+        time_series = formatted_data.get('time_series') or []
+        formatted_data = {
+            **formatted_data,
+            'time_series': downsampling.downsample_records(
+                time_series, formatted_data.get('parameters') or [], **downsample
+            ),
+            'downsampled': {**downsample, 'source_records': len(time_series)}
+        }
+
+    return FastJsonResponse({
+        'success': True,
+        'data': {
+            'historical_data': formatted_data,
+            'period': formatted_data.get('period') or {'start': start_date, 'end': end_date},
+            'vehicle_count': len(vehicle_ids),
+            'total_records': formatted_data.get('total_records', 0)
+        }
+    })
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 @autograph_token_required
@@ -354,7 +500,7 @@ def api_get_parameters_list(request):
                 categories[category] = []
             categories[category].append(param)
 
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'data': {
                 'parameters': parameters,
@@ -365,7 +511,7 @@ def api_get_parameters_list(request):
 
     except Exception as e:
         logger.error(f"Ошибка получения списка параметров: {e}")
-        return JsonResponse({
+        return FastJsonResponse({
             'success': False,
             'error': str(e)
         })
@@ -383,12 +529,12 @@ def api_get_time_series_data(request):
         start_date = data.get('start_date')
         end_date = data.get('end_date')
         params = data.get('params', [])
-        resolution = data.get('resolution', 'minute')
+        options = _time_series_options(data)
 
-        logger.info(f"Запрос временных рядов: {len(params)} параметров, resolution={resolution}")
+        logger.info(f"Запрос временных рядов: {len(params)} параметров, {options}")
 
         if not vehicle_ids or not params:
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': False,
                 'error': 'Не указаны обязательные параметры'
             })
@@ -397,7 +543,7 @@ def api_get_time_series_data(request):
         schema_id = request.session.get('autograph_schema_id')
 
         if not autograph_token or not schema_id:
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': False,
                 'error': 'Нет подключения к AutoGRAPH'
             })
@@ -407,99 +553,185 @@ def api_get_time_series_data(request):
             schema_id=schema_id
         )
 
-        historical_data = historical_service.get_extended_historical_data(
-            device_ids=vehicle_ids,
-            start_date=start_date,
-            end_date=end_date
-        )
+        # Минутные, часовые и дневные ряды отдаются из агрегатов локальной истории
+        if _rollups_applicable(options) and historical_service.ensure_history(vehicle_ids, start_date, end_date):
+            return _rollup_time_series_response(schema_id, vehicle_ids, start_date, end_date, params, options)
 
-        if not historical_data:
-            return JsonResponse({
-                'success': True,
-                'data': {
-                    'time_series': [],
-                    'parameters': params,
-                    'resolution': resolution
-                }
+        formatted_data = _formatted_historical_data(historical_service, vehicle_ids, start_date, end_date)
+
+        return _time_series_response(formatted_data, params, options)
+
+    except Exception as e:
+        logger.error(f"Ошибка получения данных временных рядов: {e}")
+        return FastJsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@autograph_token_required
+async def api_get_time_series_data_async(request):
+    """API: Получение данных временных рядов (асинхронная версия для ASGI)"""
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+
+        vehicle_ids = data.get('vehicle_ids', [])
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        params = data.get('params', [])
+        options = _time_series_options(data)
+
+        logger.info(f"Запрос временных рядов: {len(params)} параметров, {options}")
+
+        if not vehicle_ids or not params:
+            return FastJsonResponse({
+                'success': False,
+                'error': 'Не указаны обязательные параметры'
             })
 
-        formatted_data = AdvancedDataFormatter.format_for_timeseries(historical_data)
+        autograph_token = await request.session.aget('autograph_token')
+        schema_id = await request.session.aget('autograph_schema_id')
+
+        if not autograph_token or not schema_id:
+            return FastJsonResponse({
+                'success': False,
+                'error': 'Нет подключения к AutoGRAPH'
+            })
 
-        aggregated_data = aggregate_time_series(formatted_data['time_series'], params, resolution)
+        historical_service = AutoGraphHistoricalService(
+            token=autograph_token,
+            schema_id=schema_id
+        )
 
-        return JsonResponse({
-            'success': True,
-            'data': {
-                'time_series': aggregated_data,
-                'parameters': params,
-                'resolution': resolution,
-                'summary': formatted_data['summary']
-            }
-        })
+        if _rollups_applicable(options) and \
+                await historical_service.aensure_history(vehicle_ids, start_date, end_date):
+            return await sync_to_async(_rollup_time_series_response)(
+                schema_id, vehicle_ids, start_date, end_date, params, options
+            )
+
+        formatted_data = await _aformatted_historical_data(historical_service, vehicle_ids, start_date, end_date)
+
+        return await sync_to_async(_time_series_response, thread_sensitive=False)(
+            formatted_data, params, options
+        )
 
     except Exception as e:
         logger.error(f"Ошибка получения данных временных рядов: {e}")
-        return JsonResponse({
+        return FastJsonResponse({
             'success': False,
             'error': str(e)
         })
 
 
-def aggregate_time_series(time_series, params, resolution):
-    """Агрегация временных рядов по разрешению"""
-    if not time_series:
-        return []
+def _time_series_options(data):
+    """
+    Параметры агрегации запроса временных рядов: resolution (minute/hour/day),
+    aggregation (mean/min/max/sum/last/count), bucket - ширина интервала ('5min', '15min', '8h'),
+    bucket_offset - сдвиг начала интервала ('8h' - смены с 08:00), group_by_vehicle,
+    max_points/downsample - прореживание агрегированных рядов
+    """
+    options = {
+        'resolution': data.get('resolution', 'minute'),
+        'aggregation': data.get('aggregation', 'mean'),
+        'bucket': data.get('bucket') or None,
+        'bucket_offset': data.get('bucket_offset') or None,
+        'group_by_vehicle': bool(data.get('group_by_vehicle', True)),
+        'downsample': _downsample_options(data)
+    }
 
-    intervals = {}
+    if options['aggregation'] not in aggregation.AGGREGATIONS:
+        raise ValueError(f"Неизвестная функция агрегации: {options['aggregation']}")
 
-    for point in time_series:
-        timestamp = point.get('timestamp')
-        if not timestamp:
-            continue
+    # Ширина и сдвиг проверяются сразу, до запроса данных
+    aggregation.bucket_spec(options['resolution'], options['bucket'], options['bucket_offset'])
+    return options
 
-        try:
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-        except:
-            continue
 
-        if resolution == 'hour':
-            interval_key = dt.strftime('%Y-%m-%d %H:00:00')
-        elif resolution == 'day':
-            interval_key = dt.strftime('%Y-%m-%d')
-        else:
-            interval_key = dt.strftime('%Y-%m-%d %H:%M:00')
+def _rollups_applicable(options):
+    """Стандартные интервалы без сдвига можно отдать из агрегатов TrackRollup"""
+    return (
+        options['resolution'] in aggregation.KEY_FORMATS
+        and options['bucket'] is None and options['bucket_offset'] is None
+        and rollups.supports(options['aggregation'], options['group_by_vehicle'])
+    )
+
 
-        if interval_key not in intervals:
-            intervals[interval_key] = {
-                'timestamp': interval_key,
-                'values': {param: [] for param in params},
-                'count': 0
+def _time_series_response(formatted_data, params, options):
+    """Ответ API с агрегированными временными рядами"""
+    if not formatted_data:
+        return FastJsonResponse({
+            'success': True,
+            'data': {
+                'time_series': [],
+                'parameters': params,
+                **options
             }
+        })
 
-        values = point.get('values', {})
-        for param in params:
-            if param in values:
-                intervals[interval_key]['values'][param].append(values[param])
+    width, offset, key_format = aggregation.bucket_spec(
+        options['resolution'], options['bucket'], options['bucket_offset']
+    )
+    aggregated_data = aggregation.aggregate(
+        aggregation.records_frame(formatted_data['time_series'], params),
+        params,
+        how=options['aggregation'],
+        width=width,
+        offset=offset,
+        key_format=key_format,
+        by_vehicle=options['group_by_vehicle']
+    )
+
+    return FastJsonResponse({
+        'success': True,
+        'data': {
+            'time_series': _downsample_series(aggregated_data, params, options),
+            'parameters': params,
+            **options,
+            'summary': formatted_data['summary']
+        }
+    })
 
-        intervals[interval_key]['count'] += 1
 
-    result = []
-    for interval_key, data in intervals.items():
-        aggregated_point = {
-            'timestamp': data['timestamp'],
-            'values': {}
-        }
+def _downsample_series(points, params, options):
+    if not options['downsample']:
+        return points
+    return downsampling.downsample_records(points, params, **options['downsample'])
 
-        for param, values_list in data['values'].items():
-            if values_list:
-                avg_value = sum(values_list) / len(values_list)
-                aggregated_point['values'][param] = round(avg_value, 4)
 
-        result.append(aggregated_point)
+def _rollup_time_series_response(schema_id, vehicle_ids, start_date, end_date, params, options):
+    """Ответ API с временными рядами из агрегатов TrackRollup (без перебора сырого ряда)"""
+    start, end = history_store.parse_date(start_date), history_store.parse_date(end_date)
 
-    result.sort(key=lambda x: x['timestamp'])
+    return FastJsonResponse({
+        'success': True,
+        'data': {
+            'time_series': _downsample_series(rollups.series(
+                schema_id, vehicle_ids, start, end, params, options['resolution'],
+                aggregation=options['aggregation'], by_vehicle=options['group_by_vehicle']
+            ), params, options),
+            'parameters': params,
+            **options,
+            'summary': rollups.summary(schema_id, vehicle_ids, start, end, params)
+        }
+    })
 
-    return result
+
+def aggregate_time_series(time_series, params, resolution):
+    """Агрегация временных рядов по разрешению (среднее по всем ТС вместе)"""
+    if not time_series:
+        return []
+
+    width, offset, key_format = aggregation.bucket_spec(resolution)
+    return aggregation.aggregate(
+        aggregation.records_frame(time_series, params),
+        params,
+        width=width,
+        offset=offset,
+        key_format=key_format,
+        by_vehicle=False
+    )
 
 
 @csrf_exempt
@@ -517,7 +749,7 @@ def api_export_time_series(request):
         params = data.get('params', [])
 
         if not vehicle_ids or not start_date or not end_date:
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': False,
                 'error': 'Не указаны обязательные параметры'
             })
@@ -526,7 +758,7 @@ def api_export_time_series(request):
         schema_id = request.session.get('autograph_schema_id')
 
         if not autograph_token or not schema_id:
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': False,
                 'error': 'Нет подключения к AutoGRAPH'
             })
@@ -536,80 +768,68 @@ def api_export_time_series(request):
             schema_id=schema_id
         )
 
-        historical_data = historical_service.get_extended_historical_data(
-            device_ids=vehicle_ids,
-            start_date=start_date,
-            end_date=end_date
-        )
+        if export_format in exports.STREAM_FORMATS or export_format == 'xlsx':
+            rows = _export_rows(historical_service, vehicle_ids, start_date, end_date)
+            if rows is None:
+                return FastJsonResponse({
+                    'success': False,
+                    'error': 'Нет данных для экспорта'
+                })
 
-        if not historical_data:
-            return JsonResponse({
-                'success': False,
-                'error': 'Нет данных для экспорта'
-            })
+            params = params or historical_service.ALL_PARAMETERS
+            filename = f"временные-ряды-{start_date}_{end_date}"
 
-        formatted_data = AdvancedDataFormatter.format_for_timeseries(historical_data)
+            if export_format == 'xlsx':
+                response = FileResponse(exports.xlsx_file(rows, params), content_type=exports.XLSX_CONTENT_TYPE)
+                response['Content-Disposition'] = _attachment(f"{filename}.xlsx")
+                return response
 
-        if export_format == 'csv':
-            csv_data = generate_time_series_csv(formatted_data['time_series'], params)
-            filename = f"временные-ряды-{start_date}_{end_date}.csv"
+            content_type, extension, stream = exports.STREAM_FORMATS[export_format]
+            response = StreamingHttpResponse(stream(rows, params), content_type=content_type)
+            response['Content-Disposition'] = _attachment(f"{filename}.{extension}")
+            return response
 
-            return JsonResponse({
-                'success': True,
-                'data': {
-                    'filename': filename,
-                    'content': csv_data,
-                    'format': 'csv',
-                    'size': len(csv_data)
-                }
-            })
-        else:
-            return JsonResponse({
-                'success': True,
-                'data': {
-                    'time_series': formatted_data['time_series'],
-                    'summary': formatted_data['summary'],
-                    'format': 'json'
-                }
+        formatted_data = _formatted_historical_data(historical_service, vehicle_ids, start_date, end_date)
+
+        if not formatted_data:
+            return FastJsonResponse({
+                'success': False,
+                'error': 'Нет данных для экспорта'
             })
 
+        return FastJsonResponse({
+            'success': True,
+            'data': {
+                'time_series': formatted_data['time_series'],
+                'summary': formatted_data['summary'],
+                'format': 'json'
+            }
+        })
+
     except Exception as e:
         logger.error(f"Ошибка экспорта временных рядов: {e}")
-        return JsonResponse({
+        return FastJsonResponse({
             'success': False,
             'error': str(e)
         })
 
 
-def generate_time_series_csv(time_series, params):
-    """Генерация CSV из данных временных рядов"""
-    if not time_series:
-        return "Нет данных"
-
-    headers = ['Время', 'ТС', 'Тип']
-    headers.extend(params)
-
-    rows = []
-    for point in time_series:
-        row = [
-            point.get('timestamp', ''),
-            point.get('vehicle', point.get('vehicle_name', '')),
-            point.get('type', point.get('stage', ''))
-        ]
-
-        values = point.get('values', {})
-        for param in params:
-            value = values.get(param, '')
-            if isinstance(value, (int, float)):
-                value = f"{value:.4f}"
-            row.append(str(value))
+def _export_rows(historical_service, vehicle_ids, start_date, end_date):
+    """Строки экспорта: курсор по локальной истории, если в ней весь период, иначе записи API; None - нет данных"""
+    if historical_service.ensure_history(vehicle_ids, start_date, end_date):
+        return exports.stored_rows(
+            historical_service.schema_id, vehicle_ids, history_store.parse_date(start_date), history_store.parse_date(end_date)
+        )
 
-        rows.append(row)
+    formatted_data = _formatted_historical_data(historical_service, vehicle_ids, start_date, end_date)
+    if not formatted_data:
+        return None
+    return exports.record_rows(formatted_data['time_series'])
 
-    csv_lines = [','.join(headers)]
-    csv_lines.extend([','.join(row) for row in rows])
 
-    return '\n'.join(csv_lines)
+def _attachment(filename):
+    """Content-Disposition для файла с кириллицей в имени (RFC 5987)"""
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
 
 
 @csrf_exempt
@@ -624,17 +844,18 @@ def api_get_system_status(request):
             'autograph_connected': bool(autograph_token and schema_id),
             'schema_name': request.session.get('autograph_schema_name'),
             'username': request.session.get('autograph_username'),
+            'result_cache': result_cache.stats(),
             'timestamp': datetime.now().isoformat()
         }
 
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'data': status
         })
 
     except Exception as e:
         logger.error(f"Ошибка проверки статуса: {e}")
-        return JsonResponse({
+        return FastJsonResponse({
             'success': False,
             'error': str(e)
         })
\ No newline at end of file